@@ -0,0 +1,79 @@
+"""Compare per-user BalanceService.snapshot calls with snapshot_many.
+
+Usage: python benchmarks/bench_balances.py [--users 10000] [--entries 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from smart_cpa_bot.models import Base, BalanceLedger, LedgerEntryType, User
+from smart_cpa_bot.services.balances import BalanceService
+
+
+async def seed(session_factory: async_sessionmaker, users: int, entries: int) -> list[int]:
+    rng = random.Random(7)
+    async with session_factory() as session:
+        await session.execute(
+            insert(User),
+            [
+                {"id": index, "telegram_id": index, "display_name": f"u{index}", "referral_code": f"ref{index}"}
+                for index in range(1, users + 1)
+            ],
+        )
+        await session.execute(
+            insert(BalanceLedger),
+            [
+                {
+                    "user_id": user_id,
+                    "type": rng.choice([LedgerEntryType.CREDIT, LedgerEntryType.ADJUST]),
+                    "amount": rng.randint(10, 500),
+                }
+                for user_id in range(1, users + 1)
+                for _ in range(entries)
+            ],
+        )
+        await BalanceService(session).rebuild_projection()
+        await session.commit()
+    return list(range(1, users + 1))
+
+
+async def main(users: int, entries: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        user_ids = await seed(session_factory, users, entries)
+
+        async with session_factory() as session:
+            service = BalanceService(session)
+            started = time.perf_counter()
+            looped = {user_id: await service.snapshot(user_id) for user_id in user_ids}
+            loop_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            bulk = await service.snapshot_many(user_ids)
+            bulk_elapsed = time.perf_counter() - started
+
+        assert looped == bulk
+        print(f"users={users} ledger_entries={users * entries}")
+        print(f"snapshot loop : {loop_elapsed * 1000:9.1f} ms")
+        print(f"snapshot_many : {bulk_elapsed * 1000:9.1f} ms ({loop_elapsed / bulk_elapsed:.1f}x)")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--entries", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.entries))
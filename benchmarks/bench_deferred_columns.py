@@ -0,0 +1,92 @@
+"""Rows/second of ORM selects over offers and conversions with the heavy JSON
+columns loaded eagerly (the old mapping) and deferred (the default now).
+
+Usage: python benchmarks/bench_deferred_columns.py [--rows 50000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import undefer, undefer_group
+
+from smart_cpa_bot.models import Base, Conversion, Offer, OfferStatus
+
+
+def offer_rows(count: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "external_uuid": f"offer-{index}",
+            "title": f"Offer {index}",
+            "payout_brutto": rng.randint(50, 3000),
+            "status": OfferStatus.ACTIVE,
+            "features": {"deeplink": 1, "postclick": 30},
+            "schedule": {"days": list(range(7)), "from": "09:00", "to": "21:00"},
+            "metadata_json": {
+                "uuid": f"offer-{index}",
+                "goals": [{"id": goal, "price": rng.randint(10, 500)} for goal in range(4)],
+                "landings": [{"uuid": f"l-{index}-{n}", "url": f"https://example.com/{index}/{n}"} for n in range(3)],
+                "offerDescription": "x" * 1500,
+            },
+        }
+        for index in range(count)
+    ]
+
+
+def conversion_rows(count: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "user_id": rng.randint(1, 1000),
+            "offer_id": rng.randint(1, 1000),
+            "click_id": index + 1,
+            "external_id": f"conv-{index}",
+            "amount_netto": rng.randint(50, 500),
+            "raw_payload": {"click_id": f"sc-{index}", "status": "approved", "sub": "y" * 600},
+        }
+        for index in range(count)
+    ]
+
+
+async def rows_per_second(session_factory, stmt) -> float:
+    async with session_factory() as session:
+        started = time.perf_counter()
+        rows = len((await session.execute(stmt)).scalars().all())
+        return rows / (time.perf_counter() - started)
+
+
+async def main(rows: int) -> None:
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as session:
+            await session.execute(insert(Offer), offer_rows(rows, rng))
+            await session.execute(insert(Conversion), conversion_rows(rows, rng))
+            await session.commit()
+
+        cases = [
+            ("offers", select(Offer).options(undefer_group("payload")), select(Offer)),
+            ("conversions", select(Conversion).options(undefer(Conversion.raw_payload)), select(Conversion)),
+        ]
+        print(f"rows={rows}")
+        for name, eager, deferred in cases:
+            before = await rows_per_second(session_factory, eager)
+            after = await rows_per_second(session_factory, deferred)
+            print(f"{name:<12} eager {before:10.0f} rows/s   deferred {after:10.0f} rows/s   ({after / before:.1f}x)")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows))
@@ -0,0 +1,125 @@
+"""Compare full-catalog filtering with the eligibility index in get_personalized_offers,
+and pure-Python against NumPy top-K scoring over the index.
+
+Usage: python benchmarks/bench_offer_index.py [--offers 20000] [--users 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import undefer_group
+
+from smart_cpa_bot.models import Base, Offer, OfferLanding, OfferStatus, User
+from smart_cpa_bot.services.catalog import CatalogCache, bump_catalog_version
+from smart_cpa_bot.services.offers import OfferService
+
+CITIES = [f"Город {index}" for index in range(200)]
+
+
+def offer_rows(count: int, rng: random.Random) -> list[dict]:
+    rows = []
+    for index in range(1, count + 1):
+        restricted = rng.random() < 0.6
+        goals = [{"id": goal, "price": rng.randint(10, 500)} for goal in range(rng.randint(1, 4))]
+        rows.append(
+            {
+                "id": index,
+                "external_uuid": f"offer-{index}",
+                "title": f"Offer {index}",
+                "min_age": rng.choice([18, 18, 21, 25]),
+                "max_age": rng.choice([None, None, 35, 45, 60]),
+                "geo_text": rng.choice(CITIES) if restricted else "Вся Россия",
+                "city_whitelist": rng.sample(CITIES, rng.randint(1, 5)) if restricted else None,
+                "payout_brutto": rng.randint(50, 3000),
+                "expected_score": rng.randint(50, 3000),
+                "status": OfferStatus.ACTIVE,
+                "features": {"deeplink": 1},
+                "metadata_json": {"goals": goals, "offerDescription": "x" * 400},
+            }
+        )
+    return rows
+
+
+async def legacy_recommend(service: OfferService, user: User, limit: int = 3) -> list[int]:
+    """The pre-index implementation: load every active offer and filter in Python."""
+
+    stmt = select(Offer).options(undefer_group("payload")).where(Offer.status == OfferStatus.ACTIVE)
+    offers = list((await service.session.execute(stmt)).scalars())
+    scored = [
+        (service._score_offer(offer, user), offer)
+        for offer in offers
+        if service._is_offer_allowed(offer, user)
+    ]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [offer.id for _, offer in scored[:limit]]
+
+
+async def main(offers: int, users: int) -> None:
+    rng = random.Random(11)
+    profiles = [User(age=rng.randint(16, 70), city=rng.choice(CITIES + [None])) for _ in range(users)]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as session:
+            await session.execute(insert(Offer), offer_rows(offers, rng))
+            await session.execute(
+                insert(OfferLanding),
+                [{"offer_id": index, "url": f"https://example.com/{index}"} for index in range(1, offers + 1)],
+            )
+            await bump_catalog_version(session)
+            await session.commit()
+
+        legacy_users = profiles[: max(1, users // 20)]
+        async with session_factory() as session:
+            service = OfferService(session, catalog=CatalogCache())
+            started = time.perf_counter()
+            legacy = [await legacy_recommend(service, user) for user in legacy_users]
+            legacy_per_user = (time.perf_counter() - started) / len(legacy_users)
+
+        async with session_factory() as session:
+            service = OfferService(session, catalog=CatalogCache())
+            started = time.perf_counter()
+            await service.catalog.eligibility_index(session)
+            build = time.perf_counter() - started
+            started = time.perf_counter()
+            indexed = [
+                [item.id for item in await service.get_personalized_offers(user)]
+                for user in profiles
+            ]
+            indexed_per_user = (time.perf_counter() - started) / len(profiles)
+            index = await service.catalog.eligibility_index(session)
+            candidates = sum(len(index.candidates(user.age, user.city)) for user in profiles) / len(profiles)
+            scoring = {}
+            for vectorized in (False, True):
+                started = time.perf_counter()
+                for user in profiles:
+                    index.recommend(user.age, user.city, 3, vectorized=vectorized)
+                scoring[vectorized] = (time.perf_counter() - started) / len(profiles)
+
+        assert indexed[: len(legacy)] == legacy
+        print(f"offers={offers} users={users} (legacy path sampled on {len(legacy_users)} users)")
+        print(f"index build          : {build * 1000:9.1f} ms")
+        print(f"avg candidates/user  : {candidates:9.0f}")
+        print(f"legacy per request   : {legacy_per_user * 1000:9.2f} ms")
+        print(f"indexed per request  : {indexed_per_user * 1000:9.2f} ms ({legacy_per_user / indexed_per_user:.1f}x)")
+        print(f"top-k python         : {scoring[False] * 1000:9.3f} ms")
+        print(f"top-k numpy          : {scoring[True] * 1000:9.3f} ms")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--offers", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.offers, args.users))
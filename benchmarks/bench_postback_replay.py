@@ -0,0 +1,74 @@
+"""Cost of a replayed Saleads postback: first application, a replay answered by
+the ``postback_receipts`` table and a replay answered by the in-memory front.
+
+Usage: python benchmarks/bench_postback_replay.py [--postbacks 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from smart_cpa_bot.models import BalanceLedger, Base, Click, Offer, User
+from smart_cpa_bot.services.conversions import ConversionService, receipt_cache
+
+
+def postbacks(count: int) -> list[dict]:
+    return [
+        {"click_id": f"sc-{index % 500}", "conversion_id": f"c-{index}", "amount": "100", "status": "approved"}
+        for index in range(count)
+    ]
+
+
+async def apply(session_factory, payloads: list[dict]) -> float:
+    started = time.perf_counter()
+    async with session_factory() as session:
+        service = ConversionService(session)
+        for payload in payloads:
+            await service.upsert(payload)
+        await session.commit()
+    return (time.perf_counter() - started) / len(payloads)
+
+
+async def main(count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as session:
+            await session.execute(insert(User), [{"telegram_id": 1, "referral_code": "bench"}])
+            await session.execute(insert(Offer), [{"external_uuid": "offer-1", "title": "Offer"}])
+            await session.execute(
+                insert(Click),
+                [{"user_id": 1, "offer_id": 1, "token": f"tok-{index}", "saleads_click_id": f"sc-{index}"} for index in range(500)],
+            )
+            await session.commit()
+
+        payloads = postbacks(count)
+        first = await apply(session_factory, payloads)
+        receipt_cache.clear()
+        table = await apply(session_factory, payloads)
+        memory = await apply(session_factory, payloads)
+        async with session_factory() as session:
+            entries = (await session.execute(select(func.count(BalanceLedger.id)))).scalar_one()
+        await engine.dispose()
+
+    assert entries == count
+    print(f"postbacks={count} ledger entries={entries}")
+    print(f"first application    : {first * 1e6:9.1f} us")
+    print(f"replay, receipt table: {table * 1e6:9.1f} us")
+    print(f"replay, memory front : {memory * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--postbacks", type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.postbacks))
@@ -0,0 +1,81 @@
+"""Requests/second of GET /r/{token} for legacy (database) and signed tokens.
+
+Usage: python benchmarks/bench_redirect.py [--clicks 20000] [--requests 3000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+SECRET = "bench-secret"
+
+
+async def measure(client, paths: list[str]) -> float:
+    started = time.perf_counter()
+    for path in paths:
+        response = await client.get(path)
+        assert response.status_code == 307, response.status_code
+    return len(paths) / (time.perf_counter() - started)
+
+
+async def main(clicks: int, requests: int) -> None:
+    import httpx
+    from sqlalchemy import insert
+
+    from smart_cpa_bot.api.server import app
+    from smart_cpa_bot.db import SessionFactory, _engine
+    from smart_cpa_bot.models import Base, Click, Offer
+    from smart_cpa_bot.services.tokens import sign_click_token
+
+    async with _engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionFactory() as session:
+        await session.execute(insert(Offer), [{"external_uuid": "offer-1", "title": "Offer"}])
+        await session.execute(
+            insert(Click),
+            [
+                {
+                    "user_id": 1,
+                    "offer_id": 1,
+                    "token": f"legacy{index:016d}",
+                    "saleads_click_id": f"sc-{index}",
+                    "target_url": f"https://partner.example/{index}",
+                }
+                for index in range(1, clicks + 1)
+            ],
+        )
+        await session.commit()
+
+    rng = random.Random(1)
+    picks = [rng.randint(1, clicks) for _ in range(requests)]
+    legacy = [f"/r/legacy{index:016d}" for index in picks]
+    signed = [f"/r/{sign_click_token(index, f'https://partner.example/{index}', SECRET)}" for index in picks]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await measure(client, legacy[:100] + signed[:100])  # warm-up
+        legacy_rps = await measure(client, legacy)
+        signed_rps = await measure(client, signed)
+    await _engine.dispose()
+
+    print(f"clicks={clicks} requests={requests}")
+    print(f"legacy token (DB read) : {legacy_rps:8.0f} req/s")
+    print(f"signed token (memory)  : {signed_rps:8.0f} req/s ({signed_rps / legacy_rps:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clicks", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=3_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings are read at import time, so configure them before importing the app.
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ["CLICK_TOKEN_SECRET"] = SECRET
+        asyncio.run(main(args.clicks, args.requests))
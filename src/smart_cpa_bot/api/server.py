@@ -2,28 +2,58 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 from typing import Any
 
-from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import RedirectResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
-from ..db import _engine, get_session
-from ..models import Base, PayoutStatus
-from ..services.clicks import ClickService
-from ..services.conversions import ConversionService
-from ..services.leaderboard import LeaderboardService
+from ..db import SessionFactory, _engine, create_schema, get_session
+from ..models import PayoutStatus
+from ..services.clicks import ClickService, click_refs
+from ..services.conversions import ConversionService, parse_postback, receipt_cache
+from ..services.hits import HitRecorder
+from ..services.leaderboard import LeaderboardRefresher, LeaderboardWindow, RankIndex
 from ..services.payouts import PayoutService
+from ..services.postbacks import PostbackWorker, enqueue_postback
+from ..services.tokens import click_token_secret, is_signed_token, read_click_token
 
 app = FastAPI(title="Smart CPA Bot API")
+leaderboard_refresher = LeaderboardRefresher(SessionFactory)
+rank_index = RankIndex()
+hit_recorder = HitRecorder(SessionFactory)
+postback_worker = PostbackWorker(SessionFactory)
+_background_tasks: list[asyncio.Task] = []
 
 
 @app.on_event("startup")
 async def startup() -> None:
     async with _engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_schema)
+    await leaderboard_refresher.refresh()
+    async with SessionFactory() as session:
+        await rank_index.sync(session)
+    _background_tasks.append(asyncio.create_task(leaderboard_refresher.run_forever()))
+    _background_tasks.append(asyncio.create_task(hit_recorder.run_forever()))
+    if settings.postback_queue:
+        _background_tasks.append(asyncio.create_task(postback_worker.run_forever()))
+    _background_tasks.append(
+        asyncio.create_task(
+            rank_index.run_forever(SessionFactory, interval=settings.leaderboard_rank_sync_seconds)
+        )
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await hit_recorder.flush()
 
 
 @app.get("/health")
@@ -31,22 +61,71 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {item.strip().removeprefix("W/") for item in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
 @app.get("/leaderboard")
-async def leaderboard(session: AsyncSession = Depends(get_session)) -> Any:
-    service = LeaderboardService(session)
-    snapshot = await service.latest()
-    if not snapshot:
-        snapshot = await service.generate()
-    return snapshot.payload
+async def leaderboard(
+    request: Request,
+    window: LeaderboardWindow = LeaderboardWindow.ALL,
+    offset: int | None = Query(default=None, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=500),
+) -> Any:
+    if offset is not None or limit is not None:
+        if window != LeaderboardWindow.ALL:
+            raise HTTPException(status_code=400, detail="Pagination is only available for window=all")
+        entries = rank_index.page(offset or 0, limit or settings.leaderboard_size)
+        return {"total": len(rank_index), "items": [entry.as_dict() for entry in entries]}
+    encoded = await leaderboard_refresher.get(window)
+    headers = {"ETag": encoded.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), encoded.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=encoded.body, media_type="application/json", headers=headers)
+
+
+@app.get("/leaderboard/rank/{user_id}")
+async def leaderboard_rank(user_id: int) -> dict[str, Any]:
+    entry = rank_index.rank(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="User not ranked")
+    return entry.as_dict() | {"total": len(rank_index)}
+
+
+@app.get("/metrics")
+async def metrics() -> dict[str, Any]:
+    return {
+        "click_hits": hit_recorder.stats(),
+        "postbacks": postback_worker.stats(),
+        "postback_receipts": receipt_cache.stats(),
+        "click_refs": click_refs.stats(),
+    }
 
 
 @app.get("/r/{token}")
-async def redirect_click(token: str, session: AsyncSession = Depends(get_session)):
-    service = ClickService(session)
-    click = await service.resolve_click(token)
-    if not click or not click.target_url:
-        raise HTTPException(status_code=404, detail="Click not found")
-    return RedirectResponse(click.target_url)
+async def redirect_click(token: str, request: Request):
+    if is_signed_token(token):
+        # Signed links carry their target: no database round trip.
+        secret = click_token_secret()
+        signed = read_click_token(token, secret) if secret else None
+        if signed is None:
+            raise HTTPException(status_code=404, detail="Click not found")
+        click_id, target_url = signed.click_id, signed.target_url
+    else:
+        async with SessionFactory() as session:
+            target = await ClickService(session, session_factory=SessionFactory).resolve_target(token)
+        if not target or not target.url:
+            raise HTTPException(status_code=404, detail="Click not found")
+        click_id, target_url = target.click_id, target.url
+    hit_recorder.record(
+        click_id,
+        ip=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+    )
+    return RedirectResponse(target_url)
 
 
 async def _extract_payload(request: Request) -> dict[str, Any]:
@@ -68,11 +147,24 @@ async def saleads_postback(
     if secret != settings.webhook_secret:
         raise HTTPException(status_code=403, detail="Invalid secret")
     payload = await _extract_payload(request)
+    if settings.postback_queue:
+        try:
+            postback = parse_postback(payload)
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if not postback.click_uuid:
+            raise HTTPException(status_code=400, detail="Missing click_id")
+        item = await enqueue_postback(session, payload)
+        await session.commit()
+        return JSONResponse(status_code=202, content={"status": "queued", "inbox_id": item.id})
     service = ConversionService(session)
     try:
         conversion = await service.upsert(payload)
-    except ValueError as exc:
+    except (TypeError, ValueError) as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if conversion is None:
+        return {"status": "duplicate"}
+    await session.commit()
     return {"status": "ok", "conversion_id": conversion.id}
 
 
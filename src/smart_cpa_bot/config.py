@@ -32,6 +32,18 @@ class SaleadsConfig(BaseModel):
     base_url: str = Field(default="https://saleads.pro/api/v1")
     token: SecretStr = Field(default=SecretStr("stub-saleads-token"))
     default_stand_uuid: str | None = None
+    page_size: int = Field(default=1000, le=1000)
+    page_concurrency: int = Field(default=4, ge=1)
+    click_concurrency: int = Field(default=4, ge=1)
+    click_timeout: float = Field(default=2.0)
+    # Failed background registrations are retried after 1x, 2x, ... this delay.
+    click_retries: int = Field(default=2, ge=0)
+    click_retry_seconds: float = Field(default=5.0)
+    # Eager mode: /r/{token} registers clicks still unregistered this long after
+    # delivery (longer than the background registration and its retries take).
+    click_redirect_grace: float = Field(default=120.0)
+    # Register Saleads clicks on the first /r/{token} hit instead of at delivery.
+    lazy_click_registration: bool = False
 
 
 class Settings(BaseSettings):
@@ -54,7 +66,33 @@ class Settings(BaseSettings):
     payout_minimum: int = Field(default=700)
     payout_currency: str = Field(default="RUB")
     webhook_secret: str = Field(default="change-me")
+    # When set, registered clicks get HMAC-signed tracking links that /r/ can
+    # serve without a database read.
+    click_token_secret: SecretStr | None = None
+    # Saleads click id -> (click, user, offer) entries kept for postbacks.
+    click_ref_cache_size: int = Field(default=100_000)
+    hit_queue_size: int = Field(default=10_000)
+    hit_flush_events: int = Field(default=500)
+    hit_flush_ms: float = Field(default=200)
+    # Accept postbacks into the postback_inbox table and apply them in batches.
+    postback_queue: bool = False
+    postback_batch_size: int = Field(default=200)
+    postback_poll_seconds: float = Field(default=0.5)
+    # First retry delay for a postback whose click is unknown; doubles per attempt.
+    postback_retry_seconds: float = Field(default=2)
+    # Receipt keys of applied postbacks kept in memory to answer replays early.
+    postback_receipt_cache_size: int = Field(default=50_000)
+    # Conversion statuses are re-read from Saleads for clicks made this long
+    # before the previous reconciliation run.
+    conversion_reconcile_seconds: float = Field(default=900)
+    conversion_reconcile_lookback_days: int = Field(default=30)
+    conversion_reconcile_batch_size: int = Field(default=500)
     leaderboard_size: int = Field(default=50)
+    leaderboard_refresh_seconds: float = Field(default=300)
+    leaderboard_rank_sync_seconds: float = Field(default=5)
+    offer_sync_seconds: float = Field(default=600)
+    recommendation_cache_size: int = Field(default=4096)
+    recommendation_cache_ttl: float = Field(default=300)
 
 
 @lru_cache()
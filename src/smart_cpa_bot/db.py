@@ -4,9 +4,12 @@ from __future__ import annotations
 
 from typing import AsyncIterator, Callable, TypeAlias
 
+from sqlalchemy import Connection, column, inspect, table, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateColumn
 
 from .config import settings
+from .models import Base
 
 
 _engine = create_async_engine(settings.database_url, echo=False, pool_pre_ping=True)
@@ -14,6 +17,53 @@ SessionFactory = async_sessionmaker(_engine, expire_on_commit=False)
 SessionDependency: TypeAlias = Callable[[], AsyncIterator[AsyncSession]]
 
 
+# Columns added to tables that existing databases already have. ``create_all``
+# only creates missing tables, so ``create_schema`` adds these when absent.
+ADDED_COLUMNS: dict[str, tuple[str, ...]] = {
+    "offers": ("content_hash",),
+}
+
+
+def create_schema(connection: Connection) -> None:
+    """Create missing tables and add missing ``ADDED_COLUMNS``; safe to run on every start."""
+
+    _split_snapshot_windows(connection)
+    Base.metadata.create_all(connection)
+    inspector = inspect(connection)
+    for table_name, column_names in ADDED_COLUMNS.items():
+        existing = {info["name"] for info in inspector.get_columns(table_name)}
+        table = Base.metadata.tables[table_name]
+        for name in column_names:
+            if name in existing:
+                continue
+            ddl = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+
+
+def _split_snapshot_windows(connection: Connection) -> None:
+    # ``leaderboard_snapshots`` used to key windowed boards as "<window>:<date>"
+    # in a unique ``date`` column. The table is small, so it is rebuilt with the
+    # window in its own column rather than altered in place.
+    inspector = inspect(connection)
+    if not inspector.has_table("leaderboard_snapshots"):
+        return
+    if "window" in {info["name"] for info in inspector.get_columns("leaderboard_snapshots")}:
+        return
+    names = ("date", "payload", "created_at", "updated_at")
+    old = table("leaderboard_snapshots", *(column(name) for name in names))
+    rows = connection.execute(old.select().order_by(text("id"))).all()
+    connection.execute(text("DROP TABLE leaderboard_snapshots"))
+    Base.metadata.tables["leaderboard_snapshots"].create(connection)
+    if not rows:
+        return
+    new = table("leaderboard_snapshots", column("window"), *(column(name) for name in names))
+    values = []
+    for key, *rest in rows:
+        window, _, date = key.rpartition(":")
+        values.append(dict(zip(new.c.keys(), (window or "all", date, *rest))))
+    connection.execute(new.insert(), values)
+
+
 async def get_session() -> AsyncIterator[AsyncSession]:
     """FastAPI dependency helper."""
 
@@ -25,5 +75,7 @@ __all__ = [
     "_engine",
     "SessionFactory",
     "SessionDependency",
+    "ADDED_COLUMNS",
+    "create_schema",
     "get_session",
 ]
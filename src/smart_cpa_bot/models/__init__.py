@@ -1,16 +1,28 @@
 """SQLAlchemy models exports."""
 
 from .base import Base, TimestampMixin
-from .engagement import AdminAction, AuditLog, DialogTurn, Feedback, LeaderboardSnapshot
-from .finance import BalanceLedger, LedgerEntryType, PayoutMethod, PayoutRequest, PayoutStatus
+from .engagement import AdminAction, AuditLog, DialogTurn, Feedback, LeaderboardSnapshot, SyncState
+from .finance import (
+    BalanceCheckpoint,
+    BalanceLedger,
+    DailyScore,
+    LedgerEntryType,
+    PayoutMethod,
+    PayoutRequest,
+    PayoutStatus,
+    UserBalance,
+)
 from .offer import (
     Click,
+    ClickHit,
     ClickStatus,
     Conversion,
     ConversionStatus,
     Offer,
     OfferLanding,
     OfferStatus,
+    PostbackInbox,
+    PostbackReceipt,
     RecommendationSession,
 )
 from .user import Referral, ReferralStatus, User, UserStatus
@@ -26,12 +38,18 @@ __all__ = [
     "OfferLanding",
     "OfferStatus",
     "Click",
+    "ClickHit",
     "ClickStatus",
     "Conversion",
     "ConversionStatus",
+    "PostbackInbox",
+    "PostbackReceipt",
     "RecommendationSession",
     "BalanceLedger",
+    "BalanceCheckpoint",
+    "DailyScore",
     "LedgerEntryType",
+    "UserBalance",
     "PayoutRequest",
     "PayoutStatus",
     "PayoutMethod",
@@ -40,4 +58,5 @@ __all__ = [
     "AdminAction",
     "AuditLog",
     "DialogTurn",
+    "SyncState",
 ]
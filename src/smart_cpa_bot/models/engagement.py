@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey, Integer, String, Text
+from sqlalchemy import ForeignKey, Integer, String, Text, UniqueConstraint
 from sqlalchemy.dialects.sqlite import JSON
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -22,9 +22,12 @@ class Feedback(TimestampMixin, Base):
 
 class LeaderboardSnapshot(TimestampMixin, Base):
     __tablename__ = "leaderboard_snapshots"
+    __table_args__ = (UniqueConstraint("window", "date"),)
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    date: Mapped[str] = mapped_column(String(32), unique=True)
+    # ``LeaderboardWindow`` value of the board: all, day, week or month.
+    window: Mapped[str] = mapped_column(String(16), default="all", server_default="all")
+    date: Mapped[str] = mapped_column(String(32))
     payload: Mapped[list[dict] | None] = mapped_column(JSON)
 
 
@@ -52,6 +55,15 @@ class AuditLog(TimestampMixin, Base):
     after: Mapped[dict | None] = mapped_column(JSON)
 
 
+class SyncState(TimestampMixin, Base):
+    """Small key/value store for sync cursors and version counters."""
+
+    __tablename__ = "sync_state"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[str] = mapped_column(Text, default="")
+
+
 class DialogTurn(TimestampMixin, Base):
     __tablename__ = "dialog_turns"
 
@@ -68,4 +80,5 @@ __all__ = [
     "AdminAction",
     "AuditLog",
     "DialogTurn",
+    "SyncState",
 ]
@@ -2,10 +2,11 @@
 
 from __future__ import annotations
 
+from datetime import date
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import ForeignKey, Integer, Numeric, String, Text
+from sqlalchemy import Date, ForeignKey, Index, Integer, Numeric, String, Text
 from sqlalchemy.dialects.sqlite import JSON
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -33,6 +34,42 @@ class BalanceLedger(TimestampMixin, Base):
     notes: Mapped[Optional[str]] = mapped_column(Text)
 
 
+class UserBalance(TimestampMixin, Base):
+    """Per-user balance projection maintained alongside ``balances_ledger``."""
+
+    __tablename__ = "user_balances"
+    # Lets the leaderboard rank index tail recently changed balances.
+    __table_args__ = (Index("ix_user_balances_updated_at", "updated_at"),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    # Doubles as the leaderboard score, hence the index.
+    available: Mapped[int] = mapped_column(Integer, default=0, index=True)
+    pending: Mapped[int] = mapped_column(Integer, default=0)
+    locked: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class DailyScore(Base):
+    """Per-user leaderboard score earned on one (UTC) day."""
+
+    __tablename__ = "daily_scores"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    score: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class BalanceCheckpoint(TimestampMixin, Base):
+    """Closing balances of a user up to and including ``ledger_entry_id``."""
+
+    __tablename__ = "balance_checkpoints"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    ledger_entry_id: Mapped[int] = mapped_column(Integer, default=0)
+    available: Mapped[int] = mapped_column(Integer, default=0)
+    pending: Mapped[int] = mapped_column(Integer, default=0)
+    locked: Mapped[int] = mapped_column(Integer, default=0)
+
+
 class PayoutMethod(str, Enum):
     DIRECT = "direct"
     OZON = "ozon"
@@ -62,8 +99,11 @@ class PayoutRequest(TimestampMixin, Base):
 
 
 __all__ = [
+    "BalanceCheckpoint",
     "BalanceLedger",
+    "DailyScore",
     "LedgerEntryType",
+    "UserBalance",
     "PayoutMethod",
     "PayoutRequest",
     "PayoutStatus",
@@ -6,7 +6,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import ForeignKey, Integer, String, Text
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, func
 from sqlalchemy.dialects.sqlite import JSON
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -33,9 +33,13 @@ class Offer(TimestampMixin, Base):
     expected_score: Mapped[int] = mapped_column(Integer, default=0)
     status: Mapped[OfferStatus] = mapped_column(default=OfferStatus.ACTIVE)
     partner_id: Mapped[Optional[str]] = mapped_column(String(64))
-    features: Mapped[dict | None] = mapped_column(JSON, default=dict)
-    schedule: Mapped[dict | None] = mapped_column(JSON)
-    metadata_json: Mapped[dict | None] = mapped_column(JSON, default=dict)
+    # Raw Saleads data, rarely read: loaded on first access (or with
+    # ``undefer_group("payload")``), not with every offer row.
+    features: Mapped[dict | None] = mapped_column(JSON, default=dict, deferred=True, deferred_group="payload")
+    schedule: Mapped[dict | None] = mapped_column(JSON, deferred=True, deferred_group="payload")
+    metadata_json: Mapped[dict | None] = mapped_column(JSON, default=dict, deferred=True, deferred_group="payload")
+    # Digest of the Saleads payload the row was last written from.
+    content_hash: Mapped[Optional[str]] = mapped_column(String(32))
 
     landings: Mapped[list["OfferLanding"]] = relationship(
         back_populates="offer", cascade="all, delete-orphan"
@@ -58,6 +62,7 @@ class OfferLanding(TimestampMixin, Base):
 
 class ClickStatus(str, Enum):
     SENT = "sent"
+    OPENED = "opened"
     CONFIRMED = "confirmed"
     REJECTED = "rejected"
 
@@ -78,6 +83,18 @@ class Click(TimestampMixin, Base):
     offer: Mapped[Offer] = relationship(back_populates="clicks")
 
 
+class ClickHit(Base):
+    """One opening of a tracking link, written in batches by ``HitRecorder``."""
+
+    __tablename__ = "click_hits"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    click_id: Mapped[int] = mapped_column(ForeignKey("clicks.id"), index=True)
+    opened_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    ip_hash: Mapped[Optional[str]] = mapped_column(String(32))
+    user_agent: Mapped[Optional[str]] = mapped_column(String(255))
+
+
 class ConversionStatus(str, Enum):
     PENDING = "pending"
     APPROVED = "approved"
@@ -96,10 +113,33 @@ class Conversion(TimestampMixin, Base):
     status: Mapped[ConversionStatus] = mapped_column(default=ConversionStatus.PENDING)
     amount_netto: Mapped[int] = mapped_column(Integer, default=0)
     currency: Mapped[str] = mapped_column(String(8), default="RUB")
-    raw_payload: Mapped[dict | None] = mapped_column(JSON)
+    raw_payload: Mapped[dict | None] = mapped_column(JSON, deferred=True)
     eta_date: Mapped[Optional[datetime]] = mapped_column()
 
 
+class PostbackInbox(TimestampMixin, Base):
+    """Saleads postbacks accepted by the API and waiting for ``PostbackWorker``."""
+
+    __tablename__ = "postback_inbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    payload: Mapped[dict] = mapped_column(JSON)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), index=True)
+    # Set after a failed attempt; the row is not picked up again before it.
+    next_attempt_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    error: Mapped[Optional[str]] = mapped_column(Text)
+
+
+class PostbackReceipt(Base):
+    """Digest of an applied ``(conversion, status, amount)``; inserting it twice is a replay."""
+
+    __tablename__ = "postback_receipts"
+
+    key: Mapped[str] = mapped_column(String(32), primary_key=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
 class RecommendationSession(TimestampMixin, Base):
     __tablename__ = "recommendation_sessions"
 
@@ -114,7 +154,10 @@ __all__ = [
     "Offer",
     "OfferLanding",
     "Click",
+    "ClickHit",
     "Conversion",
+    "PostbackInbox",
+    "PostbackReceipt",
     "RecommendationSession",
     "OfferStatus",
     "ClickStatus",
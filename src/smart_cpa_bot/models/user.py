@@ -35,7 +35,7 @@ class User(TimestampMixin, Base):
     status: Mapped[UserStatus] = mapped_column(default=UserStatus.NEW)
     referral_code: Mapped[str] = mapped_column(String(32), unique=True)
     referred_by_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"))
-    notes: Mapped[Optional[str]] = mapped_column(Text)
+    notes: Mapped[Optional[str]] = mapped_column(Text, deferred=True)
 
     referred_by: Mapped["User | None"] = relationship(
         remote_side="User.id", foreign_keys=[referred_by_id]
@@ -0,0 +1,38 @@
+"""Fold old ledger entries into per-user balance checkpoints."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from ..db import SessionFactory, _engine, create_schema
+from ..services.balances import LedgerCompactor
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with _engine.begin() as conn:
+        await conn.run_sync(create_schema)
+    compactor = LedgerCompactor(
+        SessionFactory,
+        min_entries=args.min_entries,
+        batch_size=args.batch_size,
+    )
+    if args.interval:
+        await compactor.run_forever(interval=args.interval)
+    else:
+        await compactor.run_once()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interval", type=float, default=0, help="repeat every N seconds (default: run once)")
+    parser.add_argument("--min-entries", type=int, default=100, help="only checkpoint users with this many new entries")
+    parser.add_argument("--batch-size", type=int, default=200, help="users per transaction")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
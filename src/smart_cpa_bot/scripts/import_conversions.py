@@ -0,0 +1,52 @@
+"""Import conversions from an advertiser CSV or JSONL file.
+
+Columns (or keys) are those of a Saleads postback: ``click_id``,
+``conversion_id``, ``amount``, ``status`` and optionally ``currency``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+from ..db import SessionFactory, _engine, create_schema
+from ..services.conversion_import import IMPORT_FORMATS, ConversionImporter
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args: argparse.Namespace) -> int:
+    async with _engine.begin() as conn:
+        await conn.run_sync(create_schema)
+    importer = ConversionImporter(SessionFactory, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    stats = await importer.run(args.path, fmt=args.format, restart=args.restart)
+    logger.info(
+        "%s %s record(s) (%s skipped as already imported): %s applied, %s replays, %s errors",
+        "Checked" if args.dry_run else "Imported",
+        stats.records,
+        stats.skipped,
+        stats.applied,
+        stats.replays,
+        stats.errors,
+    )
+    return stats.errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start from the first record")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    errors = asyncio.run(run(args))
+    if errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
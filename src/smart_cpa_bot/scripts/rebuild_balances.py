@@ -0,0 +1,54 @@
+"""Rebuild or verify the balance projections (``user_balances``, ``daily_scores``) from the ledger."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from ..db import SessionFactory, _engine, create_schema
+from ..services.balances import BalanceService
+
+logger = logging.getLogger(__name__)
+
+
+async def run(*, verify_only: bool) -> int:
+    async with _engine.begin() as conn:
+        await conn.run_sync(create_schema)
+    async with SessionFactory() as session:
+        service = BalanceService(session)
+        if verify_only:
+            drift = await service.verify_projection()
+        else:
+            drift = await service.rebuild_projection()
+            buckets = await service.rebuild_daily_scores()
+            await session.commit()
+            logger.info("Rebuilt %s daily score bucket(s)", buckets)
+    for item in drift:
+        logger.warning(
+            "user %s: ledger=%s projection=%s",
+            item.user_id,
+            item.expected,
+            item.actual,
+        )
+    action = "found" if verify_only else "fixed"
+    logger.info("%s drift for %s user(s)", action.capitalize(), len(drift))
+    return len(drift)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--verify-only",
+        action="store_true",
+        help="report drift without rewriting user_balances",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    drifted = asyncio.run(run(verify_only=args.verify_only))
+    if args.verify_only and drifted:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Pull conversion statuses from Saleads and apply the ones that changed."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from datetime import timedelta
+
+from ..db import SessionFactory, _engine, create_schema
+from ..services.reconciliation import ConversionReconciler
+from ..services.saleads import get_saleads_client
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with _engine.begin() as conn:
+        await conn.run_sync(create_schema)
+    client = get_saleads_client()
+    reconciler = ConversionReconciler(
+        SessionFactory,
+        api_client=client,
+        batch_size=args.batch_size,
+        lookback=timedelta(days=args.lookback_days) if args.lookback_days else None,
+    )
+    try:
+        if args.interval:
+            await reconciler.run_forever(interval=args.interval)
+        else:
+            await reconciler.run_once()
+    finally:
+        await client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interval", type=float, default=0, help="repeat every N seconds (default: run once)")
+    parser.add_argument("--lookback-days", type=int, default=0, help="re-read clicks this many days before the cursor")
+    parser.add_argument("--batch-size", type=int, default=0, help="conversions per transaction")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
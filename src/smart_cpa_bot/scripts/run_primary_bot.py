@@ -10,7 +10,9 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from ..config import settings
+from ..db import SessionFactory
 from ..services.llm import LLMService
+from ..services.offers import OfferSyncScheduler
 from ..telegram.middlewares import DatabaseSessionMiddleware
 from ..telegram.routers import primary_router
 
@@ -25,9 +27,15 @@ async def main() -> None:
     dp.update.outer_middleware(DatabaseSessionMiddleware())
     dp.include_router(primary_router)
     llm_service = LLMService()
+    scheduler = OfferSyncScheduler(SessionFactory)
+    offer_sync = asyncio.create_task(scheduler.run_forever())
     try:
         await dp.start_polling(bot, llm_service=llm_service)
     finally:
+        offer_sync.cancel()
+        await asyncio.gather(offer_sync, return_exceptions=True)
+        # The sync itself is shielded from run_forever's cancellation.
+        await scheduler.close()
         await llm_service.close()
 
 
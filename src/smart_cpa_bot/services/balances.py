@@ -2,12 +2,30 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
 from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Sequence
 
-from sqlalchemy import Select, case, func, select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Select, case, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from ..models import BalanceLedger, LedgerEntryType
+from ..models import BalanceCheckpoint, BalanceLedger, DailyScore, LedgerEntryType, UserBalance
+from .batching import chunked, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE, PENDING, LOCKED = range(3)
+
+# Effect of a ledger entry on the (available, pending, locked) buckets.
+LEDGER_EFFECTS: dict[LedgerEntryType, tuple[int, int, int]] = {
+    LedgerEntryType.CREDIT: (1, 0, 0),
+    LedgerEntryType.DEBIT: (-1, 0, 0),
+    LedgerEntryType.LOCK: (-1, 0, 1),
+    LedgerEntryType.UNLOCK: (1, 0, -1),
+    LedgerEntryType.ADJUST: (0, 1, 0),
+}
 
 
 @dataclass(slots=True)
@@ -17,58 +35,70 @@ class BalanceSnapshot:
     locked: int
 
 
+@dataclass(slots=True)
+class BalanceDrift:
+    user_id: int
+    expected: BalanceSnapshot
+    actual: BalanceSnapshot
+
+
+def utc_today() -> date:
+    """Day of the ``daily_scores`` bucket a ledger entry written now falls into."""
+
+    return datetime.now(timezone.utc).date()
+
+
+def ledger_sum(bucket: int):
+    """``SUM`` of ledger amounts projected onto one balance bucket."""
+
+    branches = [
+        (BalanceLedger.type == entry_type, BalanceLedger.amount * effect[bucket])
+        for entry_type, effect in LEDGER_EFFECTS.items()
+        if effect[bucket]
+    ]
+    return func.coalesce(func.sum(case(*branches, else_=0)), 0)
+
+
+def after_checkpoint():
+    """Filter for ledger entries not yet folded into the user's checkpoint.
+
+    Must be combined with an outer join of ``BalanceCheckpoint`` on ``user_id``.
+    """
+
+    return BalanceLedger.id > func.coalesce(BalanceCheckpoint.ledger_entry_id, 0)
+
+
 class BalanceService:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
     async def snapshot(self, user_id: int) -> BalanceSnapshot:
-        available_stmt: Select = select(
-            func.coalesce(
-                func.sum(
-                    case(
-                        (BalanceLedger.type == LedgerEntryType.CREDIT, BalanceLedger.amount),
-                        (BalanceLedger.type == LedgerEntryType.DEBIT, -BalanceLedger.amount),
-                        (BalanceLedger.type == LedgerEntryType.UNLOCK, BalanceLedger.amount),
-                        (BalanceLedger.type == LedgerEntryType.LOCK, -BalanceLedger.amount),
-                        else_=0,
-                    )
-                ),
-                0,
-            )
-        ).where(BalanceLedger.user_id == user_id)
-        available = (await self.session.execute(available_stmt)).scalar_one()
-
-        locked_stmt: Select = select(
-            func.coalesce(
-                func.sum(
-                    case(
-                        (BalanceLedger.type == LedgerEntryType.LOCK, BalanceLedger.amount),
-                        (BalanceLedger.type == LedgerEntryType.UNLOCK, -BalanceLedger.amount),
-                        else_=0,
-                    )
-                ),
-                0,
-            )
-        ).where(BalanceLedger.user_id == user_id)
-        locked = (await self.session.execute(locked_stmt)).scalar_one()
-
-        pending_stmt: Select = select(
-            func.coalesce(
-                func.sum(
-                    case(
-                        (BalanceLedger.type == LedgerEntryType.ADJUST, BalanceLedger.amount),
-                        else_=0,
-                    )
-                ),
-                0,
-            )
-        ).where(BalanceLedger.user_id == user_id)
-        pending = (await self.session.execute(pending_stmt)).scalar_one()
-        return BalanceSnapshot(
-            available=int(available or 0),
-            pending=int(pending or 0),
-            locked=int(locked or 0),
-        )
+        stmt: Select = select(
+            UserBalance.available,
+            UserBalance.pending,
+            UserBalance.locked,
+        ).where(UserBalance.user_id == user_id)
+        row = (await self.session.execute(stmt)).one_or_none()
+        if row is None:
+            return BalanceSnapshot(available=0, pending=0, locked=0)
+        available, pending, locked = row
+        return BalanceSnapshot(available=available, pending=pending, locked=locked)
+
+    async def snapshot_many(self, user_ids: Iterable[int]) -> dict[int, BalanceSnapshot]:
+        """Balances for many users at once; users without entries map to zeros."""
+
+        ids = sorted(set(user_ids))
+        result = {user_id: BalanceSnapshot(available=0, pending=0, locked=0) for user_id in ids}
+        for batch in chunked(ids):
+            stmt: Select = select(
+                UserBalance.user_id,
+                UserBalance.available,
+                UserBalance.pending,
+                UserBalance.locked,
+            ).where(UserBalance.user_id.in_(batch))
+            for user_id, available, pending, locked in (await self.session.execute(stmt)).all():
+                result[user_id] = BalanceSnapshot(available=available, pending=pending, locked=locked)
+        return result
 
     async def add_entry(
         self,
@@ -90,7 +120,273 @@ class BalanceService:
         )
         self.session.add(entry)
         await self.session.flush()
+        await self._apply_to_projection(user_id, entry_type, amount)
         return entry
 
+    async def _apply_to_projection(self, user_id: int, entry_type: LedgerEntryType, amount: int) -> None:
+        available, pending, locked = (amount * factor for factor in LEDGER_EFFECTS[entry_type])
+        stmt = upsert_insert(self.session, UserBalance).values(
+            user_id=user_id,
+            available=available,
+            pending=pending,
+            locked=locked,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserBalance.user_id],
+            set_={
+                "available": UserBalance.available + stmt.excluded.available,
+                "pending": UserBalance.pending + stmt.excluded.pending,
+                "locked": UserBalance.locked + stmt.excluded.locked,
+                "updated_at": func.now(),
+            },
+        )
+        await self.session.execute(stmt)
+        if available:
+            # The leaderboard score is the available bucket; keep the daily
+            # rollup used by windowed leaderboards in step with it.
+            score_stmt = upsert_insert(self.session, DailyScore).values(
+                user_id=user_id, day=utc_today(), score=available
+            )
+            score_stmt = score_stmt.on_conflict_do_update(
+                index_elements=[DailyScore.user_id, DailyScore.day],
+                set_={"score": DailyScore.score + score_stmt.excluded.score},
+            )
+            await self.session.execute(score_stmt)
+
+    async def ledger_totals(self) -> dict[int, BalanceSnapshot]:
+        """Recompute every user's balance from checkpoints plus newer ledger entries."""
+
+        checkpoint_stmt: Select = select(
+            BalanceCheckpoint.user_id,
+            BalanceCheckpoint.available,
+            BalanceCheckpoint.pending,
+            BalanceCheckpoint.locked,
+        )
+        totals = {
+            user_id: BalanceSnapshot(available=available, pending=pending, locked=locked)
+            for user_id, available, pending, locked in (await self.session.execute(checkpoint_stmt)).all()
+        }
+        tail_stmt: Select = (
+            select(
+                BalanceLedger.user_id,
+                ledger_sum(AVAILABLE),
+                ledger_sum(PENDING),
+                ledger_sum(LOCKED),
+            )
+            .outerjoin(BalanceCheckpoint, BalanceCheckpoint.user_id == BalanceLedger.user_id)
+            .where(after_checkpoint())
+            .group_by(BalanceLedger.user_id)
+        )
+        for user_id, available, pending, locked in (await self.session.execute(tail_stmt)).all():
+            base = totals.get(user_id) or BalanceSnapshot(available=0, pending=0, locked=0)
+            totals[user_id] = BalanceSnapshot(
+                available=base.available + int(available),
+                pending=base.pending + int(pending),
+                locked=base.locked + int(locked),
+            )
+        return totals
+
+    async def verify_projection(self) -> list[BalanceDrift]:
+        """Compare ``user_balances`` with the ledger and list mismatching users."""
+
+        expected = await self.ledger_totals()
+        stmt: Select = select(
+            UserBalance.user_id,
+            UserBalance.available,
+            UserBalance.pending,
+            UserBalance.locked,
+        )
+        actual = {
+            user_id: BalanceSnapshot(available=available, pending=pending, locked=locked)
+            for user_id, available, pending, locked in (await self.session.execute(stmt)).all()
+        }
+        empty = BalanceSnapshot(available=0, pending=0, locked=0)
+        drift: list[BalanceDrift] = []
+        for user_id in sorted(expected.keys() | actual.keys()):
+            want = expected.get(user_id, empty)
+            have = actual.get(user_id, empty)
+            if want != have:
+                drift.append(BalanceDrift(user_id=user_id, expected=want, actual=have))
+        return drift
+
+    async def rebuild_projection(self) -> list[BalanceDrift]:
+        """Overwrite drifted ``user_balances`` rows with ledger totals."""
+
+        drift = await self.verify_projection()
+        for item in drift:
+            stmt = upsert_insert(self.session, UserBalance).values(
+                user_id=item.user_id,
+                available=item.expected.available,
+                pending=item.expected.pending,
+                locked=item.expected.locked,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[UserBalance.user_id],
+                set_={
+                    "available": stmt.excluded.available,
+                    "pending": stmt.excluded.pending,
+                    "locked": stmt.excluded.locked,
+                    "updated_at": func.now(),
+                },
+            )
+            await self.session.execute(stmt)
+        await self.session.flush()
+        return drift
+
+    async def rebuild_daily_scores(self) -> int:
+        """Recompute ``daily_scores`` from the ledger; returns the bucket count."""
+
+        scoring_types = [entry_type for entry_type, effect in LEDGER_EFFECTS.items() if effect[AVAILABLE]]
+        source: Select = (
+            select(
+                BalanceLedger.user_id,
+                func.date(BalanceLedger.created_at).label("day"),
+                ledger_sum(AVAILABLE).label("score"),
+            )
+            .where(BalanceLedger.type.in_(scoring_types))
+            .group_by(BalanceLedger.user_id, func.date(BalanceLedger.created_at))
+        )
+        await self.session.execute(delete(DailyScore))
+        await self.session.execute(
+            insert(DailyScore).from_select(["user_id", "day", "score"], source)
+        )
+        await self.session.flush()
+        stmt: Select = select(func.count()).select_from(DailyScore)
+        return (await self.session.execute(stmt)).scalar_one()
+
+    async def checkpoint(self, user_ids: Sequence[int], *, up_to_entry_id: int) -> int:
+        """Fold ledger entries up to ``up_to_entry_id`` into the users' checkpoints.
+
+        Returns the number of checkpoints advanced.
+        """
+
+        if not user_ids:
+            return 0
+        current_stmt: Select = select(
+            BalanceCheckpoint.user_id,
+            BalanceCheckpoint.ledger_entry_id,
+            BalanceCheckpoint.available,
+            BalanceCheckpoint.pending,
+            BalanceCheckpoint.locked,
+        ).where(BalanceCheckpoint.user_id.in_(user_ids))
+        current = {row.user_id: row for row in (await self.session.execute(current_stmt)).all()}
+        tail_stmt: Select = (
+            select(
+                BalanceLedger.user_id,
+                func.max(BalanceLedger.id),
+                ledger_sum(AVAILABLE),
+                ledger_sum(PENDING),
+                ledger_sum(LOCKED),
+            )
+            .outerjoin(BalanceCheckpoint, BalanceCheckpoint.user_id == BalanceLedger.user_id)
+            .where(
+                BalanceLedger.user_id.in_(user_ids),
+                after_checkpoint(),
+                BalanceLedger.id <= up_to_entry_id,
+            )
+            .group_by(BalanceLedger.user_id)
+        )
+        advanced = 0
+        for user_id, last_id, available, pending, locked in (await self.session.execute(tail_stmt)).all():
+            previous = current.get(user_id)
+            stmt = upsert_insert(self.session, BalanceCheckpoint).values(
+                user_id=user_id,
+                ledger_entry_id=last_id,
+                available=(previous.available if previous else 0) + int(available),
+                pending=(previous.pending if previous else 0) + int(pending),
+                locked=(previous.locked if previous else 0) + int(locked),
+            )
+            # Only advance from the checkpoint we summed on top of, so a
+            # concurrent compactor cannot fold the same entries twice.
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[BalanceCheckpoint.user_id],
+                set_={
+                    "ledger_entry_id": stmt.excluded.ledger_entry_id,
+                    "available": stmt.excluded.available,
+                    "pending": stmt.excluded.pending,
+                    "locked": stmt.excluded.locked,
+                    "updated_at": func.now(),
+                },
+                where=BalanceCheckpoint.ledger_entry_id == (previous.ledger_entry_id if previous else 0),
+            )
+            await self.session.execute(stmt)
+            advanced += 1
+        return advanced
+
+
+class LedgerCompactor:
+    """Background job that folds old ledger entries into per-user checkpoints.
+
+    Every batch of users is checkpointed in its own transaction, so the job can
+    be interrupted at any point and picks up where it left off on the next run.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        min_entries: int = 100,
+        batch_size: int = 200,
+        settle_seconds: int = 60,
+    ) -> None:
+        self._session_factory = session_factory
+        self.min_entries = min_entries
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+
+    async def run_once(self) -> int:
+        async with self._session_factory() as session:
+            cutoff = await self._cutoff(session)
+            if not cutoff:
+                return 0
+            user_ids = await self._candidates(session, cutoff)
+        advanced = 0
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start : start + self.batch_size]
+            async with self._session_factory() as session:
+                advanced += await BalanceService(session).checkpoint(batch, up_to_entry_id=cutoff)
+                await session.commit()
+        if advanced:
+            logger.info("Checkpointed ledger up to entry %s for %s user(s)", cutoff, advanced)
+        return advanced
+
+    async def run_forever(self, *, interval: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:  # pragma: no cover - keep the job alive
+                logger.exception("Ledger compaction failed")
+            await asyncio.sleep(interval)
+
+    async def _cutoff(self, session: AsyncSession) -> int | None:
+        # Leave the newest entries alone so in-flight transactions that were
+        # assigned lower ids can still commit below the checkpoint boundary.
+        settled_before = datetime.now(timezone.utc) - timedelta(seconds=self.settle_seconds)
+        stmt: Select = select(func.max(BalanceLedger.id)).where(BalanceLedger.created_at <= settled_before)
+        return (await session.execute(stmt)).scalar_one_or_none()
+
+    async def _candidates(self, session: AsyncSession, cutoff: int) -> list[int]:
+        stmt: Select = (
+            select(BalanceLedger.user_id)
+            .outerjoin(BalanceCheckpoint, BalanceCheckpoint.user_id == BalanceLedger.user_id)
+            .where(after_checkpoint(), BalanceLedger.id <= cutoff)
+            .group_by(BalanceLedger.user_id)
+            .having(func.count(BalanceLedger.id) >= self.min_entries)
+            .order_by(BalanceLedger.user_id)
+        )
+        return list((await session.execute(stmt)).scalars())
+
 
-__all__ = ["BalanceService", "BalanceSnapshot"]
+__all__ = [
+    "BalanceService",
+    "BalanceSnapshot",
+    "BalanceDrift",
+    "LedgerCompactor",
+    "LEDGER_EFFECTS",
+    "AVAILABLE",
+    "PENDING",
+    "LOCKED",
+    "ledger_sum",
+    "after_checkpoint",
+    "utc_today",
+]
@@ -0,0 +1,35 @@
+"""Helpers for bulk statements: SQLite-friendly batches and dialect-aware upserts."""
+
+from __future__ import annotations
+
+from typing import Any, Iterator, Sequence, TypeVar
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+# SQLite builds before 3.32 cap a statement at 999 bound parameters.
+MAX_IN_PARAMS = 900
+
+# Both dialects' ``insert`` offer ``on_conflict_do_update``/``_do_nothing`` and
+# ``excluded`` with the same signatures.
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def chunked(items: Sequence[T], size: int = MAX_IN_PARAMS) -> Iterator[Sequence[T]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def upsert_insert(session: AsyncSession, table: Any) -> sqlite.Insert | postgresql.Insert:
+    """``INSERT`` for ``table`` with ``ON CONFLICT`` support on the session's database."""
+
+    dialect = session.get_bind().dialect.name
+    try:
+        return _UPSERT_INSERTS[dialect](table)
+    except KeyError:
+        raise NotImplementedError(f"Upserts are not implemented for {dialect}") from None
+
+
+__all__ = ["MAX_IN_PARAMS", "chunked", "upsert_insert"]
@@ -0,0 +1,475 @@
+"""In-memory views of the offer catalog, rebuilt when the catalog version moves."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from heapq import merge, nlargest
+from typing import Sequence
+
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import Integer, Select, String, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models import Offer, OfferLanding, OfferStatus, SyncState
+from .batching import chunked, upsert_insert
+
+try:  # optional, installed with the "fast" extra
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = "offers_catalog_version"
+GEO_BONUS = 25
+GOAL_BONUS = 5
+
+
+async def catalog_version(session: AsyncSession) -> int:
+    stmt = select(SyncState.value).where(SyncState.key == CATALOG_VERSION_KEY)
+    value = (await session.execute(stmt)).scalar_one_or_none()
+    return int(value) if value else 0
+
+
+async def bump_catalog_version(session: AsyncSession) -> None:
+    """Mark the catalog as changed so every process rebuilds its in-memory views."""
+
+    stmt = upsert_insert(session, SyncState).values(key=CATALOG_VERSION_KEY, value="1")
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SyncState.key],
+        set_={
+            "value": cast(cast(SyncState.value, Integer) + 1, String),
+            "updated_at": func.now(),
+        },
+    )
+    await session.execute(stmt)
+
+
+@dataclass(slots=True)
+class EligibilityRow:
+    id: int
+    min_age: int | None
+    max_age: int | None
+    cities: frozenset[str] | None
+    base_score: int = 0
+    goal_count: int = 0
+    geo_text: str = ""
+
+
+@dataclass(frozen=True, slots=True)
+class OfferRecord:
+    """What recommendations and click tracking need to know about an offer."""
+
+    id: int
+    external_uuid: str
+    title: str
+    payout: int
+    description: str
+    landing_url: str | None
+    landing_id: int | None = None
+    landing_uuid: str | None = None
+
+
+def goal_count(metadata: dict | None) -> int:
+    goals = (metadata or {}).get("goals")
+    return len(goals) if goals else 0
+
+
+class OfferFeatures:
+    """Per-offer scoring inputs laid out by catalog position.
+
+    Reproduces ``OfferService._score_offer``: base score, a bonus per goal and a
+    bonus when the user's city occurs in the offer's geo text. With NumPy the
+    scores and the top-K are computed with array operations, otherwise with
+    ``heapq.nlargest``; both rank ties by catalog position, like a stable sort.
+    """
+
+    def __init__(self, rows: Sequence[EligibilityRow]) -> None:
+        self.base = [row.base_score + row.goal_count * GOAL_BONUS for row in rows]
+        self.geo_text = [row.geo_text for row in rows]
+        self._geo_flags: LRUCache[tuple[str, bool], object] = LRUCache(maxsize=1024)
+        if np is not None:
+            self.base_array = np.asarray(self.base, dtype=np.int64)
+            self.geo_array = np.asarray(self.geo_text, dtype=np.str_)
+
+    def geo_flags(self, city: str, *, vectorized: bool):
+        key = (city, vectorized)
+        flags = self._geo_flags.get(key)
+        if flags is None:
+            if vectorized:
+                flags = np.char.find(self.geo_array, city) >= 0 if len(self.geo_text) else np.zeros(0, dtype=bool)
+            else:
+                flags = [city in text for text in self.geo_text]
+            self._geo_flags[key] = flags
+        return flags
+
+    def top_k(
+        self,
+        positions: Sequence[int],
+        city: str | None,
+        k: int,
+        *,
+        vectorized: bool | None = None,
+    ) -> list[int]:
+        """The ``k`` best catalog positions among ``positions`` (ascending)."""
+
+        if np is None:
+            vectorized = False
+        elif vectorized is None:
+            vectorized = True
+        if k <= 0 or not positions:
+            return []
+        city_key = city.lower() if city else None
+        if vectorized:
+            return self._top_k_numpy(positions, city_key, k)
+        base = self.base
+        if city_key:
+            flags = self.geo_flags(city_key, vectorized=False)
+            return nlargest(k, positions, key=lambda position: base[position] + GEO_BONUS * flags[position])
+        return nlargest(k, positions, key=base.__getitem__)
+
+    def _top_k_numpy(self, positions: Sequence[int], city: str | None, k: int) -> list[int]:
+        pos = np.asarray(positions, dtype=np.int64)
+        scores = self.base_array[pos]
+        if city:
+            scores = scores + GEO_BONUS * self.geo_flags(city, vectorized=True)[pos]
+        if k < len(pos):
+            # argpartition picks an arbitrary subset among equal scores at the
+            # cut-off, so take everything above it and the earliest ties.
+            threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            above = np.flatnonzero(scores > threshold)
+            ties = np.flatnonzero(scores == threshold)[: k - len(above)]
+            chosen = np.concatenate((above, ties))
+            pos, scores = pos[chosen], scores[chosen]
+        order = np.lexsort((pos, -scores))
+        return pos[order].tolist()
+
+
+class OfferEligibilityIndex:
+    """Age-range buckets plus a city inverted index over the active catalog.
+
+    Mirrors ``OfferService._is_offer_allowed``: offers without a city whitelist
+    sit in a separate list, restricted offers are reachable through their
+    lowercased cities, and each age bucket is a byte mask over catalog
+    positions. Candidates come back in catalog (id) order.
+    """
+
+    def __init__(self, version: int, rows: Sequence[EligibilityRow]) -> None:
+        self.version = version
+        self.offer_ids = [row.id for row in rows]
+        self.features = OfferFeatures(rows)
+        self.unrestricted: list[int] = []
+        self.by_city: dict[str, list[int]] = {}
+        for position, row in enumerate(rows):
+            if not row.cities:
+                self.unrestricted.append(position)
+                continue
+            for city in row.cities:
+                self.by_city.setdefault(city, []).append(position)
+
+        boundaries: set[int] = set()
+        for row in rows:
+            if row.min_age:
+                boundaries.add(row.min_age)
+            if row.max_age:
+                boundaries.add(row.max_age + 1)
+        self.age_boundaries = sorted(boundaries)
+        representatives = [self.age_boundaries[0] - 1] if self.age_boundaries else []
+        representatives += self.age_boundaries
+        self.age_masks = [
+            bytearray(
+                1
+                if (not row.min_age or age >= row.min_age) and (not row.max_age or age <= row.max_age)
+                else 0
+                for row in rows
+            )
+            for age in representatives
+        ]
+
+    def __len__(self) -> int:
+        return len(self.offer_ids)
+
+    def candidate_positions(self, age: int | None, city: str | None) -> list[int]:
+        """Catalog positions a user with this profile may see, ascending."""
+
+        if city:
+            restricted = self.by_city.get(city.lower(), [])
+            positions = merge(self.unrestricted, restricted) if restricted else iter(self.unrestricted)
+        else:
+            positions = iter(range(len(self.offer_ids)))
+        if age and self.age_masks:
+            mask = self.age_masks[bisect_right(self.age_boundaries, age)]
+            return [position for position in positions if mask[position]]
+        return list(positions)
+
+    def candidates(self, age: int | None, city: str | None) -> list[int]:
+        """Offer ids a user with this profile may see, in catalog order."""
+
+        return [self.offer_ids[position] for position in self.candidate_positions(age, city)]
+
+    def profile_key(self, age: int | None, city: str | None) -> tuple:
+        """Users with equal keys see the same candidates with the same scores."""
+
+        bucket = bisect_right(self.age_boundaries, age) if age and self.age_masks else None
+        return (self.version, bucket, city.lower() if city else None)
+
+    def recommend(self, age: int | None, city: str | None, limit: int, *, vectorized: bool | None = None) -> list[int]:
+        """Ids of the best ``limit`` eligible offers, best first."""
+
+        positions = self.candidate_positions(age, city)
+        top = self.features.top_k(positions, city, limit, vectorized=vectorized)
+        return [self.offer_ids[position] for position in top]
+
+
+def _intern(value: str | None) -> str | None:
+    return sys.intern(value) if value else value
+
+
+def _approximate_size(objects) -> int:
+    """Shallow sizes of the given objects and of the strings they reference, each counted once."""
+
+    seen: set[int] = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, OfferRecord):
+            stack.extend(getattr(item, name) for name in OfferRecord.__slots__)
+    return total
+
+
+class CatalogSnapshot:
+    """Read-only view of the active catalog: records plus the eligibility index.
+
+    Built in one pass over ``offers`` and their first landings and never
+    mutated afterwards, so it can be swapped in with a single assignment.
+    """
+
+    __slots__ = ("version", "records", "index", "build_seconds", "memory_bytes")
+
+    def __init__(self, version: int, rows: Sequence[EligibilityRow], records: Sequence[OfferRecord]) -> None:
+        self.version = version
+        self.records = tuple(records)
+        self.index = OfferEligibilityIndex(version, rows)
+        self.build_seconds = 0.0
+        self.memory_bytes = _approximate_size(
+            [
+                self.records,
+                self.index.offer_ids,
+                self.index.unrestricted,
+                self.index.by_city,
+                self.index.age_masks,
+                self.index.features.base,
+                self.index.features.geo_text,
+            ]
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def recommend(self, age: int | None, city: str | None, limit: int) -> list[OfferRecord]:
+        """The best ``limit`` offers this profile may see, best first."""
+
+        positions = self.index.candidate_positions(age, city)
+        return [self.records[position] for position in self.index.features.top_k(positions, city, limit)]
+
+    @classmethod
+    async def load(cls, session: AsyncSession, version: int) -> CatalogSnapshot:
+        started = time.perf_counter()
+        stmt: Select = (
+            select(
+                Offer.id,
+                Offer.external_uuid,
+                Offer.title,
+                Offer.min_age,
+                Offer.max_age,
+                Offer.city_whitelist,
+                Offer.expected_score,
+                Offer.payout_brutto,
+                Offer.geo_text,
+                Offer.metadata_json,
+            )
+            .where(Offer.status == OfferStatus.ACTIVE)
+            .order_by(Offer.id)
+        )
+        offers = (await session.execute(stmt)).all()
+        landings = await _first_landings(session, [offer.id for offer in offers])
+        rows: list[EligibilityRow] = []
+        records: list[OfferRecord] = []
+        for offer in offers:
+            metadata = offer.metadata_json or {}
+            rows.append(
+                EligibilityRow(
+                    id=offer.id,
+                    min_age=offer.min_age,
+                    max_age=offer.max_age,
+                    cities=frozenset(_intern(city.lower()) for city in offer.city_whitelist)
+                    if offer.city_whitelist
+                    else None,
+                    base_score=offer.expected_score or offer.payout_brutto or 0,
+                    goal_count=goal_count(metadata),
+                    geo_text=_intern((offer.geo_text or "").lower()),
+                )
+            )
+            landing_id, landing_uuid, landing_url = landings.get(offer.id, (None, None, None))
+            records.append(
+                OfferRecord(
+                    id=offer.id,
+                    external_uuid=offer.external_uuid,
+                    title=_intern(offer.title),
+                    payout=offer.payout_brutto,
+                    description=_intern(metadata.get("offerDescription", "")),
+                    landing_url=landing_url,
+                    landing_id=landing_id,
+                    landing_uuid=landing_uuid,
+                )
+            )
+        snapshot = cls(version, rows, records)
+        snapshot.build_seconds = time.perf_counter() - started
+        return snapshot
+
+
+async def _first_landings(session: AsyncSession, offer_ids: Sequence[int]) -> dict[int, tuple[int, str | None, str]]:
+    landings: dict[int, tuple[int, str | None, str]] = {}
+    for batch in chunked(offer_ids):
+        stmt = (
+            select(OfferLanding.offer_id, OfferLanding.id, OfferLanding.external_uuid, OfferLanding.url)
+            .where(OfferLanding.offer_id.in_(batch))
+            .order_by(OfferLanding.id)
+        )
+        for offer_id, landing_id, landing_uuid, url in (await session.execute(stmt)).all():
+            landings.setdefault(offer_id, (landing_id, landing_uuid, url))
+    return landings
+
+
+class RecommendationCache:
+    """TTL/LRU cache of recommendation lists shared by users with the same profile key."""
+
+    def __init__(self, *, maxsize: int | None = None, ttl: float | None = None) -> None:
+        self._entries: TTLCache[tuple, tuple] = TTLCache(
+            maxsize=maxsize or settings.recommendation_cache_size,
+            ttl=ttl or settings.recommendation_cache_ttl,
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> tuple | None:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: tuple, value: tuple) -> None:
+        self._entries[key] = value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "size": len(self._entries),
+        }
+
+    def log_stats(self, when: str) -> None:
+        stats = self.stats()
+        logger.info(
+            "Recommendation cache %s: %s hits, %s misses (%.1f%% hit rate), %s entries",
+            when,
+            stats["hits"],
+            stats["misses"],
+            100 * stats["hit_rate"],
+            stats["size"],
+        )
+
+
+class CatalogCache:
+    """Per-process holder of the current catalog snapshot."""
+
+    def __init__(self) -> None:
+        self._snapshot: CatalogSnapshot | None = None
+        self._lock = asyncio.Lock()
+        self.recommendations = RecommendationCache()
+
+    @property
+    def current(self) -> CatalogSnapshot | None:
+        return self._snapshot
+
+    async def snapshot(self, session: AsyncSession) -> CatalogSnapshot:
+        version = await catalog_version(session)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        async with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._swap(await CatalogSnapshot.load(session, version))
+            return self._snapshot
+
+    async def refresh(self, session: AsyncSession) -> CatalogSnapshot:
+        """Build a snapshot of the committed catalog and swap it in."""
+
+        async with self._lock:
+            self._swap(await CatalogSnapshot.load(session, await catalog_version(session)))
+            return self._snapshot
+
+    async def eligibility_index(self, session: AsyncSession) -> OfferEligibilityIndex:
+        return (await self.snapshot(session)).index
+
+    def _swap(self, snapshot: CatalogSnapshot) -> None:
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is not None:
+            self.recommendations.log_stats(f"until catalog v{previous.version} was replaced")
+        # Entries are keyed by version; drop the stale ones right away.
+        self.recommendations.clear()
+        logger.info(
+            "Built catalog snapshot v%s: %s offers, ~%.0f KiB, %.1f ms",
+            snapshot.version,
+            len(snapshot),
+            snapshot.memory_bytes / 1024,
+            snapshot.build_seconds * 1000,
+        )
+
+    def clear(self) -> None:
+        self._snapshot = None
+        self.recommendations.clear()
+
+
+catalog_cache = CatalogCache()
+
+
+__all__ = [
+    "CATALOG_VERSION_KEY",
+    "CatalogCache",
+    "CatalogSnapshot",
+    "OfferRecord",
+    "OfferEligibilityIndex",
+    "OfferFeatures",
+    "RecommendationCache",
+    "catalog_cache",
+    "catalog_version",
+    "bump_catalog_version",
+]
@@ -2,56 +2,418 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Sequence
+
 import shortuuid
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from cachetools import LRUCache
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, load_only
 
 from ..config import settings
 from ..models import Click, Offer, OfferLanding
-from .saleads import SaleadsAPIClient
+from .batching import chunked
+from .catalog import OfferRecord
+from .saleads import SaleadsAPIClient, get_saleads_client
+from .tokens import click_token_secret, sign_click_token
+
+logger = logging.getLogger(__name__)
+
+# Registrations still running after the handler returned; kept referenced
+# here so the event loop does not drop them.
+_late_registrations: set[asyncio.Task] = set()
+# Redirect-time registrations in progress, by click token.
+_redirect_registrations: dict[str, asyncio.Task[str | None]] = {}
+
+
+@dataclass(frozen=True, slots=True)
+class ClickTarget:
+    click_id: int
+    url: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class ClickRef:
+    """What a postback needs to know about the click it reports."""
+
+    id: int
+    user_id: int
+    offer_id: int
+
+
+class ClickRefCache:
+    """Bounded map from ``saleads_click_id`` to ``ClickRef`` for committed clicks.
+
+    Each process has its own, and postbacks are resolved in the API process, so
+    it is filled where they are read: by ``find_click_refs`` on a miss, and by
+    redirect-time registrations. Clicks the bots register are not added.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._refs: LRUCache[str, ClickRef] = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def get(self, saleads_click_id: str) -> ClickRef | None:
+        ref = self._refs.get(saleads_click_id)
+        if ref is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return ref
+
+    def add(self, refs: dict[str, ClickRef]) -> None:
+        for saleads_click_id, ref in refs.items():
+            self._refs[saleads_click_id] = ref
+
+    def clear(self) -> None:
+        self._refs.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._refs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+click_refs = ClickRefCache(settings.click_ref_cache_size)
+
+_STAGED_REFS = "click_refs"
+
+
+def _stage_refs(session: AsyncSession, refs: dict[str, ClickRef]) -> None:
+    # Only committed clicks go into ``click_refs``; see the listeners below.
+    if refs:
+        session.info.setdefault(_STAGED_REFS, {}).update(refs)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_refs(session: Session) -> None:
+    click_refs.add(session.info.pop(_STAGED_REFS, {}))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_refs(session: Session) -> None:
+    session.info.pop(_STAGED_REFS, None)
+
+
+_STAGED_COMPLETIONS = "click_completions"
+
+
+@event.listens_for(Session, "after_commit")
+def _start_completions(session: Session) -> None:
+    # The clicks are committed now, so their late registrations can be stored.
+    for service, token, registration, retry in session.info.pop(_STAGED_COMPLETIONS, []):
+        service._start_completion(token, registration, retry)
+
+
+@event.listens_for(Session, "after_rollback")
+def _cancel_completions(session: Session) -> None:
+    for _, _, registration, _ in session.info.pop(_STAGED_COMPLETIONS, []):
+        registration.cancel()
+
+
+async def find_click_refs(session: AsyncSession, saleads_click_ids: set[str]) -> dict[str, ClickRef]:
+    """Resolve Saleads click ids from ``click_refs``, reading only the misses."""
+
+    refs: dict[str, ClickRef] = {}
+    missing = []
+    for saleads_click_id in saleads_click_ids:
+        ref = click_refs.get(saleads_click_id)
+        if ref is None:
+            missing.append(saleads_click_id)
+        else:
+            refs[saleads_click_id] = ref
+    loaded: dict[str, ClickRef] = {}
+    for batch in chunked(sorted(missing)):
+        stmt = select(Click.saleads_click_id, Click.id, Click.user_id, Click.offer_id).where(
+            Click.saleads_click_id.in_(batch)
+        )
+        loaded.update((row[0], ClickRef(*row[1:])) for row in (await session.execute(stmt)).all())
+    _stage_refs(session, loaded)
+    return refs | loaded
 
 
 class ClickService:
-    def __init__(self, session: AsyncSession, api_client: SaleadsAPIClient | None = None) -> None:
+    def __init__(
+        self,
+        session: AsyncSession,
+        api_client: SaleadsAPIClient | None = None,
+        *,
+        session_factory: async_sessionmaker[AsyncSession] | None = None,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        lazy: bool | None = None,
+    ) -> None:
         self.session = session
-        self.api_client = api_client or SaleadsAPIClient()
+        self.api_client = api_client or get_saleads_client()
+        # Needed to finish registrations that outlive the request session.
+        self._session_factory = session_factory
+        self.concurrency = concurrency or settings.saleads.click_concurrency
+        self.timeout = timeout if timeout is not None else settings.saleads.click_timeout
+        self.lazy = settings.saleads.lazy_click_registration if lazy is None else lazy
+        self.retries = settings.saleads.click_retries
+        self.retry_delay = settings.saleads.click_retry_seconds
+        self.redirect_grace = timedelta(seconds=settings.saleads.click_redirect_grace)
+        self.completions: list[asyncio.Task] = []
 
     async def create_click(
         self,
         *,
         user_id: int,
-        offer: Offer,
-        landing: OfferLanding | None = None,
+        offer: OfferRecord,
         slot: str | None = None,
     ) -> tuple[Click, str]:
-        landing_obj = landing or (offer.landings[0] if offer.landings else None)
-        landing_uuid = None
-        target_url = None
-        if landing_obj:
-            landing_uuid = getattr(landing_obj, "external_uuid", None)
-            target_url = landing_obj.url
-        saleads = await self.api_client.register_click(
-            offer_uuid=offer.external_uuid,
-            landing_uuid=landing_uuid,
-            subs={"user_id": str(user_id)},
-        )
-        click = Click(
+        [created] = await self.create_clicks(user_id=user_id, offers=[offer], slot=slot)
+        return created
+
+    async def create_clicks(
+        self,
+        *,
+        user_id: int,
+        offers: Sequence[OfferRecord],
+        slot: str | None = None,
+    ) -> list[tuple[Click, str]]:
+        """Register Saleads clicks for a batch of offers and store them in one flush.
+
+        Registrations run concurrently (at most ``concurrency`` at a time) for up
+        to ``timeout`` seconds. A click whose registration has not answered by
+        then, or has failed, points at the offer's own landing URL; once the
+        session commits, its registration is finished (and retried up to
+        ``retries`` times) in the background and written to the row.
+
+        In lazy mode nothing is sent to Saleads here: the clicks only get local
+        tokens and are registered by ``resolve_target`` when first opened.
+        """
+
+        if self.lazy:
+            clicks = [self._new_click(user_id, offer, slot) for offer in offers]
+            self.session.add_all(clicks)
+            await self.session.flush()
+            return [(click, self.tracking_link(click)) for click in clicks]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def register(offer: OfferRecord) -> dict[str, Any]:
+            async with semaphore:
+                return await self.api_client.register_click(
+                    offer_uuid=offer.external_uuid,
+                    landing_uuid=offer.landing_uuid,
+                    subs={"user_id": str(user_id)},
+                )
+
+        tasks = [asyncio.create_task(register(offer)) for offer in offers]
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.timeout)
+
+        clicks: list[Click] = []
+        late: list[tuple[str, asyncio.Task, Callable[[], Awaitable[dict[str, Any]]]]] = []
+        for offer, task in zip(offers, tasks):
+            click = self._new_click(user_id, offer, slot)
+            if not task.done() or task.exception() is not None:
+                late.append((click.token, task, lambda offer=offer: register(offer)))
+            else:
+                _apply_registration(click, task.result())
+            self.session.add(click)
+            clicks.append(click)
+        await self.session.flush()
+
+        for token, task, retry in late:
+            self._finish_later(token, task, retry)
+        return [(click, self.tracking_link(click)) for click in clicks]
+
+    @staticmethod
+    def _new_click(user_id: int, offer: OfferRecord, slot: str | None) -> Click:
+        return Click(
             user_id=user_id,
             offer_id=offer.id,
-            landing_id=landing_obj.id if landing_obj else None,
+            landing_id=offer.landing_id,
             token=shortuuid.uuid(),
-            saleads_click_id=saleads.get("uuid") or saleads.get("id"),
-            target_url=saleads.get("redirect_url") or target_url,
+            target_url=offer.landing_url,
             source_slot=slot,
         )
-        self.session.add(click)
-        await self.session.flush()
-        tracking_link = f"{settings.public_base_url.rstrip('/')}/r/{click.token}"
-        return click, tracking_link
+
+    def _finish_later(
+        self,
+        token: str,
+        registration: asyncio.Task,
+        retry: Callable[[], Awaitable[dict[str, Any]]],
+    ) -> None:
+        if self._session_factory is None:
+            registration.cancel()
+            logger.warning("Saleads click registration for %s did not complete; /r/ will register it", token)
+            return
+        # Started by ``_start_completions`` once the click row is committed.
+        self.session.info.setdefault(_STAGED_COMPLETIONS, []).append((self, token, registration, retry))
+
+    def _start_completion(
+        self,
+        token: str,
+        registration: asyncio.Task,
+        retry: Callable[[], Awaitable[dict[str, Any]]],
+    ) -> None:
+        completion = asyncio.create_task(self._complete(token, registration, retry))
+        _late_registrations.add(completion)
+        completion.add_done_callback(_late_registrations.discard)
+        self.completions.append(completion)
+
+    async def _complete(
+        self,
+        token: str,
+        registration: asyncio.Task,
+        retry: Callable[[], Awaitable[dict[str, Any]]],
+    ) -> bool:
+        attempt: Awaitable[dict[str, Any]] = registration
+        for number in range(self.retries + 1):
+            if number:
+                await asyncio.sleep(self.retry_delay * number)
+                attempt = retry()
+            try:
+                saleads = await attempt
+            except Exception as exc:
+                logger.warning("Saleads click registration for %s failed (attempt %s): %s", token, number + 1, exc)
+                continue
+            async with self._session_factory() as session:
+                stored = await _store_registration(session, token, saleads)
+                await session.commit()
+            return stored is not None
+        logger.warning("Giving up on the Saleads registration for %s; /r/ will register it", token)
+        return False
+
+    def tracking_link(self, click: Click) -> str:
+        token = click.token
+        secret = click_token_secret()
+        # Only a registered click has its final target; the others must go
+        # through the database so a later registration can still take effect.
+        if secret and click.saleads_click_id and click.target_url:
+            token = sign_click_token(click.id, click.target_url, secret)
+        return f"{settings.public_base_url.rstrip('/')}/r/{token}"
+
+    async def resolve_target(self, token: str) -> ClickTarget | None:
+        """Where to redirect a tracking link to, registering the click with Saleads
+        on its first hit if that has not happened yet.
+
+        In eager mode ``create_clicks`` registers the click, possibly in the
+        background, so a click younger than ``redirect_grace`` is redirected to
+        its local target rather than registered twice; an older one has no
+        registration left in flight and is registered here. Concurrent first
+        hits in this process share one registration; across processes the
+        conditional update keeps the first stored result. If Saleads does not
+        answer within ``timeout`` the local target is used and the registration
+        completes in the background.
+        """
+
+        stmt = (
+            select(
+                Click.id,
+                Click.user_id,
+                Click.target_url,
+                Click.saleads_click_id,
+                Click.created_at,
+                Offer.external_uuid,
+                OfferLanding.external_uuid,
+            )
+            .join(Offer, Offer.id == Click.offer_id)
+            .outerjoin(OfferLanding, OfferLanding.id == Click.landing_id)
+            .where(Click.token == token)
+        )
+        row = (await self.session.execute(stmt)).first()
+        if row is None:
+            return None
+        click_id, user_id, target_url, saleads_click_id, created_at, offer_uuid, landing_uuid = row
+        if saleads_click_id or self._session_factory is None:
+            return ClickTarget(click_id, target_url)
+        if not self.lazy and _as_utc(created_at) > datetime.now(timezone.utc) - self.redirect_grace:
+            return ClickTarget(click_id, target_url)
+
+        registration = _redirect_registrations.get(token)
+        if registration is None:
+            registration = asyncio.create_task(
+                self._register_at_redirect(token, user_id, offer_uuid, landing_uuid, target_url)
+            )
+            _redirect_registrations[token] = registration
+            registration.add_done_callback(lambda task: _redirect_registration_done(token, task))
+        try:
+            target_url = await asyncio.wait_for(asyncio.shield(registration), self.timeout) or target_url
+        except Exception:  # timed out or failed: the local target still works
+            pass
+        return ClickTarget(click_id, target_url)
+
+    async def _register_at_redirect(
+        self,
+        token: str,
+        user_id: int,
+        offer_uuid: str,
+        landing_uuid: str | None,
+        target_url: str | None,
+    ) -> str | None:
+        saleads = await self.api_client.register_click(
+            offer_uuid=offer_uuid,
+            landing_uuid=landing_uuid,
+            subs={"user_id": str(user_id)},
+        )
+        async with self._session_factory() as session:
+            ref = await _store_registration(session, token, saleads)
+            if ref is not None:
+                # Redirects are served by the API process, where postbacks for
+                # this click will be resolved.
+                if saleads_click_id := _saleads_click_id(saleads):
+                    _stage_refs(session, {saleads_click_id: ref})
+                await session.commit()
+                return saleads.get("redirect_url") or target_url
+            # Another process registered it first; follow its result.
+            stmt = select(Click.target_url).where(Click.token == token)
+            return (await session.execute(stmt)).scalar_one_or_none()
 
     async def resolve_click(self, token: str) -> Click | None:
-        stmt = select(Click).where(Click.token == token)
+        stmt = select(Click).options(load_only(Click.target_url)).where(Click.token == token)
         return (await self.session.execute(stmt)).scalar_one_or_none()
 
 
-__all__ = ["ClickService"]
+def _apply_registration(click: Click, saleads: dict[str, Any]) -> None:
+    click.saleads_click_id = _saleads_click_id(saleads)
+    click.target_url = saleads.get("redirect_url") or click.target_url
+
+
+async def _store_registration(session: AsyncSession, token: str, saleads: dict[str, Any]) -> ClickRef | None:
+    """Write a Saleads registration to a click nobody registered yet; ``None`` if it was."""
+
+    values = {"saleads_click_id": _saleads_click_id(saleads)}
+    if saleads.get("redirect_url"):
+        values["target_url"] = saleads["redirect_url"]
+    stmt = (
+        update(Click)
+        .where(Click.token == token, Click.saleads_click_id.is_(None))
+        .values(**values)
+        .returning(Click.id, Click.user_id, Click.offer_id)
+    )
+    row = (await session.execute(stmt)).first()
+    return ClickRef(*row) if row is not None else None
+
+
+def _saleads_click_id(saleads: dict[str, Any]) -> str | None:
+    return saleads.get("uuid") or saleads.get("id")
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they are stored in UTC.
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _redirect_registration_done(token: str, task: asyncio.Task) -> None:
+    _redirect_registrations.pop(token, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Saleads click registration for %s failed: %s", token, task.exception())
+
+
+__all__ = ["ClickService", "ClickTarget", "ClickRef", "ClickRefCache", "click_refs", "find_click_refs"]
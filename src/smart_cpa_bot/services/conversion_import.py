@@ -0,0 +1,187 @@
+"""Manual import of advertiser conversion files (CSV or JSONL)."""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterator
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..models import SyncState
+from .batching import upsert_insert
+from .conversions import ConversionService, parse_postback
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+def detect_format(path: Path) -> str:
+    return "csv" if path.suffix.lower() == ".csv" else "jsonl"
+
+
+class _ByteCounter:
+    """Iterates a binary file as text lines, keeping count of the bytes read."""
+
+    def __init__(self, handle) -> None:
+        self._handle = handle
+        self.position = 0
+
+    def __iter__(self) -> Iterator[str]:
+        encoding = "utf-8-sig"  # spreadsheet exports often start with a BOM
+        for raw in self._handle:
+            self.position += len(raw)
+            yield raw.decode(encoding)
+            encoding = "utf-8"
+
+
+def read_rows(lines: Iterator[str], fmt: str) -> Iterator[dict[str, Any] | None]:
+    """Yield one postback-shaped payload per record, or ``None`` for a malformed one.
+
+    Blank CSV fields are dropped, so they fall back to the postback defaults.
+    """
+
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+@dataclass(slots=True)
+class ImportStats:
+    records: int = 0
+    skipped: int = 0
+    applied: int = 0
+    replays: int = 0
+    errors: int = 0
+    chunks: int = 0
+
+
+class ConversionImporter:
+    """Streams a conversion file through ``ConversionService.upsert_batch``.
+
+    Records are read lazily and applied ``chunk_size`` at a time, each chunk in
+    its own transaction together with the number of records done so far, kept
+    in ``sync_state`` under a key derived from the file path and contents.
+    After a crash the next run skips what was committed; once the file is done
+    the progress is removed, so another file at the same path starts from its
+    first record (re-applied records are receipt replays). With ``dry_run`` every chunk is rolled
+    back and progress is not saved, so the counts show what would change.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        chunk_size: int = 1000,
+        dry_run: bool = False,
+    ) -> None:
+        self._session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+    async def run(self, path: Path, *, fmt: str | None = None, restart: bool = False) -> ImportStats:
+        key = progress_key(path)
+        async with self._session_factory() as session:
+            done = 0 if restart else await self._progress(session, key)
+        stats = ImportStats(skipped=done)
+        size = os.path.getsize(path) or 1
+        started = time.perf_counter()
+        with open(path, "rb") as handle:
+            counter = _ByteCounter(handle)
+            rows = read_rows(iter(counter), fmt or detect_format(path))
+            for _ in islice(rows, done):
+                pass
+            if done:
+                logger.info("Resuming %s after %s committed record(s)", path, done)
+            while chunk := list(islice(rows, self.chunk_size)):
+                await self._apply(chunk, done, key, stats)
+                done += len(chunk)
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    "%s: %s record(s), %.1f%%, %.0f/s, %s applied, %s replays, %s errors%s",
+                    path.name,
+                    done,
+                    100 * counter.position / size,
+                    stats.records / elapsed if elapsed else 0.0,
+                    stats.applied,
+                    stats.replays,
+                    stats.errors,
+                    " (dry run)" if self.dry_run else "",
+                )
+        if not self.dry_run:
+            async with self._session_factory() as session:
+                await session.execute(delete(SyncState).where(SyncState.key == key))
+                await session.commit()
+        return stats
+
+    async def _apply(self, chunk: list[dict[str, Any] | None], offset: int, key: str, stats: ImportStats) -> None:
+        payloads = []
+        for number, payload in enumerate(chunk, start=offset + 1):
+            try:
+                if payload is None:
+                    raise ValueError("not a JSON object")
+                parse_postback(payload)
+            except (TypeError, ValueError) as exc:
+                logger.warning("Record %s: %s", number, exc)
+                stats.errors += 1
+                continue
+            payloads.append((number, payload))
+        async with self._session_factory() as session:
+            results = await ConversionService(session).upsert_batch([payload for _, payload in payloads])
+            for (number, _), result in zip(payloads, results):
+                if isinstance(result, Exception):
+                    logger.warning("Record %s: %s", number, result)
+                    stats.errors += 1
+                elif result is None:
+                    stats.replays += 1
+                else:
+                    stats.applied += 1
+            if self.dry_run:
+                await session.rollback()
+            else:
+                await self._save_progress(session, key, offset + len(chunk))
+                await session.commit()
+        stats.records += len(chunk)
+        stats.chunks += 1
+
+    async def _progress(self, session: AsyncSession, key: str) -> int:
+        stmt = select(SyncState.value).where(SyncState.key == key)
+        value = (await session.execute(stmt)).scalar_one_or_none()
+        return int(value) if value else 0
+
+    async def _save_progress(self, session: AsyncSession, key: str, done: int) -> None:
+        stmt = upsert_insert(session, SyncState).values(key=key, value=str(done))
+        stmt = stmt.on_conflict_do_update(index_elements=[SyncState.key], set_={"value": stmt.excluded.value})
+        await session.execute(stmt)
+
+
+def progress_key(path: Path) -> str:
+    """Identify a file by its path, size, modification time and first block."""
+
+    stat = path.stat()
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{path.resolve()}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode("utf-8"))
+    with open(path, "rb") as handle:
+        digest.update(handle.read(65536))
+    return f"conversion_import:{digest.hexdigest()}"
+
+
+__all__ = ["ConversionImporter", "ImportStats", "IMPORT_FORMATS", "detect_format", "progress_key", "read_rows"]
@@ -2,115 +2,330 @@
 
 from __future__ import annotations
 
-from typing import Any
+import hashlib
+import math
+from dataclasses import dataclass
+from typing import Any, Iterable, Sequence
 
-from sqlalchemy import select
+from cachetools import LRUCache
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models import Click, Conversion, ConversionStatus, LedgerEntryType
+from ..config import settings
+from ..models import Conversion, ConversionStatus, LedgerEntryType, PostbackReceipt
 from .balances import BalanceService
+from .batching import chunked, upsert_insert
+from .clicks import ClickRef, find_click_refs
+
+
+@dataclass(slots=True)
+class Postback:
+    click_uuid: str | None
+    external_id: str | None
+    amount: int
+    currency: str
+    status: ConversionStatus
+    payload: dict[str, Any]
+
+
+def parse_postback(payload: dict[str, Any]) -> Postback:
+    """Read a Saleads postback; raises ``ValueError`` for anything malformed."""
+
+    if not isinstance(payload, dict):
+        raise ValueError("Postback must be an object")
+    status_raw = payload.get("status") or "pending"
+    if not isinstance(status_raw, str):
+        raise ValueError(f"Invalid status: {status_raw!r}")
+    try:
+        status = ConversionStatus(status_raw.lower())
+    except ValueError:
+        status = ConversionStatus.PENDING
+    amount_raw = payload.get("amount") or payload.get("payout") or 0
+    try:
+        amount = float(amount_raw)
+    except (TypeError, ValueError):
+        amount = math.nan
+    if isinstance(amount_raw, bool) or not math.isfinite(amount):
+        raise ValueError(f"Invalid amount: {amount_raw!r}")
+    currency = payload.get("currency", "RUB")
+    if not isinstance(currency, str):
+        raise ValueError(f"Invalid currency: {currency!r}")
+    return Postback(
+        click_uuid=_identifier(payload, "click_id", "click_uuid"),
+        external_id=_identifier(payload, "conversion_id", "goal_id"),
+        amount=int(amount),
+        currency=currency,
+        status=status,
+        payload=payload,
+    )
+
+
+def _identifier(payload: dict[str, Any], *names: str) -> str | None:
+    value = next((payload[name] for name in names if payload.get(name)), None)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"Invalid {names[0]}: {value!r}")
+    return str(value)
+
+
+def receipt_key(postback: Postback) -> str:
+    """Idempotency key of a postback: the conversion it targets, its status and amount."""
+
+    subject = postback.external_id or f"click:{postback.click_uuid}"
+    raw = f"{subject}|{postback.status.value}|{postback.amount}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+class ReceiptCache:
+    """Receipt keys this process knows to be committed to ``postback_receipts``.
+
+    Only a front for the table: a miss falls through to the unique insert.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._keys: LRUCache[str, bool] = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def seen(self, key: str) -> bool:
+        if self._keys.get(key):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._keys[key] = True
+
+    def clear(self) -> None:
+        self._keys.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._keys),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+receipt_cache = ReceiptCache(settings.postback_receipt_cache_size)
+
+_CLAIMED = "postback_receipts"
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_receipts(session: Session) -> None:
+    receipt_cache.add(session.info.pop(_CLAIMED, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_receipts(session: Session) -> None:
+    session.info.pop(_CLAIMED, None)
 
 
 class ConversionService:
+    """Applies Saleads postbacks to conversions and the balance ledger.
+
+    Every applied postback claims a row in ``postback_receipts`` in the same
+    transaction as its ledger entries, so a replay (same conversion, status and
+    amount) can never write to the ledger twice. Replays are returned as
+    ``None``; once the claiming transaction has committed, ``receipt_cache``
+    answers them without a query.
+    """
+
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
         self.balance_service = BalanceService(session)
 
-    async def upsert(self, payload: dict[str, Any]) -> Conversion:
-        click_uuid = payload.get("click_id") or payload.get("click_uuid")
-        external_id = payload.get("conversion_id") or payload.get("goal_id")
-        amount = int(float(payload.get("amount") or payload.get("payout") or 0))
-        currency = payload.get("currency", "RUB")
-        status_raw = (payload.get("status") or "pending").lower()
-        try:
-            status = ConversionStatus(status_raw)
-        except ValueError:
-            status = ConversionStatus.PENDING
-        click = await self._find_click(click_uuid)
+    @property
+    def _claimed(self) -> set[str]:
+        # Moved into ``receipt_cache`` on commit, dropped on rollback.
+        return self.session.info.setdefault(_CLAIMED, set())
+
+    async def upsert(self, payload: dict[str, Any]) -> Conversion | None:
+        postback = parse_postback(payload)
+        key = receipt_key(postback)
+        if receipt_cache.seen(key):
+            return None
+        click = await self._find_click(postback.click_uuid)
         if not click:
             raise ValueError("Click not found for conversion")
-        conversion = await self._find_conversion(external_id, click.id)
+        if not await self._claim([key]):
+            return None
+        conversion = await self._find_conversion(postback.external_id, click.id)
+        return await self._apply(postback, click, conversion)
+
+    async def upsert_batch(self, payloads: Sequence[dict[str, Any]]) -> list[Conversion | ValueError | None]:
+        """Apply several postbacks in order with one ``IN`` lookup for their clicks,
+        one insert for their receipts and one lookup for their conversions.
+
+        Failed items come back as ``ValueError`` and replays as ``None``. Nothing
+        is committed here, so the caller decides the transaction size.
+        """
+
+        postbacks = [parse_postback(payload) for payload in payloads]
+        keys = [receipt_key(postback) for postback in postbacks]
+        replayed = [receipt_cache.seen(key) for key in keys]
+        fresh = [postback for postback, seen in zip(postbacks, replayed) if not seen]
+        clicks = await find_click_refs(self.session, {postback.click_uuid for postback in fresh if postback.click_uuid})
+        claimed = await self._claim(
+            dict.fromkeys(
+                key
+                for postback, key, seen in zip(postbacks, keys, replayed)
+                if not seen and postback.click_uuid in clicks
+            )
+        )
+        by_external, by_click = await self._conversions_for(
+            {postback.external_id for postback, key in zip(postbacks, keys) if key in claimed and postback.external_id},
+            {clicks[postback.click_uuid].id for postback, key in zip(postbacks, keys) if key in claimed},
+        )
+        results: list[Conversion | ValueError | None] = []
+        for postback, key, seen in zip(postbacks, keys, replayed):
+            if seen:
+                results.append(None)
+                continue
+            click = clicks.get(postback.click_uuid) if postback.click_uuid else None
+            if not click:
+                results.append(ValueError("Click not found for conversion"))
+                continue
+            if key not in claimed:
+                results.append(None)
+                continue
+            claimed.discard(key)  # a repeat later in the same batch is a replay too
+            if postback.external_id:
+                conversion = by_external.get(postback.external_id)
+            else:
+                conversion = by_click.get(click.id)
+            conversion = await self._apply(postback, click, conversion)
+            # Later postbacks in the batch must see conversions created above.
+            if conversion.external_id:
+                by_external[conversion.external_id] = conversion
+            by_click.setdefault(conversion.click_id, conversion)
+            results.append(conversion)
+        return results
+
+    async def _apply(self, postback: Postback, click: ClickRef, conversion: Conversion | None) -> Conversion:
         if not conversion:
             conversion = Conversion(
                 user_id=click.user_id,
                 offer_id=click.offer_id,
                 click_id=click.id,
-                external_id=external_id,
-                status=status,
-                amount_netto=amount,
-                currency=currency,
-                raw_payload=payload,
+                external_id=postback.external_id,
+                status=postback.status,
+                amount_netto=postback.amount,
+                currency=postback.currency,
+                raw_payload=postback.payload,
             )
             self.session.add(conversion)
             await self.session.flush()
             await self._handle_initial_status(conversion)
             return conversion
-        previous_status = conversion.status
-        conversion.status = status
-        conversion.amount_netto = amount
-        conversion.currency = currency
-        conversion.raw_payload = payload
-        await self._handle_transition(conversion, previous_status, status)
+        previous_status, previous_amount = conversion.status, conversion.amount_netto
+        conversion.status = postback.status
+        conversion.amount_netto = postback.amount
+        conversion.currency = postback.currency
+        conversion.raw_payload = postback.payload
+        await self._handle_transition(conversion, previous_status, previous_amount)
         await self.session.flush()
         return conversion
 
     async def _handle_initial_status(self, conversion: Conversion) -> None:
         if conversion.status == ConversionStatus.PENDING:
-            await self.balance_service.add_entry(
-                user_id=conversion.user_id,
-                entry_type=LedgerEntryType.ADJUST,
-                amount=conversion.amount_netto,
-                reference_type="conversion",
-                reference_id=str(conversion.id),
-                notes="pending_conversion",
-            )
+            await self._entry(conversion, LedgerEntryType.ADJUST, conversion.amount_netto, "pending_conversion")
         elif conversion.status == ConversionStatus.APPROVED:
-            await self.balance_service.add_entry(
-                user_id=conversion.user_id,
-                entry_type=LedgerEntryType.CREDIT,
-                amount=conversion.amount_netto,
-                reference_type="conversion",
-                reference_id=str(conversion.id),
-                notes="conversion_approved",
-            )
+            await self._entry(conversion, LedgerEntryType.CREDIT, conversion.amount_netto, "conversion_approved")
 
     async def _handle_transition(
         self,
         conversion: Conversion,
         previous: ConversionStatus,
-        current: ConversionStatus,
+        previous_amount: int,
     ) -> None:
+        current, amount = conversion.status, conversion.amount_netto
+        if previous == current and previous_amount == amount:
+            return
+        # What was held or credited is the previous amount, not the new one.
         if previous == ConversionStatus.PENDING:
-            await self.balance_service.add_entry(
-                user_id=conversion.user_id,
-                entry_type=LedgerEntryType.ADJUST,
-                amount=-conversion.amount_netto,
-                reference_type="conversion",
-                reference_id=str(conversion.id),
-                notes="pending_released",
-            )
-        if current == ConversionStatus.APPROVED:
-            await self.balance_service.add_entry(
-                user_id=conversion.user_id,
-                entry_type=LedgerEntryType.CREDIT,
-                amount=conversion.amount_netto,
-                reference_type="conversion",
-                reference_id=str(conversion.id),
-                notes="conversion_approved",
-            )
+            await self._entry(conversion, LedgerEntryType.ADJUST, -previous_amount, "pending_released")
+        if current == ConversionStatus.PENDING:
+            await self._entry(conversion, LedgerEntryType.ADJUST, amount, "pending_conversion")
+        elif current == ConversionStatus.APPROVED:
+            if previous == ConversionStatus.APPROVED:
+                await self._entry(conversion, LedgerEntryType.CREDIT, amount - previous_amount, "conversion_amount_changed")
+            else:
+                await self._entry(conversion, LedgerEntryType.CREDIT, amount, "conversion_approved")
+
+    async def _entry(self, conversion: Conversion, entry_type: LedgerEntryType, amount: int, notes: str) -> None:
+        await self.balance_service.add_entry(
+            user_id=conversion.user_id,
+            entry_type=entry_type,
+            amount=amount,
+            reference_type="conversion",
+            reference_id=str(conversion.id),
+            notes=notes,
+        )
+
+    async def _claim(self, keys: Iterable[str]) -> set[str]:
+        """Insert receipts for ``keys``; returns the ones that were not there yet."""
 
-    async def _find_click(self, saleads_click_id: str | None) -> Click | None:
+        keys = list(keys)
+        claimed: set[str] = set()
+        for batch in chunked(keys):
+            stmt = upsert_insert(self.session, PostbackReceipt).on_conflict_do_nothing()
+            stmt = stmt.returning(PostbackReceipt.key)
+            claimed.update((await self.session.execute(stmt, [{"key": key} for key in batch])).scalars())
+        # A conflicting receipt not claimed by this transaction is committed.
+        receipt_cache.add(key for key in keys if key not in claimed and key not in self._claimed)
+        self._claimed.update(claimed)
+        return claimed
+
+    async def _find_click(self, saleads_click_id: str | None) -> ClickRef | None:
         if not saleads_click_id:
             return None
-        stmt = select(Click).where(Click.saleads_click_id == saleads_click_id)
-        return (await self.session.execute(stmt)).scalar_one_or_none()
+        return (await find_click_refs(self.session, {saleads_click_id})).get(saleads_click_id)
+
+    async def _conversions_for(
+        self, external_ids: set[str], click_ids: set[int]
+    ) -> tuple[dict[str, Conversion], dict[int, Conversion]]:
+        by_external: dict[str, Conversion] = {}
+        by_click: dict[int, Conversion] = {}
+        for batch in chunked(sorted(external_ids)):
+            stmt = _conversion_select().where(Conversion.external_id.in_(batch))
+            by_external.update((item.external_id, item) for item in (await self.session.execute(stmt)).scalars())
+        for batch in chunked(sorted(click_ids)):
+            stmt = _conversion_select().where(Conversion.click_id.in_(batch)).order_by(Conversion.id)
+            for item in (await self.session.execute(stmt)).scalars():
+                by_click.setdefault(item.click_id, item)
+        return by_external, by_click
 
     async def _find_conversion(self, external_id: str | None, click_id: int) -> Conversion | None:
+        stmt = _conversion_select()
         if not external_id:
-            stmt = select(Conversion).where(Conversion.click_id == click_id)
+            stmt = stmt.where(Conversion.click_id == click_id)
         else:
-            stmt = select(Conversion).where(Conversion.external_id == external_id)
+            stmt = stmt.where(Conversion.external_id == external_id)
         return (await self.session.execute(stmt)).scalar_one_or_none()
 
 
-__all__ = ["ConversionService"]
+def _conversion_select():
+    # Only what the status transition reads; the rest is assigned blindly.
+    return select(Conversion).options(
+        load_only(
+            Conversion.user_id,
+            Conversion.click_id,
+            Conversion.external_id,
+            Conversion.status,
+            Conversion.amount_netto,
+        )
+    )
+
+
+__all__ = ["ConversionService", "Postback", "ReceiptCache", "parse_postback", "receipt_cache", "receipt_key"]
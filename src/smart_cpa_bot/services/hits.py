@@ -0,0 +1,167 @@
+"""Buffered recording of tracking-link openings."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import settings
+from ..models import Click, ClickHit, ClickStatus
+from .batching import chunked
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class HitEvent:
+    click_id: int
+    opened_at: datetime
+    ip_hash: str | None
+    user_agent: str | None
+
+
+def hash_ip(ip: str | None) -> str | None:
+    if not ip:
+        return None
+    key = settings.webhook_secret.encode("utf-8")[:64]
+    return hashlib.blake2b(ip.encode("utf-8"), key=key, digest_size=16).hexdigest()
+
+
+class HitRecorder:
+    """Collects redirect hits in a bounded in-process queue and writes them in batches.
+
+    ``record`` never waits: when the queue is full the event is dropped and
+    counted. The writer flushes after ``batch_size`` events or ``flush_interval``
+    seconds, whichever comes first, inserting the hits and moving their clicks
+    from SENT to OPENED in the same transaction.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        maxsize: int | None = None,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self._queue: asyncio.Queue[HitEvent] = asyncio.Queue(maxsize or settings.hit_queue_size)
+        self.batch_size = batch_size or settings.hit_flush_events
+        self.flush_interval = flush_interval or settings.hit_flush_ms / 1000
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        # Events taken off the queue by the writer but not written yet, and
+        # the write in progress; ``flush`` picks both up after a cancellation.
+        self._pending: list[HitEvent] = []
+        self._writing: asyncio.Future | None = None
+
+    def record(self, click_id: int, *, ip: str | None = None, user_agent: str | None = None) -> bool:
+        event = HitEvent(
+            click_id=click_id,
+            opened_at=datetime.now(timezone.utc),
+            ip_hash=hash_ip(ip),
+            user_agent=user_agent[:255] if user_agent else None,
+        )
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        return True
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "queue_capacity": self._queue.maxsize,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+        }
+
+    async def run_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._pending.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._pending = self._pending, []
+            # Shielded: cancelling the writer must not abort a half-done write.
+            self._writing = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._writing)
+
+    async def flush(self) -> int:
+        """Write everything not written yet (used on shutdown, after cancelling the writer)."""
+
+        if self._writing is not None and not self._writing.done():
+            await self._writing
+        batch, self._pending = self._pending, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        for chunk in chunked(batch, self.batch_size):
+            await self._write(chunk)
+        return len(batch)
+
+    async def _write(self, batch: list[HitEvent]) -> None:
+        started = time.perf_counter()
+        try:
+            async with self._session_factory() as session:
+                await session.execute(
+                    insert(ClickHit),
+                    [
+                        {
+                            "click_id": event.click_id,
+                            "opened_at": event.opened_at,
+                            "ip_hash": event.ip_hash,
+                            "user_agent": event.user_agent,
+                        }
+                        for event in batch
+                    ],
+                )
+                for click_ids in chunked(sorted({event.click_id for event in batch})):
+                    await session.execute(
+                        update(Click)
+                        .where(Click.id.in_(click_ids), Click.status == ClickStatus.SENT)
+                        .values(status=ClickStatus.OPENED)
+                        .execution_options(synchronize_session=False)
+                    )
+                await session.commit()
+        except Exception:  # pragma: no cover - losing hits must not stop the writer
+            self.failed += len(batch)
+            logger.exception("Failed to write %s click hit(s)", len(batch))
+            return
+        elapsed = time.perf_counter() - started
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+
+__all__ = ["HitEvent", "HitRecorder", "hash_ip"]
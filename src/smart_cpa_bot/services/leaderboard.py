@@ -2,46 +2,60 @@
 
 from __future__ import annotations
 
-from datetime import date
+import asyncio
+import hashlib
+import json
+import logging
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from enum import Enum
 
-from sqlalchemy import Select, case, func, select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from ..config import settings
-from ..models import BalanceLedger, LeaderboardSnapshot, LedgerEntryType, User
+from ..models import DailyScore, LeaderboardSnapshot, User, UserBalance
+from .balances import utc_today
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardWindow(str, Enum):
+    ALL = "all"
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+def window_start(window: LeaderboardWindow, today: date) -> date | None:
+    """First ``daily_scores`` day included in a window (calendar periods, UTC)."""
+
+    if window == LeaderboardWindow.DAY:
+        return today
+    if window == LeaderboardWindow.WEEK:
+        return today - timedelta(days=today.weekday())
+    if window == LeaderboardWindow.MONTH:
+        return today.replace(day=1)
+    return None
 
 
 class LeaderboardService:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
-    async def generate(self, *, limit: int | None = None) -> LeaderboardSnapshot:
+    async def generate(
+        self,
+        *,
+        limit: int | None = None,
+        window: LeaderboardWindow = LeaderboardWindow.ALL,
+    ) -> LeaderboardSnapshot:
         limit = limit or settings.leaderboard_size
-        score_expr = func.coalesce(
-            func.sum(
-                case(
-                    (BalanceLedger.type == LedgerEntryType.CREDIT, BalanceLedger.amount),
-                    (BalanceLedger.type == LedgerEntryType.DEBIT, -BalanceLedger.amount),
-                    (BalanceLedger.type == LedgerEntryType.LOCK, -BalanceLedger.amount),
-                    (BalanceLedger.type == LedgerEntryType.UNLOCK, BalanceLedger.amount),
-                    else_=0,
-                )
-            ),
-            0,
-        ).label("score")
-        stmt: Select = (
-            select(
-                User.id,
-                User.display_name,
-                score_expr,
-            )
-            .select_from(User)
-            .join(BalanceLedger, BalanceLedger.user_id == User.id, isouter=True)
-            .group_by(User.id)
-            .order_by(score_expr.desc())
-            .limit(limit)
-        )
-        rows = (await self.session.execute(stmt)).all()
+        start = window_start(window, utc_today())
+        if start is None:
+            rows = await self._top_scores(limit)
+        else:
+            rows = await self._window_scores(start, limit)
         payload = [
             {
                 "user_id": user_id,
@@ -50,14 +64,244 @@ class LeaderboardService:
             }
             for user_id, name, score in rows
         ]
-        snapshot = LeaderboardSnapshot(date=str(date.today()), payload=payload)
-        self.session.add(snapshot)
+        today = str(utc_today())
+        stmt = select(LeaderboardSnapshot).where(
+            LeaderboardSnapshot.window == window.value,
+            LeaderboardSnapshot.date == today,
+        )
+        snapshot = (await self.session.execute(stmt)).scalar_one_or_none()
+        if snapshot:
+            snapshot.payload = payload
+        else:
+            snapshot = LeaderboardSnapshot(window=window.value, date=today, payload=payload)
+            self.session.add(snapshot)
         await self.session.flush()
         return snapshot
 
-    async def latest(self) -> LeaderboardSnapshot | None:
-        stmt = select(LeaderboardSnapshot).order_by(LeaderboardSnapshot.id.desc()).limit(1)
+    async def _top_scores(self, limit: int) -> list[tuple[int, str, int]]:
+        # Scores are kept current in ``user_balances`` by BalanceService.add_entry,
+        # so the top of the board is a walk down the ``available`` index.
+        positive_stmt: Select = (
+            select(User.id, User.display_name, UserBalance.available)
+            .join(User, User.id == UserBalance.user_id)
+            .where(UserBalance.available > 0)
+            .order_by(UserBalance.available.desc(), UserBalance.user_id)
+            .limit(limit)
+        )
+        rows = list((await self.session.execute(positive_stmt)).all())
+        if len(rows) == limit:
+            return rows
+        # Not enough positive scores: the rest of the board is made of users
+        # with zero (or negative) scores, including those without any entries.
+        score_expr = func.coalesce(UserBalance.available, 0).label("score")
+        full_stmt: Select = (
+            select(User.id, User.display_name, score_expr)
+            .select_from(User)
+            .join(UserBalance, UserBalance.user_id == User.id, isouter=True)
+            .order_by(score_expr.desc(), User.id)
+            .limit(limit)
+        )
+        return list((await self.session.execute(full_stmt)).all())
+
+    async def _window_scores(self, start: date, limit: int) -> list[tuple[int, str, int]]:
+        # At most one bucket per user per day of the window is summed.
+        totals = (
+            select(DailyScore.user_id, func.sum(DailyScore.score).label("score"))
+            .where(DailyScore.day >= start)
+            .group_by(DailyScore.user_id)
+            .subquery()
+        )
+        stmt: Select = (
+            select(User.id, User.display_name, totals.c.score)
+            .join(totals, totals.c.user_id == User.id)
+            .order_by(totals.c.score.desc(), User.id)
+            .limit(limit)
+        )
+        return list((await self.session.execute(stmt)).all())
+
+    async def latest(self, window: LeaderboardWindow = LeaderboardWindow.ALL) -> LeaderboardSnapshot | None:
+        stmt = (
+            select(LeaderboardSnapshot)
+            .where(LeaderboardSnapshot.window == window.value)
+            .order_by(LeaderboardSnapshot.date.desc())
+            .limit(1)
+        )
         return (await self.session.execute(stmt)).scalar_one_or_none()
 
 
-__all__ = ["LeaderboardService"]
+@dataclass(frozen=True, slots=True)
+class EncodedLeaderboard:
+    body: bytes
+    etag: str
+
+
+def encode_payload(payload: list[dict] | None) -> EncodedLeaderboard:
+    body = json.dumps(payload or [], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    return EncodedLeaderboard(body=body, etag=etag)
+
+
+class LeaderboardRefresher:
+    """Regenerates the leaderboards on an interval and keeps the encoded responses."""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        interval: float | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self.interval = interval or settings.leaderboard_refresh_seconds
+        self._current: dict[LeaderboardWindow, EncodedLeaderboard] = {}
+        self._lock = asyncio.Lock()
+
+    def current(self, window: LeaderboardWindow = LeaderboardWindow.ALL) -> EncodedLeaderboard | None:
+        return self._current.get(window)
+
+    async def get(self, window: LeaderboardWindow = LeaderboardWindow.ALL) -> EncodedLeaderboard:
+        """Return the cached response, building it only if nothing is cached yet."""
+
+        if window not in self._current:
+            async with self._lock:
+                if window not in self._current:
+                    await self._refresh_locked()
+        return self._current[window]
+
+    async def refresh(self) -> dict[LeaderboardWindow, EncodedLeaderboard]:
+        async with self._lock:
+            return await self._refresh_locked()
+
+    async def _refresh_locked(self) -> dict[LeaderboardWindow, EncodedLeaderboard]:
+        fresh: dict[LeaderboardWindow, EncodedLeaderboard] = {}
+        async with self._session_factory() as session:
+            service = LeaderboardService(session)
+            for window in LeaderboardWindow:
+                snapshot = await service.generate(window=window)
+                fresh[window] = encode_payload(snapshot.payload)
+            await session.commit()
+        self._current = fresh
+        return fresh
+
+    async def run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception:  # pragma: no cover - keep serving the last good board
+                logger.exception("Leaderboard refresh failed")
+
+
+@dataclass(frozen=True, slots=True)
+class RankEntry:
+    rank: int
+    user_id: int
+    name: str
+    score: int
+
+    def as_dict(self) -> dict:
+        return {"rank": self.rank, "user_id": self.user_id, "name": self.name, "score": self.score}
+
+
+class RankIndex:
+    """All-time ranking of every user, kept in memory and tailed from the DB.
+
+    Keys are ``(-score, user_id)`` in a sorted list, which matches the order of
+    ``LeaderboardService.generate``: a rank lookup is a bisect and a page is a
+    slice. ``sync`` picks up users and ``user_balances`` rows changed since the
+    previous call, so writes made through ``BalanceService.add_entry`` in any
+    process show up on the next sync.
+    """
+
+    # Re-read rows touched slightly before the watermark: timestamps have
+    # second precision and transactions may commit after they were stamped.
+    overlap = timedelta(seconds=60)
+
+    def __init__(self) -> None:
+        self._keys: list[tuple[int, int]] = []
+        self._scores: dict[int, int] = {}
+        self._names: dict[int, str] = {}
+        self._watermark: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def update(self, user_id: int, name: str, score: int) -> None:
+        self._names[user_id] = name
+        previous = self._scores.get(user_id)
+        if previous == score:
+            return
+        if previous is not None:
+            del self._keys[bisect_left(self._keys, (-previous, user_id))]
+        insort(self._keys, (-score, user_id))
+        self._scores[user_id] = score
+
+    def rank(self, user_id: int) -> RankEntry | None:
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        position = bisect_left(self._keys, (-score, user_id))
+        return RankEntry(rank=position + 1, user_id=user_id, name=self._names[user_id], score=score)
+
+    def page(self, offset: int, limit: int) -> list[RankEntry]:
+        return [
+            RankEntry(rank=offset + index + 1, user_id=user_id, name=self._names[user_id], score=-negative)
+            for index, (negative, user_id) in enumerate(self._keys[offset : offset + limit])
+        ]
+
+    async def sync(self, session: AsyncSession) -> int:
+        """Apply users and balances changed since the last sync; returns rows read."""
+
+        since = self._watermark - self.overlap if self._watermark else None
+        score_expr = func.coalesce(UserBalance.available, 0)
+        users_stmt: Select = (
+            select(User.id, User.display_name, score_expr, User.updated_at)
+            .join(UserBalance, UserBalance.user_id == User.id, isouter=True)
+        )
+        balances_stmt: Select = (
+            select(User.id, User.display_name, UserBalance.available, UserBalance.updated_at)
+            .join(User, User.id == UserBalance.user_id)
+        )
+        if since is None:
+            statements = [users_stmt]
+        else:
+            statements = [
+                users_stmt.where(User.updated_at >= since),
+                balances_stmt.where(UserBalance.updated_at >= since),
+            ]
+        seen = 0
+        watermark = self._watermark
+        for stmt in statements:
+            for user_id, name, score, touched_at in (await session.execute(stmt)).all():
+                self.update(user_id, name or "", int(score))
+                seen += 1
+                if touched_at and (watermark is None or touched_at > watermark):
+                    watermark = touched_at
+        if since is None:
+            # Balance timestamps may be newer than any user row.
+            stmt = select(func.max(UserBalance.updated_at))
+            latest = (await session.execute(stmt)).scalar_one_or_none()
+            if latest and (watermark is None or latest > watermark):
+                watermark = latest
+        self._watermark = watermark
+        return seen
+
+    async def run_forever(self, session_factory: async_sessionmaker[AsyncSession], *, interval: float) -> None:
+        while True:
+            try:
+                async with session_factory() as session:
+                    await self.sync(session)
+            except Exception:  # pragma: no cover - keep the last good ranking
+                logger.exception("Leaderboard rank sync failed")
+            await asyncio.sleep(interval)
+
+
+__all__ = [
+    "LeaderboardService",
+    "RankIndex",
+    "RankEntry",
+    "LeaderboardWindow",
+    "window_start",
+    "LeaderboardRefresher",
+    "EncodedLeaderboard",
+    "encode_payload",
+]
@@ -2,113 +2,273 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Iterable, Sequence
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Sequence
 
-from sqlalchemy import delete, select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from ..config import settings
 from ..models import Offer, OfferLanding, OfferStatus, User
+from .batching import chunked, upsert_insert
+from .catalog import CatalogCache, OfferRecord, bump_catalog_version, catalog_cache
 from .saleads import SaleadsAPIClient, get_saleads_client
 
+logger = logging.getLogger(__name__)
+
+
+# Offers written per sync batch (one IN lookup and a few upsert statements each).
+OFFER_BATCH_SIZE = 500
+
+OFFER_COLUMNS = (
+    "title",
+    "category",
+    "min_age",
+    "max_age",
+    "geo_text",
+    "city_whitelist",
+    "payout_brutto",
+    "expected_score",
+    "features",
+    "schedule",
+    "metadata_json",
+    "content_hash",
+)
+
+
+def payload_digest(payload: dict) -> tuple[str, int]:
+    """Stable digest of an offer payload and the size of its JSON encoding."""
+
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest(), len(encoded)
+
+
+def offer_columns(external_uuid: str, payload: dict, content_hash: str | None = None) -> dict:
+    """Map a Saleads offer payload onto ``offers`` columns."""
+
+    limits = payload.get("limits") or {}
+    goals = payload.get("goals") or []
+    if isinstance(goals, dict):  # when API returns mapping keyed by goal id
+        top_goal = next(iter(goals.values()), {})
+    else:
+        top_goal = goals[0] if goals else {}
+    payout = int(top_goal.get("price") or top_goal.get("payout", 0))
+    return {
+        "external_uuid": external_uuid,
+        "title": payload.get("name") or "",
+        "category": payload.get("category") or payload.get("verticalName"),
+        "min_age": limits.get("ageMin") or limits.get("age", {}).get("min") or 18,
+        "max_age": limits.get("ageMax") or limits.get("age", {}).get("max"),
+        "geo_text": payload.get("geoText"),
+        "city_whitelist": payload.get("cities"),
+        "payout_brutto": payout,
+        "expected_score": int(payload.get("stats", {}).get("avgPrice", payout)),
+        "features": payload.get("features"),
+        "schedule": payload.get("schedule"),
+        "metadata_json": payload,
+        "content_hash": content_hash or payload_digest(payload)[0],
+    }
+
+
+def landing_columns(payload: dict) -> dict:
+    return {
+        "external_uuid": payload.get("uuid") or payload.get("landing_uuid"),
+        "url": payload.get("url") or payload.get("link") or "",
+        "title": payload.get("name") or payload.get("title"),
+        "geo": payload.get("geo"),
+    }
+
+
+def _landing_key(external_uuid: str | None, url: str) -> str:
+    return f"uuid:{external_uuid}" if external_uuid else f"url:{url}"
+
 
 @dataclass(slots=True)
-class OfferPresentation:
-    id: int
-    external_uuid: str
-    title: str
-    payout: int
-    description: str
-    landing_url: str | None
+class RowCounts:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+
+
+@dataclass(slots=True)
+class OfferSyncStats:
+    offers: RowCounts = field(default_factory=RowCounts)
+    landings: RowCounts = field(default_factory=RowCounts)
+    # JSON-encoded payload sizes of the offers written and skipped.
+    bytes_written: int = 0
+    bytes_skipped: int = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.offers.unchanged
+
+    @property
+    def changed(self) -> bool:
+        return any(
+            (counts.inserted, counts.updated, counts.removed) != (0, 0, 0)
+            for counts in (self.offers, self.landings)
+        )
+
+
+# Recommendations hand out the catalog snapshot's records as they are.
+OfferPresentation = OfferRecord
 
 
 class OfferService:
-    def __init__(self, session: AsyncSession, api_client: SaleadsAPIClient | None = None) -> None:
+    def __init__(
+        self,
+        session: AsyncSession,
+        api_client: SaleadsAPIClient | None = None,
+        *,
+        catalog: CatalogCache | None = None,
+    ) -> None:
         self.session = session
         self.api_client = api_client or get_saleads_client()
+        self.catalog = catalog or catalog_cache
+
+    async def sync_from_saleads(self) -> OfferSyncStats:
+        """Stream the Saleads catalog into ``offers``, writing each page as it arrives."""
+
+        stats = OfferSyncStats()
+        async for page in self.api_client.iter_offer_pages():
+            await self._sync_page(page, stats)
+        await self._finish_sync(stats)
+        return stats
+
+    async def sync_offers(self, payloads: Sequence[dict]) -> OfferSyncStats:
+        """Upsert Saleads offer payloads in batches and diff their landings.
+
+        Offers whose stored ``content_hash`` matches the payload digest are
+        skipped entirely, landings included, so a repeated poll costs one
+        hash comparison per offer.
+        """
+
+        stats = OfferSyncStats()
+        await self._sync_page(payloads, stats)
+        await self._finish_sync(stats)
+        return stats
 
-    async def sync_from_saleads(self, *, force: bool = False) -> None:
-        offers = await self.api_client.list_offers(force=force)
-        for payload in offers:
-            await self._upsert_offer(payload)
-
-    async def _upsert_offer(self, payload: dict) -> Offer:
-        external_uuid = payload.get("uuid") or payload.get("offer_uuid")
-        if not external_uuid:
-            raise ValueError("Saleads offer payload does not contain uuid")
-        stmt = select(Offer).where(Offer.external_uuid == external_uuid)
-        existing = (await self.session.execute(stmt)).scalar_one_or_none()
-        if existing:
-            offer = existing
-        else:
-            offer = Offer(external_uuid=external_uuid, title=payload.get("name", ""))
-            self.session.add(offer)
-
-        offer.title = payload.get("name") or offer.title
-        offer.category = payload.get("category") or payload.get("verticalName")
-        limits = payload.get("limits") or {}
-        offer.min_age = limits.get("ageMin") or limits.get("age", {}).get("min") or 18
-        offer.max_age = limits.get("ageMax") or limits.get("age", {}).get("max")
-        offer.geo_text = payload.get("geoText")
-        offer.city_whitelist = payload.get("cities")
-        goals = payload.get("goals") or []
-        if isinstance(goals, dict):  # when API returns mapping keyed by goal id
-            top_goal = next(iter(goals.values()), {})
-        else:
-            top_goal = goals[0] if goals else {}
-        offer.payout_brutto = int(top_goal.get("price") or top_goal.get("payout", 0))
-        offer.expected_score = int(payload.get("stats", {}).get("avgPrice", offer.payout_brutto))
-        offer.features = payload.get("features")
-        offer.schedule = payload.get("schedule")
-        offer.metadata_json = payload
-
-        await self.session.flush()
-        await self._sync_landings(offer, payload.get("landings") or [])
-        return offer
-
-    async def _sync_landings(self, offer: Offer, landings_payload: Iterable[dict]) -> None:
-        await self.session.execute(
-            delete(OfferLanding).where(OfferLanding.offer_id == offer.id)
+    async def _sync_page(self, payloads: Sequence[dict], stats: OfferSyncStats) -> None:
+        for batch in chunked(payloads, OFFER_BATCH_SIZE):
+            await self._sync_batch(batch, stats)
+
+    async def _finish_sync(self, stats: OfferSyncStats) -> None:
+        if stats.changed:
+            await bump_catalog_version(self.session)
+
+    async def _sync_batch(self, payloads: Sequence[dict], stats: OfferSyncStats) -> None:
+        incoming: dict[str, dict] = {}
+        for payload in payloads:
+            external_uuid = payload.get("uuid") or payload.get("offer_uuid")
+            if not external_uuid:
+                raise ValueError("Saleads offer payload does not contain uuid")
+            incoming[external_uuid] = payload
+
+        stmt = select(Offer.external_uuid, Offer.content_hash).where(
+            Offer.external_uuid.in_(list(incoming))
         )
-        for landing in landings_payload:
-            model = OfferLanding(
-                offer_id=offer.id,
-                external_uuid=landing.get("uuid") or landing.get("landing_uuid"),
-                url=landing.get("url") or landing.get("link") or "",
-                title=landing.get("name") or landing.get("title"),
-                geo=landing.get("geo"),
+        stored = dict((await self.session.execute(stmt)).all())
+
+        rows: list[dict] = []
+        for external_uuid, payload in incoming.items():
+            content_hash, size = payload_digest(payload)
+            if external_uuid not in stored:
+                stats.offers.inserted += 1
+            elif stored[external_uuid] == content_hash:
+                stats.offers.unchanged += 1
+                stats.bytes_skipped += size
+                continue
+            else:
+                stats.offers.updated += 1
+            stats.bytes_written += size
+            rows.append(offer_columns(external_uuid, payload, content_hash))
+        if not rows:
+            return
+
+        insert_stmt = upsert_insert(self.session, Offer)
+        insert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[Offer.external_uuid],
+            set_={
+                **{column: insert_stmt.excluded[column] for column in OFFER_COLUMNS},
+                # A payload without a name keeps the title we already have.
+                "title": func.coalesce(func.nullif(insert_stmt.excluded.title, ""), Offer.title),
+                "updated_at": func.now(),
+            },
+        ).returning(Offer.external_uuid, Offer.id)
+        result = await self.session.execute(
+            insert_stmt, [{**row, "status": OfferStatus.ACTIVE} for row in rows]
+        )
+        offer_ids = dict(result.all())
+
+        await self._sync_landings(
+            {offer_ids[row["external_uuid"]]: incoming[row["external_uuid"]].get("landings") or [] for row in rows},
+            stats.landings,
+        )
+
+    async def _sync_landings(self, landings_by_offer: dict[int, list[dict]], counts: RowCounts) -> None:
+        """Bring ``offer_landings`` in line with the payloads, keeping the ids of
+        landings that still exist (``Click.landing_id`` points at them)."""
+
+        existing: dict[int, list[OfferLanding]] = {}
+        for batch in chunked(list(landings_by_offer)):
+            stmt = select(OfferLanding).where(OfferLanding.offer_id.in_(batch)).order_by(OfferLanding.id)
+            for landing in (await self.session.execute(stmt)).scalars():
+                existing.setdefault(landing.offer_id, []).append(landing)
+
+        inserts: list[dict] = []
+        updates: list[dict] = []
+        removed: list[int] = []
+        for offer_id, payloads in landings_by_offer.items():
+            current: dict[str, list[OfferLanding]] = {}
+            for landing in existing.get(offer_id, []):
+                current.setdefault(_landing_key(landing.external_uuid, landing.url), []).append(landing)
+            for payload in payloads:
+                values = landing_columns(payload)
+                matches = current.get(_landing_key(values["external_uuid"], values["url"]))
+                if not matches:
+                    inserts.append({"offer_id": offer_id, **values})
+                    continue
+                landing = matches.pop(0)
+                if all(getattr(landing, column) == value for column, value in values.items()):
+                    counts.unchanged += 1
+                else:
+                    updates.append({"id": landing.id, **values})
+            removed.extend(landing.id for leftovers in current.values() for landing in leftovers)
+
+        if inserts:
+            await self.session.execute(insert(OfferLanding), inserts)
+        if updates:
+            await self.session.execute(update(OfferLanding), updates)
+        for batch in chunked(removed):
+            await self.session.execute(
+                delete(OfferLanding)
+                .where(OfferLanding.id.in_(batch))
+                .execution_options(synchronize_session=False)
             )
-            self.session.add(model)
-        await self.session.flush()
+        counts.inserted += len(inserts)
+        counts.updated += len(updates)
+        counts.removed += len(removed)
 
     async def get_personalized_offers(self, user: User, *, limit: int = 3) -> list[OfferPresentation]:
-        stmt = select(Offer).where(Offer.status == OfferStatus.ACTIVE)
-        offers = list((await self.session.execute(stmt)).scalars())
-        if not offers:
-            await self.sync_from_saleads(force=True)
-            offers = list((await self.session.execute(stmt)).scalars())
-        scored = [
-            (self._score_offer(offer, user), offer)
-            for offer in offers
-            if self._is_offer_allowed(offer, user)
-        ]
-        scored.sort(key=lambda item: item[0], reverse=True)
-        result: list[OfferPresentation] = []
-        for _, offer in scored[:limit]:
-            landing_url = offer.landings[0].url if offer.landings else None
-            result.append(
-                OfferPresentation(
-                    id=offer.id,
-                    external_uuid=offer.external_uuid,
-                    title=offer.title,
-                    payout=offer.payout_brutto,
-                    description=(offer.metadata_json or {}).get("offerDescription", ""),
-                    landing_url=landing_url,
-                )
-            )
-        return result
+        # The catalog is filled by OfferSyncScheduler; until the first sync
+        # lands an empty catalog simply yields no offers.
+        snapshot = await self.catalog.snapshot(self.session)
+        key = (*snapshot.index.profile_key(user.age, user.city), limit)
+        cached = self.catalog.recommendations.get(key)
+        if cached is None:
+            cached = tuple(snapshot.recommend(user.age, user.city, limit))
+            self.catalog.recommendations.put(key, cached)
+        return list(cached)
 
     def _is_offer_allowed(self, offer: Offer, user: User) -> bool:
+        """Reference eligibility check; ``OfferEligibilityIndex`` must agree with it."""
+
         if offer.min_age and user.age and user.age < offer.min_age:
             return False
         if offer.max_age and user.age and user.age > offer.max_age:
@@ -120,6 +280,8 @@ class OfferService:
         return True
 
     def _score_offer(self, offer: Offer, user: User) -> int:
+        """Reference scoring; ``OfferFeatures`` must rank offers the same way."""
+
         base = offer.expected_score or offer.payout_brutto
         bonus = 0
         if user.city and offer.geo_text and user.city.lower() in offer.geo_text.lower():
@@ -129,4 +291,77 @@ class OfferService:
         return base + bonus
 
 
-__all__ = ["OfferService", "OfferPresentation"]
+class OfferSyncScheduler:
+    """Pulls the Saleads catalog in the background so requests never wait on it.
+
+    Request paths keep reading whatever catalog version was committed last;
+    a sync that fails leaves it in place. Concurrent ``sync_once`` calls share
+    the sync already in progress instead of starting another one.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        api_client: SaleadsAPIClient | None = None,
+        interval: float | None = None,
+        catalog: CatalogCache | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self._api_client = api_client
+        self.catalog = catalog or catalog_cache
+        self.interval = interval or settings.offer_sync_seconds
+        self._running: asyncio.Task[OfferSyncStats] | None = None
+        self.last_stats: OfferSyncStats | None = None
+        self.last_synced_at: float | None = None
+
+    async def sync_once(self) -> OfferSyncStats:
+        if self._running is None:
+            self._running = asyncio.create_task(self._sync())
+            self._running.add_done_callback(self._clear)
+        # Shielded so a cancelled caller does not abort a sync others wait on.
+        return await asyncio.shield(self._running)
+
+    def _clear(self, task: asyncio.Task) -> None:
+        if self._running is task:
+            self._running = None
+
+    async def _sync(self) -> OfferSyncStats:
+        started = time.perf_counter()
+        async with self._session_factory() as session:
+            stats = await OfferService(session, self._api_client, catalog=self.catalog).sync_from_saleads()
+            await session.commit()
+            if stats.changed or self.catalog.current is None:
+                # Requests keep the previous snapshot until this one is built.
+                await self.catalog.refresh(session)
+        self.last_stats = stats
+        self.last_synced_at = time.time()
+        logger.info(
+            "Offer sync in %.1fs: %s inserted, %s updated, %s skipped",
+            time.perf_counter() - started,
+            stats.offers.inserted,
+            stats.offers.updated,
+            stats.skipped,
+        )
+        # The cache lives in this process, so its counters are only visible here.
+        self.catalog.recommendations.log_stats("so far")
+        return stats
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.sync_once()
+            except Exception:  # pragma: no cover - keep serving the last good catalog
+                logger.exception("Offer sync failed")
+            await asyncio.sleep(self.interval)
+
+    async def close(self) -> None:
+        """Cancel the sync in progress, if any, and wait until it has unwound."""
+
+        running = self._running
+        if running is not None:
+            running.cancel()
+            await asyncio.gather(running, return_exceptions=True)
+
+
+__all__ = ["OfferService", "OfferSyncScheduler", "OfferPresentation", "OfferSyncStats", "RowCounts", "offer_columns", "payload_digest"]
@@ -0,0 +1,166 @@
+"""Durable inbox and batch worker for Saleads postbacks."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Sequence
+
+from sqlalchemy import Row, Select, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import settings
+from ..models import PostbackInbox
+from .conversions import ConversionService
+
+logger = logging.getLogger(__name__)
+
+
+async def enqueue_postback(session: AsyncSession, payload: dict[str, Any]) -> PostbackInbox:
+    item = PostbackInbox(payload=payload)
+    session.add(item)
+    await session.flush()
+    return item
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class PostbackWorker:
+    """Applies queued postbacks in batches, one transaction per batch.
+
+    Clicks and conversions for a batch are looked up with ``IN`` queries by
+    ``ConversionService.upsert_batch``. A postback whose click is not known yet
+    (its registration may still be completing) is retried up to
+    ``max_attempts`` times, waiting ``retry_delay`` seconds after the first
+    failure and twice as long after each next one. Replays are marked processed
+    without touching the ledger. If a batch fails as a whole it is replayed one
+    postback per transaction so a single bad payload cannot block the rest.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        batch_size: int | None = None,
+        interval: float | None = None,
+        max_attempts: int = 5,
+        retry_delay: float | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self.batch_size = batch_size or settings.postback_batch_size
+        self.interval = interval or settings.postback_poll_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = settings.postback_retry_seconds if retry_delay is None else retry_delay
+        self.processed = 0
+        self.replays = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+        self.lag_seconds = 0.0
+
+    def stats(self) -> dict:
+        rate = self.last_batch_size / self.last_batch_seconds if self.last_batch_seconds else 0.0
+        return {
+            "processed": self.processed,
+            "replays": self.replays,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_seconds * 1000, 2),
+            "throughput_per_second": round(rate, 1),
+            "lag_seconds": round(self.lag_seconds, 3),
+        }
+
+    async def run_once(self) -> int:
+        """Apply the oldest pending postbacks; returns how many were picked up."""
+
+        started = time.perf_counter()
+        async with self._session_factory() as session:
+            stmt: Select = (
+                select(PostbackInbox.id, PostbackInbox.payload, PostbackInbox.attempts, PostbackInbox.created_at)
+                .where(
+                    PostbackInbox.processed_at.is_(None),
+                    or_(PostbackInbox.next_attempt_at.is_(None), PostbackInbox.next_attempt_at <= _utcnow()),
+                )
+                .order_by(PostbackInbox.id)
+                .limit(self.batch_size)
+            )
+            rows = (await session.execute(stmt)).all()
+            self.lag_seconds = self._lag(rows[0].created_at) if rows else 0.0
+            if not rows:
+                return 0
+            try:
+                results = await ConversionService(session).upsert_batch([row.payload for row in rows])
+                await self._settle(session, rows, results)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                logger.exception("Postback batch of %s failed; applying one by one", len(rows))
+                await self._apply_individually(rows)
+        self.batches += 1
+        self.last_batch_size = len(rows)
+        self.last_batch_seconds = time.perf_counter() - started
+        return len(rows)
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                picked = await self.run_once()
+            except Exception:  # pragma: no cover - keep draining on the next tick
+                logger.exception("Postback worker iteration failed")
+                picked = 0
+            if picked < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+    async def _settle(self, session: AsyncSession, rows: Sequence[Row], results: Sequence[Any]) -> None:
+        now = _utcnow()
+        changes = []
+        for row, result in zip(rows, results):
+            if not isinstance(result, Exception):
+                changes.append({"id": row.id, "processed_at": now, "attempts": row.attempts + 1, "error": None})
+                self.processed += 1
+                self.replays += result is None
+            elif row.attempts + 1 < self.max_attempts:
+                delay = timedelta(seconds=self.retry_delay * 2**row.attempts)
+                changes.append(
+                    {"id": row.id, "attempts": row.attempts + 1, "error": str(result), "next_attempt_at": now + delay}
+                )
+                self.retried += 1
+            else:
+                changes.append({"id": row.id, "processed_at": now, "attempts": row.attempts + 1, "error": str(result)})
+                self.failed += 1
+        await session.execute(update(PostbackInbox), changes)
+
+    async def _apply_individually(self, rows: Sequence[Row]) -> None:
+        for row in rows:
+            async with self._session_factory() as session:
+                try:
+                    [result] = await ConversionService(session).upsert_batch([row.payload])
+                except Exception as exc:  # a payload the service cannot handle
+                    await session.rollback()
+                    result = exc
+                await self._settle(session, [row], [result])
+                await session.commit()
+
+    @staticmethod
+    def _lag(received_at: datetime | None) -> float:
+        if received_at is None:
+            return 0.0
+        if received_at.tzinfo is None:  # SQLite hands back naive UTC timestamps
+            received_at = received_at.replace(tzinfo=timezone.utc)
+        return max((_utcnow() - received_at).total_seconds(), 0.0)
+
+
+async def pending_postbacks(session: AsyncSession) -> int:
+    stmt = select(func.count(PostbackInbox.id)).where(PostbackInbox.processed_at.is_(None))
+    return (await session.execute(stmt)).scalar_one()
+
+
+__all__ = ["PostbackWorker", "enqueue_postback", "pending_postbacks"]
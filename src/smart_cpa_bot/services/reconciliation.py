@@ -0,0 +1,176 @@
+"""Reconcile conversion statuses with the Saleads API."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import settings
+from ..models import Conversion, ConversionStatus, SyncState
+from .batching import chunked, upsert_insert
+from .clicks import find_click_refs
+from .conversions import ConversionService
+from .saleads import SaleadsAPIClient, get_saleads_client
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CURSOR_KEY = "conversions.reconciled_until"
+
+# Values of the Saleads ``conversion-statuses`` dictionary.
+SALEADS_CONVERSION_STATUSES = {
+    3: ConversionStatus.PENDING,  # на модерации
+    0: ConversionStatus.HOLD,  # в холде
+    1: ConversionStatus.APPROVED,  # начислено
+    -1: ConversionStatus.REJECTED,  # отклонено
+}
+
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def conversion_postback(item: dict[str, Any]) -> dict[str, Any] | None:
+    """Translate a Saleads conversion into the payload a postback would carry."""
+
+    status = SALEADS_CONVERSION_STATUSES.get(item.get("status"))
+    if status is None or not item.get("uuid") or not item.get("click_uuid"):
+        return None
+    goal = item.get("goal") or {}
+    return {
+        "click_id": item["click_uuid"],
+        "conversion_id": item["uuid"],
+        "amount": goal.get("price") or 0,
+        "currency": goal.get("currency") or "RUB",
+        "status": status.value,
+    }
+
+
+@dataclass(slots=True)
+class ReconcileStats:
+    fetched: int = 0
+    unknown_clicks: int = 0
+    unchanged: int = 0
+    applied: int = 0
+    failed: int = 0
+    batches: int = 0
+
+
+class ConversionReconciler:
+    """Pulls conversion statuses from Saleads and applies the ones that changed.
+
+    Saleads filters its listing by click time only, so each run reads clicks
+    made since ``lookback`` before the previous run's cursor, which covers the
+    hold period in which statuses still move. Clicks are resolved through
+    ``click_refs`` (one ``IN`` query per batch for the misses), conversions
+    whose status and amount already match are dropped, and the rest go through
+    ``ConversionService.upsert_batch`` in one transaction per batch. The cursor
+    is stored in ``sync_state`` once the whole window has been applied.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        api_client: SaleadsAPIClient | None = None,
+        batch_size: int | None = None,
+        lookback: timedelta | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self.api_client = api_client or get_saleads_client()
+        self.batch_size = batch_size or settings.conversion_reconcile_batch_size
+        self.lookback = lookback or timedelta(days=settings.conversion_reconcile_lookback_days)
+        self.last_stats: ReconcileStats | None = None
+
+    async def run_once(self, *, now: datetime | None = None) -> ReconcileStats:
+        now = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+        async with self._session_factory() as session:
+            cursor = await self._cursor(session)
+        filters = {
+            "dateFrom": ((cursor or now) - self.lookback).strftime(_DATE_FORMAT),
+            "dateTo": now.strftime(_DATE_FORMAT),
+            "conversionStatuses[]": list(SALEADS_CONVERSION_STATUSES),
+        }
+        stats = ReconcileStats()
+        batch: list[dict[str, Any]] = []
+        async for page in self.api_client.iter_conversion_pages(**filters):
+            stats.fetched += len(page)
+            batch.extend(filter(None, map(conversion_postback, page)))
+            while len(batch) >= self.batch_size:
+                await self._apply(batch[: self.batch_size], stats)
+                del batch[: self.batch_size]
+        if batch:
+            await self._apply(batch, stats)
+        async with self._session_factory() as session:
+            await self._save_cursor(session, now)
+            await session.commit()
+        self.last_stats = stats
+        logger.info(
+            "Reconciled %s conversion(s) from %s: %s applied, %s unchanged, %s for unknown clicks, %s failed",
+            stats.fetched,
+            filters["dateFrom"],
+            stats.applied,
+            stats.unchanged,
+            stats.unknown_clicks,
+            stats.failed,
+        )
+        return stats
+
+    async def run_forever(self, *, interval: float | None = None) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:  # pragma: no cover - retry the same window next time
+                logger.exception("Conversion reconciliation failed")
+            await asyncio.sleep(interval or settings.conversion_reconcile_seconds)
+
+    async def _apply(self, postbacks: Sequence[dict[str, Any]], stats: ReconcileStats) -> None:
+        async with self._session_factory() as session:
+            known = await find_click_refs(session, {postback["click_id"] for postback in postbacks})
+            ours = [postback for postback in postbacks if postback["click_id"] in known]
+            current = await _current_states(session, {postback["conversion_id"] for postback in ours})
+            changed = [
+                postback
+                for postback in ours
+                if current.get(postback["conversion_id"]) != (postback["status"], int(float(postback["amount"])))
+            ]
+            stats.unknown_clicks += len(postbacks) - len(ours)
+            stats.unchanged += len(ours) - len(changed)
+            stats.batches += 1
+            results = await ConversionService(session).upsert_batch(changed) if changed else []
+            await session.commit()  # also lets click_refs keep the clicks read above
+        stats.failed += sum(isinstance(result, Exception) for result in results)
+        stats.applied += sum(result is not None and not isinstance(result, Exception) for result in results)
+
+    async def _cursor(self, session: AsyncSession) -> datetime | None:
+        stmt = select(SyncState.value).where(SyncState.key == RECONCILE_CURSOR_KEY)
+        value = (await session.execute(stmt)).scalar_one_or_none()
+        return datetime.fromisoformat(value) if value else None
+
+    async def _save_cursor(self, session: AsyncSession, value: datetime) -> None:
+        stmt = upsert_insert(session, SyncState).values(key=RECONCILE_CURSOR_KEY, value=value.isoformat())
+        stmt = stmt.on_conflict_do_update(index_elements=[SyncState.key], set_={"value": stmt.excluded.value})
+        await session.execute(stmt)
+
+
+async def _current_states(session: AsyncSession, external_ids: set[str]) -> dict[str, tuple[str, int]]:
+    states: dict[str, tuple[str, int]] = {}
+    for batch in chunked(sorted(external_ids)):
+        stmt = select(Conversion.external_id, Conversion.status, Conversion.amount_netto).where(
+            Conversion.external_id.in_(batch)
+        )
+        states.update(
+            (external_id, (status.value, amount)) for external_id, status, amount in (await session.execute(stmt)).all()
+        )
+    return states
+
+
+__all__ = [
+    "ConversionReconciler",
+    "ReconcileStats",
+    "SALEADS_CONVERSION_STATUSES",
+    "conversion_postback",
+]
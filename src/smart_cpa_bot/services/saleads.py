@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any, Dict, Iterable
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterable
 
 import httpx
 from cachetools import TTLCache
@@ -28,6 +30,7 @@ class SaleadsAPIClient:
         config: SaleadsConfig | None = None,
         *,
         timeout: float = 15.0,
+        transport: httpx.AsyncBaseTransport | None = None,
     ) -> None:
         self._config = config or settings.saleads
         headers = {
@@ -38,6 +41,7 @@ class SaleadsAPIClient:
             base_url=self._config.base_url,
             headers=headers,
             timeout=timeout,
+            transport=transport,
         )
         self._offers_cache: TTLCache[str, list[dict[str, Any]]] = TTLCache(maxsize=1, ttl=300)
 
@@ -51,21 +55,84 @@ class SaleadsAPIClient:
             raise SaleadsAPIError(response.text)
         return response.json()
 
-    async def list_offers(self, *, limit: int = 200, force: bool = False, **filters: Any) -> list[dict[str, Any]]:
-        """Fetch and cache active offers."""
+    async def list_offers(self, *, force: bool = False, **filters: Any) -> list[dict[str, Any]]:
+        """Fetch and cache the whole offer catalog."""
 
         cache_key = "offers"
         if not force and cache_key in self._offers_cache:
             return self._offers_cache[cache_key]
 
-        params = {"limit": limit, "offset": 0} | filters
-        data = await self._request("GET", "/offer", params=params)
-        offers = data.get("data") if isinstance(data, dict) else data
-        if not isinstance(offers, list):
-            offers = []
+        offers: list[dict[str, Any]] = []
+        async for page in self.iter_offer_pages(**filters):
+            offers.extend(page)
         self._offers_cache[cache_key] = offers
         return offers
 
+    async def _page(
+        self, path: str, offset: int, limit: int, filters: dict[str, Any]
+    ) -> tuple[list[dict[str, Any]], int | None]:
+        params = {"limit": limit, "offset": offset} | filters
+        data = await self._request("GET", path, params=params)
+        items = data.get("data") if isinstance(data, dict) else data
+        total = data.get("count") if isinstance(data, dict) else None
+        return (items if isinstance(items, list) else []), total
+
+    async def iter_offer_pages(
+        self,
+        *,
+        page_size: int | None = None,
+        concurrency: int | None = None,
+        **filters: Any,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Yield the offer catalog page by page, in offset order."""
+
+        async for page in self._iter_pages("/offer", page_size, concurrency, filters):
+            yield page
+
+    async def _iter_pages(
+        self,
+        path: str,
+        page_size: int | None,
+        concurrency: int | None,
+        filters: dict[str, Any],
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Yield a paginated listing page by page, in offset order.
+
+        The first page tells how many items there are; the remaining pages are
+        requested with at most ``concurrency`` requests in flight, so no more
+        than that many pages are held at once. Without a ``count`` in the
+        response, pages are read one after another until a short page.
+        """
+
+        limit = page_size or self._config.page_size
+        window = concurrency or self._config.page_concurrency
+        page, total = await self._page(path, 0, limit, filters)
+        yield page
+        if total is None:
+            offset = limit
+            while len(page) == limit:
+                page, _ = await self._page(path, offset, limit, filters)
+                yield page
+                offset += limit
+            return
+
+        offsets = iter(range(limit, total, limit))
+        in_flight: deque[asyncio.Task] = deque()
+        try:
+            for offset in offsets:
+                in_flight.append(asyncio.create_task(self._page(path, offset, limit, filters)))
+                if len(in_flight) >= window:
+                    break
+            while in_flight:
+                page, _ = await in_flight.popleft()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    in_flight.append(asyncio.create_task(self._page(path, next_offset, limit, filters)))
+                yield page
+        finally:
+            for task in in_flight:
+                task.cancel()
+
     async def get_offer(self, offer_uuid: str) -> dict[str, Any]:
         return await self._request("GET", f"/offer/{offer_uuid}")
 
@@ -91,9 +158,31 @@ class SaleadsAPIClient:
         data = await self._request("GET", "/click", params=filters)
         return data.get("data", data)
 
+    async def iter_conversion_pages(
+        self,
+        *,
+        page_size: int | None = None,
+        concurrency: int | None = None,
+        **filters: Any,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Yield the conversions of the clicks matching ``filters``, one click page at a time.
+
+        The API has no conversion listing of its own: conversions come embedded
+        in ``/click`` items, and ``dateFrom``/``dateTo`` filter on the click time.
+        """
+
+        async for page in self._iter_pages("/click", page_size, concurrency, filters):
+            yield [
+                conversion | {"click_uuid": conversion.get("click_uuid") or click.get("uuid")}
+                for click in page
+                for conversion in click.get("conversions") or ()
+            ]
+
     async def list_conversions(self, **filters: Any) -> list[dict[str, Any]]:
-        data = await self._request("GET", "/conversion", params=filters)
-        return data.get("data", data)
+        conversions: list[dict[str, Any]] = []
+        async for page in self.iter_conversion_pages(**filters):
+            conversions.extend(page)
+        return conversions
 
     async def get_dictionaries(self, dict_names: Iterable[str]) -> dict[str, Any]:
         result: dict[str, Any] = {}
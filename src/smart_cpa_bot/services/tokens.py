@@ -0,0 +1,65 @@
+"""Signed tracking-link tokens that carry their own redirect target."""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import hmac
+from dataclasses import dataclass
+
+from ..config import settings
+
+# ``shortuuid`` tokens never contain a dot, so a dotted token is a signed one.
+SEPARATOR = "."
+SIGNATURE_BYTES = 16
+
+
+@dataclass(frozen=True, slots=True)
+class SignedClick:
+    click_id: int
+    target_url: str
+
+
+def click_token_secret() -> str | None:
+    secret = settings.click_token_secret
+    return secret.get_secret_value() or None if secret else None
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(secret: str, message: str) -> bytes:
+    return hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def sign_click_token(click_id: int, target_url: str, secret: str) -> str:
+    """``<click id>.<base64url target>.<base64url HMAC-SHA256 prefix>``."""
+
+    message = f"{click_id}{SEPARATOR}{_b64encode(target_url.encode('utf-8'))}"
+    return f"{message}{SEPARATOR}{_b64encode(_signature(secret, message))}"
+
+
+def is_signed_token(token: str) -> bool:
+    return SEPARATOR in token
+
+
+def read_click_token(token: str, secret: str) -> SignedClick | None:
+    """Decode a signed token; ``None`` if it is malformed or the signature is wrong."""
+
+    try:
+        click_id, encoded_target, encoded_signature = token.split(SEPARATOR)
+        message = f"{click_id}{SEPARATOR}{encoded_target}"
+        if not hmac.compare_digest(_b64decode(encoded_signature), _signature(secret, message)):
+            return None
+        return SignedClick(click_id=int(click_id), target_url=_b64decode(encoded_target).decode("utf-8"))
+    except (ValueError, binascii.Error):
+        return None
+
+
+__all__ = ["SignedClick", "click_token_secret", "is_signed_token", "read_click_token", "sign_click_token"]
@@ -14,7 +14,7 @@ from aiogram.filters.callback_data import CallbackData
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...config import settings
-from ...models import Offer
+from ...db import SessionFactory
 from ...services.clicks import ClickService
 from ...services.conversation import ConversationResponse, ConversationService
 from ...services.llm import LLMService
@@ -208,22 +208,15 @@ async def _deliver_offers(
     user_id: int,
     base_text: str,
 ) -> str:
-    click_service = ClickService(session)
+    click_service = ClickService(session, session_factory=SessionFactory)
+    clicks = await click_service.create_clicks(user_id=user_id, offers=response.offers, slot="primary")
     recommendation_items = []
-    for presentation in response.offers:
-        offer = await session.get(Offer, presentation.id)
-        if not offer:
-            continue
-        click, tracking_link = await click_service.create_click(
-            user_id=user_id,
-            offer=offer,
-            slot="primary",
-        )
+    for offer, (click, tracking_link) in zip(response.offers, clicks):
         recommendation_items.append(
             {
                 "offer_id": offer.id,
                 "title": offer.title,
-                "payout": presentation.payout,
+                "payout": offer.payout,
                 "tracking_link": tracking_link,
                 "click_id": click.id,
             }
@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from smart_cpa_bot.config import SaleadsConfig
+from smart_cpa_bot.models import Base
+from smart_cpa_bot.services.clicks import click_refs
+from smart_cpa_bot.services.conversions import receipt_cache
+from smart_cpa_bot.services.saleads import SaleadsAPIClient
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # Both mirror rows of the previous test's database.
+    receipt_cache.clear()
+    click_refs.clear()
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session(session_factory):
+    async with session_factory() as session:
+        yield session
+
+
+class MockSaleads:
+    """In-process stand-in for a paginated Saleads listing (``/offer``, ``/click``)."""
+
+    def __init__(self, offers: list[dict], *, latency: float = 0.0) -> None:
+        self.offers = offers
+        self.latency = latency
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.last_params: httpx.QueryParams | None = None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.last_params = request.url.params
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            offset = int(request.url.params.get("offset", 0))
+            limit = int(request.url.params.get("limit", 1000))
+            data = self.offers[offset : offset + limit]
+            return httpx.Response(
+                200,
+                json={"offset": offset, "limit": limit, "count": len(self.offers), "data": data},
+            )
+        finally:
+            self.in_flight -= 1
+
+    def client(self, **config) -> SaleadsAPIClient:
+        return SaleadsAPIClient(
+            SaleadsConfig(base_url="https://saleads.test/api/v1", **config),
+            transport=httpx.MockTransport(self.handle),
+        )
+
+
+@pytest.fixture
+def mock_saleads() -> type[MockSaleads]:
+    """``mock_saleads(offers, latency=...)`` builds a ``MockSaleads`` listing."""
+
+    return MockSaleads
@@ -0,0 +1,160 @@
+import json
+
+import httpx
+import pytest
+import pytest_asyncio
+from pydantic import SecretStr
+from sqlalchemy import select
+
+from smart_cpa_bot.api import server
+from smart_cpa_bot.config import settings
+from smart_cpa_bot.db import get_session
+from smart_cpa_bot.models import LedgerEntryType, PostbackInbox
+from smart_cpa_bot.services.balances import BalanceService
+from smart_cpa_bot.services.hits import HitRecorder
+from smart_cpa_bot.services.leaderboard import LeaderboardRefresher, RankIndex
+from smart_cpa_bot.services.tokens import sign_click_token
+from smart_cpa_bot.services.users import UserService
+
+HEADERS = {"X-Webhook-Secret": settings.webhook_secret}
+
+
+@pytest_asyncio.fixture
+async def api(session_factory, monkeypatch):
+    async def test_session():
+        async with session_factory() as session:
+            yield session
+
+    monkeypatch.setattr(server, "SessionFactory", session_factory)
+    monkeypatch.setattr(server, "hit_recorder", HitRecorder(session_factory))
+    monkeypatch.setattr(server, "leaderboard_refresher", LeaderboardRefresher(session_factory, interval=60))
+    monkeypatch.setattr(server, "rank_index", RankIndex())
+    server.app.dependency_overrides[get_session] = test_session
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api.test") as client:
+        yield client
+    server.app.dependency_overrides.clear()
+
+
+async def _seed_users(session_factory, scores):
+    async with session_factory() as session:
+        users = []
+        for index, score in enumerate(scores):
+            user = await UserService(session).get_or_create(
+                telegram_id=index + 1, username=None, first_name=f"Player {index}", last_name=None
+            )
+            await BalanceService(session).add_entry(user_id=user.id, entry_type=LedgerEntryType.CREDIT, amount=score)
+            users.append(user)
+        await session.commit()
+    return users
+
+
+@pytest.mark.asyncio
+async def test_queued_postback_is_accepted_with_202(api, session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "postback_queue", True)
+    payload = {"click_id": "sc-1", "conversion_id": "c-1", "amount": "150"}
+
+    response = await api.post("/webhooks/saleads/postback", json=payload, headers=HEADERS)
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    async with session_factory() as session:
+        item = await session.get(PostbackInbox, response.json()["inbox_id"])
+        assert item.payload == payload and item.processed_at is None
+
+    bad_amount = await api.post("/webhooks/saleads/postback", json=payload | {"amount": "n/a"}, headers=HEADERS)
+    assert bad_amount.status_code == 400
+    no_click = await api.post("/webhooks/saleads/postback", json={"amount": "1"}, headers=HEADERS)
+    assert no_click.status_code == 400
+    wrong_secret = await api.post("/webhooks/saleads/postback", json=payload, headers={"X-Webhook-Secret": "x"})
+    assert wrong_secret.status_code == 403
+    async with session_factory() as session:
+        assert len((await session.execute(select(PostbackInbox.id))).all()) == 1
+
+
+MALFORMED_POSTBACKS = [
+    {"click_id": "sc-1", "conversion_id": "c-1", "status": 3},
+    {"click_id": "sc-1", "conversion_id": "c-1", "amount": "1e400"},
+    {"click_id": "sc-1", "conversion_id": "c-1", "amount": "nan"},
+    {"click_id": ["sc-1"], "conversion_id": "c-1"},
+    [{"click_id": "sc-1", "conversion_id": "c-1"}],
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("queue", [True, False])
+@pytest.mark.parametrize("payload", MALFORMED_POSTBACKS)
+async def test_malformed_postbacks_are_rejected_with_400(api, session_factory, monkeypatch, queue, payload):
+    monkeypatch.setattr(settings, "postback_queue", queue)
+
+    response = await api.post("/webhooks/saleads/postback", json=payload, headers=HEADERS)
+    assert response.status_code == 400
+    async with session_factory() as session:
+        assert (await session.execute(select(PostbackInbox.id))).first() is None
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_is_served_with_etag(api, session_factory):
+    users = await _seed_users(session_factory, [100, 300, 200])
+
+    response = await api.get("/leaderboard")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+    assert [item["user_id"] for item in response.json()] == [users[1].id, users[2].id, users[0].id]
+
+    cached = await api.get("/leaderboard", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag and not cached.content
+    stale = await api.get("/leaderboard", headers={"If-None-Match": '"other"'})
+    assert stale.status_code == 200
+
+    week = await api.get("/leaderboard", params={"window": "week"})
+    assert week.status_code == 200 and week.headers["etag"]
+    assert [item["score"] for item in json.loads(week.content)] == [300, 200, 100]
+    assert (await api.get("/leaderboard", params={"window": "year"})).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_signed_click_links_redirect_without_lookup(api, monkeypatch):
+    monkeypatch.setattr(settings, "click_token_secret", SecretStr("link-secret"))
+    token = sign_click_token(42, "https://partner.example/x?sub=1", "link-secret")
+
+    response = await api.get(f"/r/{token}")
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://partner.example/x?sub=1"
+    assert server.hit_recorder.recorded == 1
+
+    click_id, target, signature = token.split(".")
+    tampered = ".".join([click_id, sign_click_token(42, "https://evil.example", "link-secret").split(".")[1], signature])
+    assert (await api.get(f"/r/{tampered}")).status_code == 404
+    assert (await api.get(f"/r/43.{target}.{signature}")).status_code == 404
+    assert (await api.get(f"/r/{sign_click_token(42, 'https://partner.example/x', 'other')}")).status_code == 404
+
+    monkeypatch.setattr(settings, "click_token_secret", None)
+    assert (await api.get(f"/r/{token}")).status_code == 404
+    assert server.hit_recorder.recorded == 1
+
+
+@pytest.mark.asyncio
+async def test_rank_lookup_and_pages(api, session_factory):
+    users = await _seed_users(session_factory, [100, 300, 200, 50])
+    async with session_factory() as session:
+        await server.rank_index.sync(session)
+
+    rank = await api.get(f"/leaderboard/rank/{users[2].id}")
+    assert rank.status_code == 200
+    assert rank.json() == {"rank": 2, "user_id": users[2].id, "name": "Player 2", "score": 200, "total": 4}
+    missing = await api.get("/leaderboard/rank/999")
+    assert missing.status_code == 404 and missing.json()["detail"] == "User not ranked"
+
+    page = await api.get("/leaderboard", params={"offset": 1, "limit": 2})
+    assert page.status_code == 200
+    assert page.json()["total"] == 4
+    assert [(item["rank"], item["user_id"]) for item in page.json()["items"]] == [(2, users[2].id), (3, users[0].id)]
+    tail = await api.get("/leaderboard", params={"offset": 3})
+    assert [item["score"] for item in tail.json()["items"]] == [50]
+
+    windowed = await api.get("/leaderboard", params={"window": "week", "limit": 2})
+    assert windowed.status_code == 400
+    assert windowed.json()["detail"] == "Pagination is only available for window=all"
+    assert (await api.get("/leaderboard", params={"limit": 0})).status_code == 422
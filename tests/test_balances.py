@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+
+from smart_cpa_bot.models import BalanceCheckpoint, BalanceLedger, LedgerEntryType, UserBalance
+from smart_cpa_bot.services.balances import BalanceService, BalanceSnapshot, LedgerCompactor
+from smart_cpa_bot.services.batching import upsert_insert
+from smart_cpa_bot.services.leaderboard import LeaderboardService
+from smart_cpa_bot.services.users import UserService
+
+
+async def _make_user(session, telegram_id: int):
+    return await UserService(session).get_or_create(
+        telegram_id=telegram_id,
+        username=f"user{telegram_id}",
+        first_name=f"User {telegram_id}",
+        last_name=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_projection_follows_ledger(session):
+    user = await _make_user(session, 1)
+    service = BalanceService(session)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.CREDIT, amount=1000)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.ADJUST, amount=300)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.LOCK, amount=700)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.UNLOCK, amount=700)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.DEBIT, amount=700)
+
+    snapshot = await service.snapshot(user.id)
+    assert snapshot == BalanceSnapshot(available=300, pending=300, locked=0)
+    assert (await service.ledger_totals())[user.id] == snapshot
+    assert await service.verify_projection() == []
+
+
+@pytest.mark.asyncio
+async def test_rebuild_fixes_drift(session):
+    user = await _make_user(session, 2)
+    service = BalanceService(session)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.CREDIT, amount=500)
+    await session.execute(
+        update(UserBalance).where(UserBalance.user_id == user.id).values(available=1)
+    )
+
+    drift = await service.verify_projection()
+    assert [item.user_id for item in drift] == [user.id]
+    assert drift[0].expected.available == 500
+
+    await service.rebuild_projection()
+    assert (await service.snapshot(user.id)).available == 500
+    assert await service.verify_projection() == []
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_keeps_totals(session):
+    user = await _make_user(session, 3)
+    service = BalanceService(session)
+    first = await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.CREDIT, amount=400)
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.ADJUST, amount=50)
+    before = await service.ledger_totals()
+
+    assert await service.checkpoint([user.id], up_to_entry_id=first.id) == 1
+    await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.LOCK, amount=100)
+    assert await service.checkpoint([user.id], up_to_entry_id=first.id) == 0
+
+    totals = await service.ledger_totals()
+    assert totals[user.id] == BalanceSnapshot(
+        available=before[user.id].available - 100,
+        pending=before[user.id].pending,
+        locked=100,
+    )
+    assert await service.verify_projection() == []
+
+    snapshot = await LeaderboardService(session).generate()
+    assert snapshot.payload[0]["score"] == 300
+
+
+@pytest.mark.asyncio
+async def test_snapshot_many_matches_snapshot(session):
+    users = [await _make_user(session, 100 + index) for index in range(3)]
+    service = BalanceService(session)
+    await service.add_entry(user_id=users[0].id, entry_type=LedgerEntryType.CREDIT, amount=10)
+    await service.add_entry(user_id=users[1].id, entry_type=LedgerEntryType.ADJUST, amount=20)
+
+    many = await service.snapshot_many([user.id for user in users] + [users[0].id])
+    assert set(many) == {user.id for user in users}
+    for user in users:
+        assert many[user.id] == await service.snapshot(user.id)
+
+
+@pytest.mark.asyncio
+async def test_compactor_leaves_unsettled_entries(session_factory):
+    async with session_factory() as session:
+        user = await _make_user(session, 200)
+        service = BalanceService(session)
+        old = await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.CREDIT, amount=100)
+        await service.add_entry(user_id=user.id, entry_type=LedgerEntryType.CREDIT, amount=50)
+        hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+        await session.execute(update(BalanceLedger).where(BalanceLedger.id == old.id).values(created_at=hour_ago))
+        await session.commit()
+
+    assert await LedgerCompactor(session_factory, min_entries=1).run_once() == 1
+    async with session_factory() as session:
+        service = BalanceService(session)
+        checkpoint = await session.get(BalanceCheckpoint, user.id)
+        assert (checkpoint.ledger_entry_id, checkpoint.available) == (old.id, 100)
+        assert (await service.ledger_totals())[user.id].available == 150
+
+
+def test_upserts_follow_the_session_dialect():
+    session = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=postgresql.dialect()))
+    stmt = upsert_insert(session, UserBalance).values(user_id=1, available=5)
+    stmt = stmt.on_conflict_do_update(index_elements=[UserBalance.user_id], set_={"available": stmt.excluded.available})
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (user_id) DO UPDATE SET available = excluded.available" in sql
+
+    session = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=SimpleNamespace(name="mssql")))
+    with pytest.raises(NotImplementedError):
+        upsert_insert(session, UserBalance)
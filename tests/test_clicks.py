@@ -0,0 +1,242 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from smart_cpa_bot.models import Click
+from smart_cpa_bot.services.catalog import CatalogCache, OfferRecord
+from smart_cpa_bot.services.clicks import ClickRef, ClickService, click_refs, find_click_refs
+from smart_cpa_bot.services.conversions import ConversionService
+from smart_cpa_bot.services.offers import OfferService
+from smart_cpa_bot.services.users import UserService
+
+
+class StubSaleads:
+    def __init__(self, latency: dict[str, float] | None = None, failures: dict[str, int] | None = None) -> None:
+        self.calls: list[dict] = []
+        self.latency = latency or {}
+        self.failures = failures or {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def register_click(self, **payload) -> dict:
+        self.calls.append(payload)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency.get(payload["offer_uuid"], 0.01))
+        finally:
+            self.in_flight -= 1
+        if self.failures.get(payload["offer_uuid"]):
+            self.failures[payload["offer_uuid"]] -= 1
+            raise RuntimeError("Saleads unavailable")
+        return {"uuid": f"saleads-{payload['offer_uuid']}", "redirect_url": f"https://partner.example/{payload['offer_uuid']}"}
+
+
+def _record(offer_id: int) -> OfferRecord:
+    return OfferRecord(
+        id=offer_id,
+        external_uuid=f"offer-{offer_id}",
+        title=f"Offer {offer_id}",
+        payout=100,
+        description="",
+        landing_url=f"https://example.com/{offer_id}",
+        landing_id=offer_id * 10,
+        landing_uuid=f"landing-{offer_id}",
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_click_uses_the_snapshot_record(session):
+    user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+    record = _record(7)
+    api = StubSaleads()
+
+    click, link = await ClickService(session, api).create_click(user_id=user.id, offer=record, slot="primary")
+
+    assert api.calls == [{"offer_uuid": "offer-7", "landing_uuid": "landing-7", "subs": {"user_id": str(user.id)}}]
+    stored = (await session.execute(select(Click))).scalar_one()
+    assert (stored.offer_id, stored.landing_id, stored.saleads_click_id) == (7, 70, "saleads-offer-7")
+    assert stored.target_url == "https://partner.example/offer-7"
+    assert link.endswith(f"/r/{click.token}")
+
+
+@pytest.mark.asyncio
+async def test_batch_registration_is_concurrent_and_finishes_slow_clicks_later(session_factory):
+    api = StubSaleads(latency={"offer-3": 0.3})
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        service = ClickService(session, api, session_factory=session_factory, concurrency=2, timeout=0.1)
+        created = await service.create_clicks(user_id=user.id, offers=[_record(n) for n in (1, 2, 3, 4)])
+        await session.commit()
+
+    assert 1 < api.max_in_flight <= 2
+    by_offer = {click.offer_id: click for click, _ in created}
+    assert by_offer[1].target_url == "https://partner.example/offer-1"
+    assert (by_offer[3].saleads_click_id, by_offer[3].target_url) == (None, "https://example.com/3")
+
+    assert await asyncio.gather(*service.completions) == [True]
+    async with session_factory() as session:
+        stmt = select(Click.saleads_click_id, Click.target_url).where(Click.offer_id == 3)
+        assert (await session.execute(stmt)).one() == ("saleads-offer-3", "https://partner.example/offer-3")
+
+
+@pytest.mark.asyncio
+async def test_failed_registrations_are_retried_after_commit(session_factory):
+    api = StubSaleads(failures={"offer-2": 1, "offer-3": 5})
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        service = ClickService(session, api, session_factory=session_factory, timeout=0.1)
+        service.retry_delay = 0
+        created = await service.create_clicks(user_id=user.id, offers=[_record(n) for n in (1, 2, 3)])
+        await asyncio.sleep(0)
+        assert service.completions == []  # started by the commit, not before
+        await session.commit()
+
+    assert await asyncio.gather(*service.completions) == [True, False]
+    assert [call["offer_uuid"] for call in api.calls].count("offer-2") == 2
+    assert [call["offer_uuid"] for call in api.calls].count("offer-3") == 1 + service.retries
+    async with session_factory() as session:
+        stmt = select(Click.offer_id, Click.saleads_click_id).order_by(Click.offer_id)
+        assert (await session.execute(stmt)).all() == [(1, "saleads-offer-1"), (2, "saleads-offer-2"), (3, None)]
+    assert created[1][0].saleads_click_id is None
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_clicks_drop_their_late_registrations(session_factory):
+    api = StubSaleads(latency={"offer-1": 5})
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        await session.commit()
+        service = ClickService(session, api, session_factory=session_factory, timeout=0.05)
+        await service.create_clicks(user_id=user.id, offers=[_record(1)])
+        assert api.in_flight == 1
+        await session.rollback()
+    await asyncio.sleep(0)
+    assert service.completions == []
+    assert api.in_flight == 0  # cancelled
+
+
+@pytest.mark.asyncio
+async def test_lazy_clicks_register_once_on_first_redirect(session_factory):
+    api = StubSaleads(latency={"offer-a": 0.05})
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        catalog = CatalogCache()
+        await OfferService(session, api_client=object(), catalog=catalog).sync_offers(
+            [{"uuid": "offer-a", "name": "A", "landings": [{"uuid": "landing-a", "url": "https://example.com/a"}]}]
+        )
+        [record] = (await catalog.snapshot(session)).records
+        service = ClickService(session, api, session_factory=session_factory, lazy=True)
+        [(click, _)] = await service.create_clicks(user_id=user.id, offers=[record])
+        await session.commit()
+    assert api.calls == []
+
+    async def open_link() -> str | None:
+        async with session_factory() as session:
+            target = await ClickService(session, api, session_factory=session_factory, lazy=True).resolve_target(
+                click.token
+            )
+            assert target.click_id == click.id
+            return target.url
+
+    targets = await asyncio.gather(*(open_link() for _ in range(5)))
+    assert targets == ["https://partner.example/offer-a"] * 5
+    assert api.calls == [{"offer_uuid": "offer-a", "landing_uuid": "landing-a", "subs": {"user_id": str(user.id)}}]
+    assert await open_link() == "https://partner.example/offer-a"
+    assert len(api.calls) == 1
+    assert click_refs.get("saleads-offer-a") == ClickRef(click.id, user.id, click.offer_id)
+
+
+@pytest.mark.asyncio
+async def test_eager_redirect_does_not_register_pending_clicks(session_factory):
+    api = StubSaleads(latency={"offer-a": 0.2})
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        catalog = CatalogCache()
+        await OfferService(session, api_client=object(), catalog=catalog).sync_offers(
+            [{"uuid": "offer-a", "name": "A", "landings": [{"uuid": "landing-a", "url": "https://example.com/a"}]}]
+        )
+        [record] = (await catalog.snapshot(session)).records
+        service = ClickService(session, api, session_factory=session_factory, timeout=0.05, lazy=False)
+        [(click, _)] = await service.create_clicks(user_id=user.id, offers=[record])
+        await session.commit()
+    assert click.saleads_click_id is None  # still completing in the background
+
+    async with session_factory() as session:
+        target = await ClickService(session, api, session_factory=session_factory, lazy=False).resolve_target(
+            click.token
+        )
+    assert target.url == "https://example.com/a"
+    await asyncio.gather(*service.completions)
+    assert len(api.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_eager_redirect_registers_clicks_left_unregistered(session_factory):
+    api = StubSaleads()
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        catalog = CatalogCache()
+        await OfferService(session, api_client=object(), catalog=catalog).sync_offers(
+            [{"uuid": "offer-a", "name": "A", "landings": []}]
+        )
+        [record] = (await catalog.snapshot(session)).records
+        old = datetime.now(timezone.utc) - timedelta(hours=1)
+        session.add(
+            Click(user_id=user.id, offer_id=record.id, token="tok-old", target_url="https://example.com/a", created_at=old)
+        )
+        await session.commit()
+
+    async with session_factory() as session:
+        service = ClickService(session, api, session_factory=session_factory, lazy=False)
+        target = await service.resolve_target("tok-old")
+    assert target.url == "https://partner.example/offer-a"
+    assert [call["offer_uuid"] for call in api.calls] == ["offer-a"]
+    async with session_factory() as session:
+        stmt = select(Click.saleads_click_id).where(Click.token == "tok-old")
+        assert (await session.execute(stmt)).scalar_one() == "saleads-offer-a"
+
+
+@pytest.mark.asyncio
+async def test_postbacks_fill_click_refs_on_a_miss(session_factory):
+    api = StubSaleads(latency={"offer-2": 0.2})
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        service = ClickService(session, api, session_factory=session_factory, timeout=0.05)
+        created = await service.create_clicks(user_id=user.id, offers=[_record(1), _record(2)])
+        await session.commit()
+    await asyncio.gather(*service.completions)
+    by_offer = {click.offer_id: click for click, _ in created}
+    assert len(click_refs) == 0  # the bot's process is not the one reading postbacks
+
+    for conversion_id, lookup in (("c-1", "misses"), ("c-2", "hits")):
+        async with session_factory() as session:
+            before = getattr(click_refs, lookup)
+            conversion = await ConversionService(session).upsert(
+                {"click_id": "saleads-offer-2", "conversion_id": conversion_id}
+            )
+            await session.commit()
+        assert (conversion.click_id, conversion.offer_id) == (by_offer[2].id, 2)
+        assert getattr(click_refs, lookup) == before + 1
+    assert click_refs.get("saleads-offer-2") == ClickRef(by_offer[2].id, user.id, 2)
+
+
+@pytest.mark.asyncio
+async def test_click_refs_keep_only_committed_lookups(session_factory):
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+        session.add(Click(user_id=user.id, offer_id=5, token="tok-5", saleads_click_id="sc-5"))
+        await session.commit()
+    hits, misses = click_refs.hits, click_refs.misses
+
+    async with session_factory() as session:
+        assert set(await find_click_refs(session, {"sc-5", "sc-missing"})) == {"sc-5"}
+        await session.rollback()
+    assert len(click_refs) == 0
+    async with session_factory() as session:
+        await find_click_refs(session, {"sc-5"})
+        await session.commit()
+    assert click_refs.get("sc-5").offer_id == 5
+    assert (click_refs.hits - hits, click_refs.misses - misses) == (1, 3)
@@ -1,8 +1,5 @@
 import pytest
-import pytest_asyncio
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-from smart_cpa_bot.models import Base
 from smart_cpa_bot.services.conversation import ConversationService
 from smart_cpa_bot.services.llm import LLMService
 from smart_cpa_bot.services.users import UserService
@@ -19,17 +16,6 @@ class DummyLLM(LLMService):
         return False
 
 
-@pytest_asyncio.fixture
-async def session():
-    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    Session = async_sessionmaker(engine, expire_on_commit=False)
-    async with Session() as session:
-        yield session
-    await engine.dispose()
-
-
 @pytest.mark.asyncio
 async def test_onboarding_flow(session):
     user_service = UserService(session)
@@ -0,0 +1,127 @@
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from smart_cpa_bot.models import BalanceLedger, Click, Conversion, SyncState
+from smart_cpa_bot.services.conversion_import import ConversionImporter, progress_key
+from smart_cpa_bot.services.users import UserService
+
+
+async def _seed(session_factory, clicks: int = 5) -> None:
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=9, username="u9", first_name="U", last_name=None)
+        session.add_all(
+            Click(user_id=user.id, offer_id=1, token=f"tok-{index}", saleads_click_id=f"sc-{index}") for index in range(clicks)
+        )
+        await session.commit()
+
+
+def _write_csv(path, rows: list[dict]) -> None:
+    lines = ["\ufeffclick_id,conversion_id,amount,status"]
+    lines += [f"{row['click_id']},{row['conversion_id']},{row['amount']},{row.get('status', '')}" for row in rows]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _rows() -> list[dict]:
+    rows = [{"click_id": f"sc-{index % 5}", "conversion_id": f"c-{index}", "amount": 100} for index in range(10)]
+    rows.append(dict(rows[0]))  # replay
+    rows.append({"click_id": "sc-404", "conversion_id": "c-x", "amount": 1})  # unknown click
+    rows.append({"click_id": "sc-1", "conversion_id": "c-bad", "amount": "n/a"})
+    rows += [{"click_id": "sc-2", "conversion_id": f"c-{index}", "amount": 100, "status": "approved"} for index in range(3)]
+    return rows
+
+
+async def _counts(session_factory) -> tuple[int, int]:
+    async with session_factory() as session:
+        conversions = (await session.execute(select(func.count(Conversion.id)))).scalar_one()
+        entries = (await session.execute(select(func.count(BalanceLedger.id)))).scalar_one()
+    return conversions, entries
+
+
+@pytest.mark.asyncio
+async def test_csv_import_applies_records_and_saves_progress(session_factory, tmp_path):
+    await _seed(session_factory)
+    path = tmp_path / "advertiser.csv"
+    _write_csv(path, _rows())
+
+    stats = await ConversionImporter(session_factory, chunk_size=4).run(path)
+    assert (stats.records, stats.applied, stats.replays, stats.errors, stats.chunks) == (16, 13, 1, 2, 4)
+    assert await _counts(session_factory) == (10, 10 + 3 * 2)
+    async with session_factory() as session:
+        assert await session.get(SyncState, progress_key(path)) is None  # cleared when done
+
+    again = await ConversionImporter(session_factory, chunk_size=4).run(path)
+    assert (again.skipped, again.records, again.applied, again.replays) == (0, 16, 0, 14)
+    assert await _counts(session_factory) == (10, 10 + 3 * 2)
+
+
+@pytest.mark.asyncio
+async def test_another_file_at_the_same_path_is_imported_in_full(session_factory, tmp_path):
+    await _seed(session_factory)
+    path = tmp_path / "conversions.csv"
+    _write_csv(path, [{"click_id": "sc-0", "conversion_id": f"first-{index}", "amount": 10} for index in range(5)])
+    assert (await ConversionImporter(session_factory).run(path)).applied == 5
+
+    _write_csv(path, [{"click_id": "sc-1", "conversion_id": f"second-{index}", "amount": 10} for index in range(7)])
+    stats = await ConversionImporter(session_factory).run(path)
+    assert (stats.skipped, stats.records, stats.applied) == (0, 7, 7)
+    assert await _counts(session_factory) == (12, 12)
+
+
+@pytest.mark.asyncio
+async def test_dry_run_reports_without_writing(session_factory, tmp_path):
+    await _seed(session_factory)
+    path = tmp_path / "advertiser.jsonl"
+    path.write_text("\n".join(json.dumps(row) for row in _rows()) + "\n\nnot json\n", encoding="utf-8")
+
+    stats = await ConversionImporter(session_factory, chunk_size=100, dry_run=True).run(path)
+    assert (stats.records, stats.applied, stats.replays, stats.errors) == (17, 13, 1, 3)
+    assert await _counts(session_factory) == (0, 0)
+    async with session_factory() as session:
+        assert await session.get(SyncState, progress_key(path)) is None
+
+
+@pytest.mark.asyncio
+async def test_malformed_jsonl_records_are_counted_not_fatal(session_factory, tmp_path):
+    await _seed(session_factory)
+    path = tmp_path / "saleads.jsonl"
+    lines = [
+        '{"click_id": "sc-0", "conversion_id": "c-0", "amount": 100}',
+        '{"click_id": "sc-1", "conversion_id": "c-1", "amount": 100, "status": 1}',  # Saleads numeric status
+        '{"click_id": "sc-2", "conversion_id": "c-2", "amount": 1e400}',
+        '{"click_id": {"uuid": "sc-3"}, "conversion_id": "c-3", "amount": 100}',
+        '["sc-4", "c-4"]',
+        '{"click_id": "sc-4", "conversion_id": "c-4", "amount": "100", "status": "approved"}',
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    stats = await ConversionImporter(session_factory, chunk_size=4).run(path)
+    assert (stats.records, stats.applied, stats.errors) == (6, 2, 4)
+    assert (await _counts(session_factory))[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_import_resumes_after_the_last_committed_chunk(session_factory, tmp_path, monkeypatch):
+    await _seed(session_factory)
+    path = tmp_path / "advertiser.csv"
+    _write_csv(path, _rows())
+    importer = ConversionImporter(session_factory, chunk_size=4)
+    apply = importer._apply
+    calls = 0
+
+    async def crash_on_third_chunk(*args):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise RuntimeError("killed")
+        await apply(*args)
+
+    monkeypatch.setattr(importer, "_apply", crash_on_third_chunk)
+    with pytest.raises(RuntimeError):
+        await importer.run(path)
+    assert await _counts(session_factory) == (8, 8)
+
+    stats = await ConversionImporter(session_factory, chunk_size=4).run(path)
+    assert (stats.skipped, stats.records) == (8, 8)
+    assert await _counts(session_factory) == (10, 10 + 3 * 2)
@@ -0,0 +1,114 @@
+import pytest
+from sqlalchemy import select
+
+from smart_cpa_bot.models import BalanceLedger, Click, ConversionStatus
+from smart_cpa_bot.services.balances import BalanceService
+from smart_cpa_bot.services.clicks import ClickService
+from smart_cpa_bot.services.conversions import ConversionService, receipt_cache
+from smart_cpa_bot.services.users import UserService
+
+
+async def _click(session, saleads_click_id: str = "sc-1") -> Click:
+    user = await UserService(session).get_or_create(telegram_id=1, username="u1", first_name="U", last_name=None)
+    click = Click(
+        user_id=user.id,
+        offer_id=1,
+        token="tok-1",
+        saleads_click_id=saleads_click_id,
+        target_url="https://partner.example/go",
+    )
+    session.add(click)
+    await session.flush()
+    session.expunge_all()
+    return click
+
+
+@pytest.mark.asyncio
+async def test_postbacks_move_conversion_through_statuses(session):
+    click = await _click(session)
+    service = ConversionService(session)
+
+    pending = await service.upsert({"click_id": "sc-1", "conversion_id": "c-1", "amount": "150", "status": "pending"})
+    session.expunge_all()
+    approved = await service.upsert({"click_id": "sc-1", "conversion_id": "c-1", "amount": "150", "status": "approved"})
+
+    assert approved.id == pending.id
+    assert approved.status == ConversionStatus.APPROVED
+    snapshot = await BalanceService(session).snapshot(click.user_id)
+    assert (snapshot.available, snapshot.pending) == (150, 0)
+
+
+@pytest.mark.asyncio
+async def test_resolve_click_loads_the_target(session):
+    await _click(session)
+    click = await ClickService(session, api_client=object()).resolve_click("tok-1")
+    assert click.target_url == "https://partner.example/go"
+
+
+async def _ledger(session) -> list[tuple[str, int]]:
+    stmt = select(BalanceLedger.notes, BalanceLedger.amount).order_by(BalanceLedger.id)
+    return [tuple(row) for row in (await session.execute(stmt)).all()]
+
+
+@pytest.mark.asyncio
+async def test_replayed_postbacks_never_reach_the_ledger(session_factory):
+    async with session_factory() as session:
+        click = await _click(session)
+        await session.commit()
+    postback = {"click_id": "sc-1", "conversion_id": "c-1", "amount": "150", "status": "approved"}
+
+    async with session_factory() as session:
+        assert await ConversionService(session).upsert(postback) is not None
+        assert await ConversionService(session).upsert(postback) is None  # same transaction
+        await session.commit()
+    async with session_factory() as session:
+        hits = receipt_cache.hits
+        assert await ConversionService(session).upsert(dict(postback)) is None
+        assert receipt_cache.hits == hits + 1
+        assert await _ledger(session) == [("conversion_approved", 150)]
+        assert (await BalanceService(session).snapshot(click.user_id)).available == 150
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_receipts_are_not_remembered(session_factory):
+    async with session_factory() as session:
+        await _click(session)
+        await session.commit()
+    postback = {"click_id": "sc-1", "conversion_id": "c-1", "amount": "150"}
+
+    async with session_factory() as session:
+        assert await ConversionService(session).upsert(postback) is not None
+        await session.rollback()
+    async with session_factory() as session:
+        assert await ConversionService(session).upsert(postback) is not None
+
+
+@pytest.mark.asyncio
+async def test_transitions_move_the_previous_amount(session):
+    click = await _click(session)
+    service = ConversionService(session)
+
+    for amount, status in [("100", "pending"), ("150", "pending"), ("150", "approved"), ("120", "approved")]:
+        await service.upsert({"click_id": "sc-1", "conversion_id": "c-1", "amount": amount, "status": status})
+
+    assert await _ledger(session) == [
+        ("pending_conversion", 100),
+        ("pending_released", -100),
+        ("pending_conversion", 150),
+        ("pending_released", -150),
+        ("conversion_approved", 150),
+        ("conversion_amount_changed", -30),
+    ]
+    snapshot = await BalanceService(session).snapshot(click.user_id)
+    assert (snapshot.available, snapshot.pending) == (120, 0)
+
+
+@pytest.mark.asyncio
+async def test_batch_applies_a_repeated_postback_once(session):
+    await _click(session)
+    postback = {"click_id": "sc-1", "conversion_id": "c-1", "amount": "90", "status": "approved"}
+    results = await ConversionService(session).upsert_batch([postback, {"click_id": "sc-2"}, dict(postback)])
+
+    assert results[0] is not None and results[2] is None
+    assert isinstance(results[1], ValueError)
+    assert await _ledger(session) == [("conversion_approved", 90)]
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import inspect, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from smart_cpa_bot.db import create_schema
+from smart_cpa_bot.models import Base, LeaderboardSnapshot, Offer
+from smart_cpa_bot.services.catalog import CatalogCache
+from smart_cpa_bot.services.leaderboard import LeaderboardService, LeaderboardWindow
+from smart_cpa_bot.services.offers import OfferService
+
+
+@pytest.mark.asyncio
+async def test_create_schema_upgrades_offers_created_before_content_hash():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text("ALTER TABLE offers DROP COLUMN content_hash"))
+        await conn.execute(
+            text(
+                "INSERT INTO offers (external_uuid, title, min_age, payout_brutto, expected_score, status) "
+                "VALUES ('offer-old', 'Old', 18, 100, 0, 'ACTIVE')"
+            )
+        )
+
+    for _ in range(2):  # runs on every start
+        async with engine.begin() as conn:
+            await conn.run_sync(create_schema)
+    async with engine.connect() as conn:
+        columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("offers"))
+    assert "content_hash" in {column["name"] for column in columns}
+
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as session:
+        [offer] = (await session.execute(select(Offer))).scalars()
+        assert (offer.external_uuid, offer.content_hash) == ("offer-old", None)
+        service = OfferService(session, api_client=object(), catalog=CatalogCache())
+        stats = await service.sync_offers([{"uuid": "offer-old", "name": "Old", "landings": []}])
+        assert stats.offers.updated == 1  # rows without a hash are rewritten once
+        assert (await session.execute(select(Offer.content_hash))).scalar_one()
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_create_schema_moves_snapshot_windows_out_of_the_date_key():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "CREATE TABLE leaderboard_snapshots (id INTEGER PRIMARY KEY, date VARCHAR(32) UNIQUE, payload JSON, "
+                "created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, "
+                "updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL)"
+            )
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO leaderboard_snapshots (date, payload) VALUES "
+                "('2026-10-15', '[1]'), ('week:2026-10-15', '[2]'), ('2026-10-16', '[3]'), ('week:2026-10-16', '[4]')"
+            )
+        )
+        await conn.run_sync(create_schema)
+        await conn.run_sync(create_schema)
+
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as session:
+        rows = (await session.execute(select(LeaderboardSnapshot.window, LeaderboardSnapshot.date))).all()
+        assert sorted(rows) == [
+            ("all", "2026-10-15"),
+            ("all", "2026-10-16"),
+            ("week", "2026-10-15"),
+            ("week", "2026-10-16"),
+        ]
+        service = LeaderboardService(session)
+        assert (await service.latest()).payload == [3]
+        assert (await service.latest(LeaderboardWindow.WEEK)).payload == [4]
+        assert await service.latest(LeaderboardWindow.DAY) is None
+        await service.generate(window=LeaderboardWindow.DAY)
+        await service.generate()
+        await session.commit()
+        assert (await service.latest(LeaderboardWindow.DAY)).payload == []
+    await engine.dispose()
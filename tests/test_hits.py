@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from smart_cpa_bot.models import Click, ClickHit, ClickStatus
+from smart_cpa_bot.services.hits import HitRecorder, hash_ip
+
+
+async def _clicks(session_factory, count: int) -> None:
+    async with session_factory() as session:
+        await session.execute(
+            insert(Click),
+            [{"user_id": 1, "offer_id": 1, "token": f"t{index}"} for index in range(1, count + 1)],
+        )
+        await session.execute(
+            insert(Click).values(user_id=1, offer_id=1, token="confirmed", status=ClickStatus.CONFIRMED)
+        )
+        await session.commit()
+
+
+async def _statuses(session_factory) -> dict[int, ClickStatus]:
+    async with session_factory() as session:
+        return dict((await session.execute(select(Click.id, Click.status))).all())
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_and_flush_writes_in_bulk(session_factory):
+    await _clicks(session_factory, 3)
+    recorder = HitRecorder(session_factory, maxsize=3, batch_size=2)
+    assert recorder.record(1, ip="10.0.0.1", user_agent="UA")
+    assert recorder.record(1)
+    assert recorder.record(4)
+    assert not recorder.record(2)
+    assert recorder.stats()["queue_depth"] == 3 and recorder.dropped == 1
+
+    assert await recorder.flush() == 3
+    assert (recorder.written, recorder.flushes, recorder.depth) == (3, 2, 0)
+    async with session_factory() as session:
+        hits = (await session.execute(select(ClickHit).order_by(ClickHit.id))).scalars().all()
+    assert [hit.click_id for hit in hits] == [1, 1, 4]
+    assert hits[0].ip_hash == hash_ip("10.0.0.1") and hits[0].user_agent == "UA"
+    statuses = await _statuses(session_factory)
+    assert statuses == {1: ClickStatus.OPENED, 2: ClickStatus.SENT, 3: ClickStatus.SENT, 4: ClickStatus.CONFIRMED}
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_by_size_and_interval(session_factory):
+    await _clicks(session_factory, 5)
+    recorder = HitRecorder(session_factory, batch_size=2, flush_interval=0.05)
+    writer = asyncio.create_task(recorder.run_forever())
+    for click_id in range(1, 6):
+        recorder.record(click_id)
+    for _ in range(100):
+        if recorder.written == 5:
+            break
+        await asyncio.sleep(0.01)
+    writer.cancel()
+
+    assert recorder.written == 5 and recorder.flushes == 3
+    async with session_factory() as session:
+        assert (await session.execute(select(func.count(ClickHit.id)))).scalar_one() == 5
+    assert set((await _statuses(session_factory)).values()) == {ClickStatus.OPENED, ClickStatus.CONFIRMED}
+
+
+@pytest.mark.asyncio
+async def test_flush_after_cancelling_the_writer_keeps_collected_events(session_factory):
+    await _clicks(session_factory, 3)
+    recorder = HitRecorder(session_factory, batch_size=10, flush_interval=5)
+    writer = asyncio.create_task(recorder.run_forever())
+    recorder.record(1)
+    recorder.record(2)
+    await asyncio.sleep(0.05)  # the writer now holds both events, waiting for more
+    assert recorder.depth == 0
+
+    writer.cancel()
+    await asyncio.gather(writer, return_exceptions=True)
+    assert await recorder.flush() == 2
+    assert (recorder.recorded, recorder.written) == (2, 2)
+    async with session_factory() as session:
+        assert (await session.execute(select(func.count(ClickHit.id)))).scalar_one() == 2
@@ -0,0 +1,127 @@
+import json
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+from smart_cpa_bot.models import DailyScore, LedgerEntryType
+from smart_cpa_bot.services.balances import BalanceService, utc_today
+from smart_cpa_bot.services.leaderboard import (
+    LeaderboardRefresher,
+    LeaderboardService,
+    LeaderboardWindow,
+    RankIndex,
+)
+from smart_cpa_bot.services.users import UserService
+
+
+async def _seed(session):
+    user_service = UserService(session)
+    balances = BalanceService(session)
+    users = []
+    for index in range(6):
+        users.append(
+            await user_service.get_or_create(
+                telegram_id=index + 1,
+                username=None,
+                first_name=f"Player {index}",
+                last_name=None,
+            )
+        )
+    entries = [
+        (0, LedgerEntryType.CREDIT, 300),
+        (1, LedgerEntryType.CREDIT, 500),
+        (2, LedgerEntryType.CREDIT, 300),
+        (3, LedgerEntryType.ADJUST, 900),
+        (1, LedgerEntryType.LOCK, 200),
+        (4, LedgerEntryType.CREDIT, 100),
+        (4, LedgerEntryType.DEBIT, 100),
+    ]
+    for index, entry_type, amount in entries:
+        await balances.add_entry(user_id=users[index].id, entry_type=entry_type, amount=amount)
+    return users
+
+
+async def _expected(session, users, limit):
+    totals = await BalanceService(session).ledger_totals()
+    scored = [(user.id, user.display_name, totals[user.id].available if user.id in totals else 0) for user in users]
+    scored.sort(key=lambda item: (-item[2], item[0]))
+    return [{"user_id": user_id, "name": name, "score": score} for user_id, name, score in scored[:limit]]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [2, 3, 50])
+async def test_generate_matches_ledger_ranking(session, limit):
+    users = await _seed(session)
+    snapshot = await LeaderboardService(session).generate(limit=limit)
+    assert snapshot.payload == await _expected(session, users, limit)
+
+
+@pytest.mark.asyncio
+async def test_refresher_keeps_encoded_board(session_factory):
+    async with session_factory() as session:
+        users = await _seed(session)
+        await session.commit()
+    refresher = LeaderboardRefresher(session_factory, interval=60)
+    first = await refresher.get()
+    assert json.loads(first.body)[0]["user_id"] == users[0].id
+    assert (await refresher.refresh())[LeaderboardWindow.ALL].etag == first.etag
+
+    async with session_factory() as session:
+        await BalanceService(session).add_entry(
+            user_id=users[5].id, entry_type=LedgerEntryType.CREDIT, amount=1000
+        )
+        await session.commit()
+    second = (await refresher.refresh())[LeaderboardWindow.ALL]
+    assert second.etag != first.etag
+    assert json.loads(second.body)[0]["user_id"] == users[5].id
+
+
+@pytest.mark.asyncio
+async def test_window_boards_sum_daily_buckets(session):
+    users = await _seed(session)
+    today = utc_today()
+    session.add(DailyScore(user_id=users[4].id, day=today - timedelta(days=40), score=5000))
+    await session.flush()
+
+    service = LeaderboardService(session)
+    day_snapshot = await service.generate(window=LeaderboardWindow.DAY)
+    assert (day_snapshot.window, day_snapshot.date) == ("day", str(today))  # same UTC day as the buckets
+    day_board = day_snapshot.payload
+    assert [item["user_id"] for item in day_board] == [users[0].id, users[1].id, users[2].id, users[4].id]
+    assert [item["score"] for item in day_board] == [300, 300, 300, 0]
+    all_board = (await service.generate(window=LeaderboardWindow.ALL)).payload
+    assert all_board[0]["user_id"] == users[0].id
+    assert (await service.latest(LeaderboardWindow.DAY)).payload == day_board
+    assert (await service.latest()).payload == all_board
+
+
+@pytest.mark.asyncio
+async def test_rebuild_daily_scores_matches_incremental(session):
+    await _seed(session)
+    rows = select(DailyScore.user_id, DailyScore.day, DailyScore.score).order_by(DailyScore.user_id)
+    incremental = (await session.execute(rows)).all()
+    await BalanceService(session).rebuild_daily_scores()
+    assert (await session.execute(rows)).all() == incremental
+
+
+@pytest.mark.asyncio
+async def test_rank_index_pages_match_generate(session):
+    users = await _seed(session)
+    index = RankIndex()
+    await index.sync(session)
+    board = (await LeaderboardService(session).generate(limit=50)).payload
+    page = [entry.as_dict() for entry in index.page(0, 50)]
+    assert [{key: item[key] for key in ("user_id", "name", "score")} for item in page] == board
+    assert [entry.user_id for entry in index.page(2, 2)] == [item["user_id"] for item in board[2:4]]
+    for position, item in enumerate(board, start=1):
+        assert index.rank(item["user_id"]).rank == position
+
+    await BalanceService(session).add_entry(
+        user_id=users[5].id, entry_type=LedgerEntryType.CREDIT, amount=1000
+    )
+    await session.flush()
+    await index.sync(session)
+    assert index.rank(users[5].id).rank == 1
+    assert index.rank(users[0].id).rank == 2
+    assert index.rank(10_000) is None
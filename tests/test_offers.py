@@ -0,0 +1,239 @@
+import asyncio
+import copy
+import logging
+import random
+import time
+
+import pytest
+from sqlalchemy import select, update
+
+from smart_cpa_bot.models import Offer, OfferLanding, OfferStatus, User
+from smart_cpa_bot.services.catalog import CatalogCache, bump_catalog_version
+from smart_cpa_bot.services.offers import OfferService, OfferSyncScheduler, payload_digest
+
+logger = logging.getLogger(__name__)
+
+CITIES = ["Москва", "Казань", "Самара", "Пермь"]
+
+
+async def _seed_offers(session, count: int = 60) -> list[Offer]:
+    rng = random.Random(3)
+    offers = []
+    for index in range(count):
+        whitelist = rng.sample(CITIES, rng.randint(1, 2)) if rng.random() < 0.4 else None
+        offer = Offer(
+            external_uuid=f"offer-{index}",
+            title=f"Offer {index}",
+            min_age=rng.choice([0, 14, 18, 21]),
+            max_age=rng.choice([None, None, 25, 35]),
+            geo_text=rng.choice([None, "Москва и область", "Вся Россия"]),
+            city_whitelist=whitelist,
+            payout_brutto=rng.randint(0, 500),
+            expected_score=rng.choice([0, rng.randint(0, 500)]),
+            status=OfferStatus.PAUSED if index % 17 == 0 else OfferStatus.ACTIVE,
+            metadata_json={"goals": [{"price": 1}] * rng.randint(0, 3)},
+        )
+        offer.landings.append(OfferLanding(url=f"https://example.com/{index}"))
+        session.add(offer)
+        offers.append(offer)
+    await session.flush()
+    await bump_catalog_version(session)
+    return offers
+
+
+def _profiles():
+    for age in [None, 0, 13, 14, 18, 20, 21, 25, 26, 35, 36, 60]:
+        for city in [None, "", "москва", "Казань", "Тверь"]:
+            yield User(age=age, city=city)
+
+
+@pytest.mark.asyncio
+async def test_eligibility_index_matches_reference_filter(session):
+    offers = await _seed_offers(session)
+    service = OfferService(session, catalog=CatalogCache())
+    index = await service.catalog.eligibility_index(session)
+    active = [offer for offer in offers if offer.status == OfferStatus.ACTIVE]
+    for user in _profiles():
+        expected = [offer.id for offer in active if service._is_offer_allowed(offer, user)]
+        assert index.candidates(user.age, user.city) == expected
+
+
+@pytest.mark.asyncio
+async def test_personalized_offers_include_landing(session):
+    await _seed_offers(session)
+    service = OfferService(session, catalog=CatalogCache())
+    result = await service.get_personalized_offers(User(age=22, city="Москва"), limit=3)
+    assert len(result) == 3
+    assert all(item.landing_url == f"https://example.com/{item.external_uuid.split('-')[1]}" for item in result)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("vectorized", [False, True])
+async def test_recommendations_match_reference_scoring(session, vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    offers = await _seed_offers(session)
+    service = OfferService(session, catalog=CatalogCache())
+    index = await service.catalog.eligibility_index(session)
+    active = [offer for offer in offers if offer.status == OfferStatus.ACTIVE]
+    for user in _profiles():
+        allowed = [offer for offer in active if service._is_offer_allowed(offer, user)]
+        allowed.sort(key=lambda offer: service._score_offer(offer, user), reverse=True)
+        for limit in (1, 3, 10, len(allowed) + 1):
+            expected = [offer.id for offer in allowed[:limit]]
+            assert index.recommend(user.age, user.city, limit, vectorized=vectorized) == expected
+
+
+def _payload(index: int, landings: int = 2) -> dict:
+    return {
+        "uuid": f"offer-{index}",
+        "name": f"Offer {index}",
+        "limits": {"ageMin": 21},
+        "goals": [{"price": 100 + index}],
+        "landings": [
+            {"uuid": f"landing-{index}-{number}", "url": f"https://example.com/{index}/{number}"}
+            for number in range(landings)
+        ],
+    }
+
+
+async def _landing_ids(session) -> dict[str, int]:
+    stmt = select(OfferLanding.external_uuid, OfferLanding.id)
+    return dict((await session.execute(stmt)).all())
+
+
+@pytest.mark.asyncio
+async def test_bulk_sync_reports_changes_and_keeps_landing_ids(session):
+    service = OfferService(session, api_client=object(), catalog=CatalogCache())
+    payloads = [_payload(index) for index in range(1200)]
+
+    stats = await service.sync_offers(payloads)
+    assert (stats.offers.inserted, stats.offers.updated, stats.offers.unchanged) == (1200, 0, 0)
+    assert stats.landings.inserted == 2400
+    landing_ids = await _landing_ids(session)
+
+    changed = copy.deepcopy(payloads)
+    changed[5]["landings"][0]["url"] = "https://example.com/moved"
+    del changed[6]["landings"][1]
+    changed[7]["landings"].append({"uuid": "landing-7-new", "url": "https://example.com/7/new"})
+    changed[8]["name"] = "Renamed"
+    changed.append(_payload(5000, landings=1))
+    stats = await service.sync_offers(changed)
+
+    assert (stats.offers.inserted, stats.offers.updated, stats.offers.unchanged) == (1, 4, 1196)
+    assert (stats.landings.inserted, stats.landings.updated, stats.landings.removed) == (2, 1, 1)
+    assert stats.landings.unchanged == 6
+    after = await _landing_ids(session)
+    assert "landing-6-1" not in after
+    assert all(after[key] == value for key, value in landing_ids.items() if key != "landing-6-1")
+    offer = (await session.execute(select(Offer).where(Offer.external_uuid == "offer-8"))).scalar_one()
+    assert (offer.title, offer.min_age, offer.payout_brutto) == ("Renamed", 21, 108)
+
+    stats = await service.sync_offers(changed)
+    assert not stats.changed
+    assert stats.skipped == len(changed)
+    assert stats.bytes_written == 0
+    assert stats.bytes_skipped == sum(payload_digest(payload)[1] for payload in changed)
+
+
+@pytest.mark.asyncio
+async def test_sync_rewrites_rows_without_content_hash(session):
+    service = OfferService(session, api_client=object(), catalog=CatalogCache())
+    await service.sync_offers([_payload(1), _payload(2)])
+    await session.execute(update(Offer).where(Offer.external_uuid == "offer-1").values(content_hash=None))
+
+    stats = await service.sync_offers([_payload(1), _payload(2)])
+    assert (stats.offers.updated, stats.skipped) == (1, 1)
+    assert stats.landings.unchanged == 2
+    assert stats.bytes_written == payload_digest(_payload(1))[1]
+
+
+@pytest.mark.asyncio
+async def test_streamed_sync_of_10k_offers(session, mock_saleads):
+    server = mock_saleads([_payload(index, landings=1) for index in range(10_000)], latency=0.005)
+    client = server.client(page_size=1000, page_concurrency=4)
+    service = OfferService(session, api_client=client, catalog=CatalogCache())
+
+    started = time.perf_counter()
+    stats = await service.sync_from_saleads()
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    again = await service.sync_from_saleads()
+    second = time.perf_counter() - started
+    await client.close()
+
+    logger.info("10k offer sync: first %.2fs, repeat %.2fs", first, second)
+    assert stats.offers.inserted == 10_000
+    assert stats.landings.inserted == 10_000
+    assert again.offers.unchanged == 10_000 and not again.changed
+    assert server.requests == 20
+    assert len(await service.catalog.eligibility_index(session)) == 10_000
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_one_sync_for_concurrent_callers(session_factory, mock_saleads):
+    server = mock_saleads([_payload(index) for index in range(50)], latency=0.02)
+    client = server.client(page_size=20)
+    scheduler = OfferSyncScheduler(session_factory, api_client=client, interval=60, catalog=CatalogCache())
+
+    first, second = await asyncio.gather(scheduler.sync_once(), scheduler.sync_once())
+    assert first is second
+    assert first.offers.inserted == 50
+    assert server.requests == 3
+    snapshot = scheduler.catalog.current
+    assert len(snapshot) == 50 and snapshot.memory_bytes > 0
+    assert snapshot.records[0].landing_uuid == "landing-0-0"
+
+    assert (await scheduler.sync_once()).skipped == 50
+    assert server.requests == 6
+    assert scheduler.catalog.current is snapshot
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_closing_the_scheduler_stops_an_inflight_sync(session_factory, mock_saleads):
+    server = mock_saleads([_payload(index) for index in range(50)], latency=0.5)
+    client = server.client(page_size=20)
+    scheduler = OfferSyncScheduler(session_factory, api_client=client, interval=60, catalog=CatalogCache())
+    loop = asyncio.create_task(scheduler.run_forever())
+    while not server.requests:
+        await asyncio.sleep(0.01)
+    running = scheduler._running
+
+    loop.cancel()
+    await asyncio.gather(loop, return_exceptions=True)
+    assert not running.done()  # shielded from the loop's cancellation
+    await scheduler.close()
+    assert running.cancelled() and scheduler._running is None
+    async with session_factory() as session:
+        assert (await session.execute(select(Offer.id))).first() is None
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_empty_catalog_does_not_sync_on_the_request_path(session):
+    service = OfferService(session, api_client=object(), catalog=CatalogCache())
+    assert await service.get_personalized_offers(User(age=30, city="Москва")) == []
+
+
+@pytest.mark.asyncio
+async def test_recommendations_are_shared_by_profile_until_the_catalog_changes(session, caplog):
+    service = OfferService(session, api_client=object(), catalog=CatalogCache())
+    await service.sync_offers([_payload(index) for index in range(10)])
+    cache = service.catalog.recommendations
+
+    first = await service.get_personalized_offers(User(id=1, age=30, city="Москва"))
+    again = await service.get_personalized_offers(User(id=2, age=31, city="москва"))
+    assert again == first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    await service.get_personalized_offers(User(id=3, age=19, city="Москва"))
+    assert cache.misses == 2  # below the ageMin=21 boundary: another cohort
+
+    await service.sync_offers([_payload(index) for index in range(11)])
+    with caplog.at_level(logging.INFO, logger="smart_cpa_bot.services.catalog"):
+        refreshed = await service.get_personalized_offers(User(id=1, age=30, city="Москва"))
+    assert "Recommendation cache until catalog v1 was replaced: 1 hits, 2 misses (33.3% hit rate)" in caplog.text
+    assert refreshed[0].external_uuid == "offer-10"
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.stats()["hit_rate"] == 0.25
@@ -0,0 +1,105 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+from smart_cpa_bot.models import Click, Conversion, PostbackInbox
+from smart_cpa_bot.services.balances import BalanceService
+from smart_cpa_bot.services.conversions import ConversionService
+from smart_cpa_bot.services.postbacks import PostbackWorker, enqueue_postback, pending_postbacks
+from smart_cpa_bot.services.users import UserService
+
+
+async def _clicks(session, count: int) -> int:
+    user = await UserService(session).get_or_create(telegram_id=7, username="u7", first_name="U", last_name=None)
+    session.add_all(
+        Click(user_id=user.id, offer_id=1, token=f"tok-{index}", saleads_click_id=f"sc-{index}")
+        for index in range(count)
+    )
+    await session.flush()
+    return user.id
+
+
+def _postbacks() -> list[dict]:
+    payloads = []
+    for index in range(40):
+        payloads.append({"click_id": f"sc-{index % 10}", "conversion_id": f"c-{index}", "amount": "100", "status": "pending"})
+    for index in range(0, 40, 3):
+        payloads.append({"click_id": f"sc-{index % 10}", "conversion_id": f"c-{index}", "amount": "120", "status": "approved"})
+    for index in range(1, 40, 7):
+        payloads.append({"click_id": f"sc-{index % 10}", "conversion_id": f"c-{index}", "amount": "100", "status": "rejected"})
+    return payloads
+
+
+async def _outcome(session, user_id: int):
+    rows = (await session.execute(select(Conversion.external_id, Conversion.status, Conversion.amount_netto))).all()
+    snapshot = await BalanceService(session).snapshot(user_id)
+    return sorted(rows), (snapshot.available, snapshot.pending)
+
+
+@pytest.mark.asyncio
+async def test_batched_postbacks_match_sequential_application(session_factory):
+    async with session_factory() as session:
+        user_id = await _clicks(session, 10)
+        for payload in _postbacks():
+            await ConversionService(session).upsert(payload)
+        expected = await _outcome(session, user_id)
+        await session.rollback()
+
+    async with session_factory() as session:
+        user_id = await _clicks(session, 10)
+        for payload in _postbacks():
+            await enqueue_postback(session, payload)
+        await session.commit()
+
+    worker = PostbackWorker(session_factory, batch_size=25, interval=0.01)
+    while await worker.run_once():
+        pass
+
+    async with session_factory() as session:
+        assert await _outcome(session, user_id) == expected
+        assert await pending_postbacks(session) == 0
+    stats = worker.stats()
+    assert stats["processed"] == len(_postbacks())
+    assert stats["batches"] == 3 and stats["failed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_postback_for_unknown_click_is_retried_then_given_up(session_factory):
+    async with session_factory() as session:
+        await _clicks(session, 1)
+        await enqueue_postback(session, {"click_id": "sc-missing", "conversion_id": "c-x", "amount": "10"})
+        await enqueue_postback(session, {"click_id": "sc-0", "conversion_id": "c-0", "amount": "10"})
+        await session.commit()
+
+    worker = PostbackWorker(session_factory, batch_size=10, max_attempts=3, retry_delay=0)
+    assert [await worker.run_once() for _ in range(4)] == [2, 1, 1, 0]
+
+    async with session_factory() as session:
+        rows = (await session.execute(select(PostbackInbox).order_by(PostbackInbox.id))).scalars().all()
+    assert rows[0].attempts == 3 and rows[0].processed_at is not None
+    assert "Click not found" in rows[0].error
+    assert rows[1].attempts == 1 and rows[1].error is None
+    assert (worker.processed, worker.retried, worker.failed) == (1, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_unknown_click_is_retried_with_a_growing_delay(session_factory):
+    async with session_factory() as session:
+        await enqueue_postback(session, {"click_id": "sc-late", "conversion_id": "c-late", "amount": "10"})
+        await session.commit()
+
+    worker = PostbackWorker(session_factory, retry_delay=30)
+    assert await worker.run_once() == 1
+    assert await worker.run_once() == 0  # not due yet
+    async with session_factory() as session:
+        item = (await session.execute(select(PostbackInbox))).scalar_one()
+        assert timedelta(seconds=29) < item.next_attempt_at - item.created_at < timedelta(seconds=32)
+        item.next_attempt_at = None  # pretend the delay is over
+        await session.commit()
+
+    assert await worker.run_once() == 1
+    async with session_factory() as session:
+        item = (await session.execute(select(PostbackInbox))).scalar_one()
+        assert item.attempts == 2 and item.processed_at is None
+        assert timedelta(seconds=59) < item.next_attempt_at - item.created_at < timedelta(seconds=62)
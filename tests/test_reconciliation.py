@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from smart_cpa_bot.models import BalanceLedger, Click, Conversion, ConversionStatus, SyncState
+from smart_cpa_bot.services.balances import BalanceService
+from smart_cpa_bot.services.reconciliation import RECONCILE_CURSOR_KEY, ConversionReconciler
+from smart_cpa_bot.services.users import UserService
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _clicks(statuses: dict[int, int]) -> list[dict]:
+    """Saleads ``/click`` items: ours are ``sc-0..sc-9``, the rest belong to other stands."""
+
+    return [
+        {
+            "uuid": f"sc-{index}",
+            "conversions": [
+                {"uuid": f"conv-{index}", "status": status, "goal": {"id": 1, "price": 100 + index, "currency": "RUB"}}
+            ],
+        }
+        for index, status in statuses.items()
+    ]
+
+
+async def _seed(session_factory) -> int:
+    async with session_factory() as session:
+        user = await UserService(session).get_or_create(telegram_id=5, username="u5", first_name="U", last_name=None)
+        session.add_all(
+            Click(user_id=user.id, offer_id=1, token=f"tok-{index}", saleads_click_id=f"sc-{index}") for index in range(10)
+        )
+        await session.commit()
+        return user.id
+
+
+@pytest.mark.asyncio
+async def test_reconciler_applies_only_changed_statuses_and_keeps_a_cursor(session_factory, mock_saleads):
+    user_id = await _seed(session_factory)
+    statuses = {index: 3 for index in range(12)}
+    server = mock_saleads(_clicks(statuses))
+    client = server.client(page_size=5)
+    reconciler = ConversionReconciler(session_factory, api_client=client, batch_size=4, lookback=timedelta(days=30))
+
+    stats = await reconciler.run_once(now=NOW)
+    assert (stats.fetched, stats.applied, stats.unknown_clicks, stats.failed) == (12, 10, 2, 0)
+    assert server.last_params["dateFrom"] == "2026-01-30 12:00:00"
+    assert server.last_params.get_list("conversionStatuses[]") == ["3", "0", "1", "-1"]
+
+    statuses.update({0: 1, 1: -1, 2: 0})
+    server.offers = _clicks(statuses)
+    stats = await reconciler.run_once(now=NOW + timedelta(hours=1))
+    assert (stats.applied, stats.unchanged) == (3, 7)
+    assert server.last_params["dateFrom"] == "2026-01-30 12:00:00"  # lookback from the stored cursor
+
+    again = await reconciler.run_once(now=NOW + timedelta(hours=2))
+    assert (again.applied, again.unchanged) == (0, 10)
+
+    async with session_factory() as session:
+        states = dict((await session.execute(select(Conversion.external_id, Conversion.status))).all())
+        assert states["conv-0"] == ConversionStatus.APPROVED and states["conv-2"] == ConversionStatus.HOLD
+        entries = (await session.execute(select(func.count(BalanceLedger.id)))).scalar_one()
+        assert entries == 10 + 3 + 1  # holds, their releases, one credit
+        snapshot = await BalanceService(session).snapshot(user_id)
+        assert (snapshot.available, snapshot.pending) == (100, sum(100 + index for index in range(3, 10)))
+        cursor = await session.get(SyncState, RECONCILE_CURSOR_KEY)
+        assert cursor.value == (NOW + timedelta(hours=2)).isoformat()
+    await client.close()
@@ -0,0 +1,27 @@
+import pytest
+
+
+def _offers(count: int) -> list[dict]:
+    return [{"uuid": f"offer-{index}", "name": f"Offer {index}"} for index in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_offer_pages_arrive_in_order_with_bounded_concurrency(mock_saleads):
+    server = mock_saleads(_offers(2500), latency=0.01)
+    client = server.client(page_size=100, page_concurrency=4)
+    pages = [page async for page in client.iter_offer_pages()]
+    await client.close()
+
+    assert [offer["uuid"] for page in pages for offer in page] == [f"offer-{index}" for index in range(2500)]
+    assert server.requests == 25
+    assert 1 < server.max_in_flight <= 4
+
+
+@pytest.mark.asyncio
+async def test_list_offers_reads_past_the_first_page(mock_saleads):
+    server = mock_saleads(_offers(250))
+    client = server.client(page_size=100)
+    assert len(await client.list_offers()) == 250
+    assert len(await client.list_offers()) == 250
+    assert server.requests == 3
+    await client.close()
@@ -0,0 +1,37 @@
+import shortuuid
+from pydantic import SecretStr
+
+from smart_cpa_bot.config import settings
+from smart_cpa_bot.models import Click
+from smart_cpa_bot.services.clicks import ClickService
+from smart_cpa_bot.services.tokens import SignedClick, is_signed_token, read_click_token, sign_click_token
+
+SECRET = "test-secret"
+
+
+def test_signed_token_round_trip_and_tampering():
+    url = "https://partner.example/go?click=42&sub=ä"
+    token = sign_click_token(42, url, SECRET)
+    assert is_signed_token(token)
+    assert read_click_token(token, SECRET) == SignedClick(click_id=42, target_url=url)
+
+    click_id, target, signature = token.split(".")
+    assert read_click_token(f"43.{target}.{signature}", SECRET) is None
+    assert read_click_token(f"{click_id}.{target}x.{signature}", SECRET) is None
+    assert read_click_token(token, "other-secret") is None
+    assert read_click_token("1.2", SECRET) is None
+
+
+def test_legacy_tokens_are_not_signed():
+    assert not is_signed_token(shortuuid.uuid())
+
+
+def test_tracking_link_is_signed_only_for_registered_clicks(monkeypatch):
+    monkeypatch.setattr(settings, "click_token_secret", SecretStr(SECRET))
+    service = ClickService(session=None, api_client=object())
+    registered = Click(id=5, token="legacy", saleads_click_id="sc-5", target_url="https://partner.example/5")
+    pending = Click(id=6, token="legacy6", target_url="https://example.com/6")
+
+    token = service.tracking_link(registered).rsplit("/", 1)[1]
+    assert read_click_token(token, SECRET) == SignedClick(click_id=5, target_url="https://partner.example/5")
+    assert service.tracking_link(pending).endswith("/r/legacy6")